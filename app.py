@@ -4,6 +4,8 @@ import aws_cdk as cdk
 
 from stacks.iam_stack import IAMStack
 from stacks.rds.rds import RDSStack
+from stacks.cache.cache_stack import CacheStack
+from stacks.analytics.snapshot_export_stack import SnapshotExportStack
 from stacks.infra.vpc_new import VPCStack
 from stacks.infra.jumpbox import JumboxStack
 from stacks.frontend.waf_admin_stack import WAFAdminStack
@@ -20,13 +22,14 @@ from stacks.infra.ssl_certificate_stack import SSLCertificateStack
 from stacks.ecs.ecs_cluster_stack import ECSCluster
 from stacks.ecs.api_svc_stack import ApiSvcStack
 from stacks.ecs.account_svc_stack import AccountSvcStack
-from stacks.sns_sqs.email_sns_sqs import EmailSNSSQS_Stack
-from stacks.sns_sqs.api_sns_sqs import APISNSSQS_Stack
-from stacks.sns_sqs.account_sns_sqs import AccountSNSSQS_Stack
-from stacks.sns_sqs.api_to_account_sns_subcription import APISUBS_Stack
-from stacks.sns_sqs.account_to_api_sns_subcription import AccountSUBS_Stack
+from stacks.sns_sqs.messaging_stack import (
+    ServiceMessagingStack,
+    MessagingSubscriptionsStack,
+)
+from stacks.sns_sqs.email_worker_stack import EmailWorkerStack
 from stacks.cloudtrail import CloudTrailStack
 from helper import config
+from helper import messaging_topology
 
 # CDK-NAG TESTING
 
@@ -225,66 +228,111 @@ account_service_stack = AccountSvcStack(
 #############################################################################
 
 
-email_snssqs_stack = EmailSNSSQS_Stack(
-    app,
-    "email-snssqs-stack",
-    env=cdk.Environment(
-        account=conf_app.get("account_id"), region=conf_app.get("region")
-    ),
-    cross_region_references=True,
-)
+messaging = messaging_topology.load_topology(conf_app)
+# unknown references, orphan queues and relay loops fail the synth
+messaging_warnings = messaging_topology.validate_topology(messaging)
+
+messaging_stacks = {}
+for service_name in messaging["services"]:
+    # keeps the stack names of the original api/account/email stacks
+    messaging_stacks[service_name] = ServiceMessagingStack(
+        app,
+        f"{service_name.removesuffix('-service')}-snssqs-stack",
+        service_name=service_name,
+        topology=messaging,
+        env=cdk.Environment(
+            account=conf_app.get("account_id"), region=conf_app.get("region")
+        ),
+        cross_region_references=True,
+    )
+
+# warnings name a topic or stream, shown on the stack of its service
+for warning in messaging_warnings:
+    owner = warning.partition(".")[0]
+    cdk.Annotations.of(messaging_stacks[owner]).add_warning(warning)
+
+topic_arns = {
+    ref: topic.topic_arn
+    for stack in messaging_stacks.values()
+    for ref, topic in stack.topics.items()
+}
+queue_arns = {
+    ref: queue.queue_arn
+    for stack in messaging_stacks.values()
+    for ref, queue in stack.queues.items()
+}
+messaging_subscription_stacks = {}
+for service_name in messaging["services"]:
+    if not messaging_topology.subscription_queues(messaging, service_name):
+        continue
+    # per publishing service, keeps the original api/account subs stacks
+    messaging_subscription_stacks[service_name] = MessagingSubscriptionsStack(
+        app,
+        f"{service_name.removesuffix('-service')}-subs-stack",
+        service_name=service_name,
+        topology=messaging,
+        topic_arns=topic_arns,
+        queue_arns=queue_arns,
+        env=cdk.Environment(
+            account=conf_app.get("account_id"), region=conf_app.get("region")
+        ),
+        cross_region_references=True,
+    )
+
+if conf_app.get("is_enabled_email_worker"):
+    email_messaging_stack = messaging_stacks[conf_app.get("email_service_name")]
+    email_worker_stack = EmailWorkerStack(
+        app,
+        "email-worker-stack",
+        topology=messaging,
+        queue=email_messaging_stack.sqs_event_queue,
+        low_priority_queue=email_messaging_stack.sqs_low_priority_queue,
+        idempotency_table=email_messaging_stack.idempotency_table,
+        env=cdk.Environment(
+            account=conf_app.get("account_id"), region=conf_app.get("region")
+        ),
+    )
 
-api_snssqs_stack = APISNSSQS_Stack(
-    app,
-    "api-snssqs-stack",
-    env=cdk.Environment(
-        account=conf_app.get("account_id"), region=conf_app.get("region")
-    ),
-    cross_region_references=True,
-)
-account_snssqs_stack = AccountSNSSQS_Stack(
-    app,
-    "account-snssqs-stack",
-    env=cdk.Environment(
-        account=conf_app.get("account_id"), region=conf_app.get("region")
-    ),
-    cross_region_references=True,
-)
-api_sns_subcriptions = APISUBS_Stack(
-    app,
-    "api-subs-stack",
-    api_topic_arn=api_snssqs_stack.sns_topic.topic_arn,
-    account_event_queue_arn=account_snssqs_stack.sqs_event_queue.queue_arn,
-    env=cdk.Environment(
-        account=conf_app.get("account_id"), region=conf_app.get("region")
-    ),
-    cross_region_references=True,
-)
-account_sns_subcriptions = AccountSUBS_Stack(
+############################################################################
+#          RDS POSTGRES CDK
+#
+#############################################################################
+rds_stack = RDSStack(
     app,
-    "account-subs-stack",
-    account_topic_arn=account_snssqs_stack.sns_topic.topic_arn,
-    api_event_queue_arn=api_snssqs_stack.sqs_event_queue.queue_arn,
+    "rds-stack",
+    vpc_stack.vpc,
+    jump_sec_group=jumpbox.jump_sec_group,
+    ecs_sec_group=alb_stack.private_security_group,
     env=cdk.Environment(
         account=conf_app.get("account_id"), region=conf_app.get("region")
     ),
-    cross_region_references=True,
 )
 
 ############################################################################
-#          RDS POSTGRES CDK
+#          CACHE (Redis/Valkey)
 #
 #############################################################################
-rds_stack = RDSStack(
+cache_stack = CacheStack(
     app,
-    "rds-stack",
+    "cache-stack",
     vpc_stack.vpc,
-    jump_sec_group=jumpbox.jump_sec_group,
+    private2_subnet_ids=vpc_stack.private2_subnet_ids,
+    ecs_sec_group=alb_stack.private_security_group,
     env=cdk.Environment(
         account=conf_app.get("account_id"), region=conf_app.get("region")
     ),
 )
 
+if conf_app.get("is_enabled_snapshot_export"):
+    snapshot_export_stack = SnapshotExportStack(
+        app,
+        "snapshot-export-stack",
+        env=cdk.Environment(
+            account=conf_app.get("account_id"), region=conf_app.get("region")
+        ),
+    )
+    snapshot_export_stack.add_dependency(rds_stack)
+
 # Aspects.of(app).add(AwsSolutionsChecks())
 # CHOOSE WHAT COMPLIANCE YOU WANT
 # Aspects.of(app).add(HIPAASecurityChecks())
@@ -0,0 +1,164 @@
+"""CloudFront settings shared by the distribution stacks."""
+from aws_cdk import Duration, aws_cloudfront as cloudfront
+
+
+def origin_settings(conf, origin_key) -> dict:
+    """Return the connection settings of one origin from `cloudfront_origins`."""
+    origin = conf.get("cloudfront_origins")[origin_key]
+    origin_shield_region = None
+    if origin.get("is_enabled_origin_shield", False):
+        origin_shield_region = conf.get("cloudfront_origin_shield_region")
+    return {
+        "origin_shield_region": origin_shield_region,
+        "connection_attempts": origin.get("connection_attempts", 3),
+        "connection_timeout": origin.get("connection_timeout", 10),
+        "keepalive_timeout": origin.get("keepalive_timeout", 5),
+        "read_timeout": origin.get("read_timeout", 30),
+    }
+
+
+def s3_origin_options(conf, origin_key) -> dict:
+    """Keyword arguments for origins.S3Origin.
+
+    Keep-alive and read timeouts only exist on custom origins, so an S3
+    origin only takes Origin Shield and the connection settings.
+    """
+    settings = origin_settings(conf, origin_key)
+    return {
+        "origin_shield_region": settings["origin_shield_region"],
+        "connection_attempts": settings["connection_attempts"],
+        "connection_timeout": Duration.seconds(settings["connection_timeout"]),
+    }
+
+
+def cfn_origin_shield(conf, origin_key):
+    """OriginShieldProperty for a CfnDistribution origin."""
+    settings = origin_settings(conf, origin_key)
+    if settings["origin_shield_region"] is None:
+        return cloudfront.CfnDistribution.OriginShieldProperty(enabled=False)
+    return cloudfront.CfnDistribution.OriginShieldProperty(
+        enabled=True, origin_shield_region=settings["origin_shield_region"]
+    )
+
+
+def protocol_profile(conf) -> dict:
+    """Return the viewer protocol profile shared by every distribution."""
+    profile = conf.get("cloudfront_protocol")
+    return {
+        "http_version": profile.get("http_version", "http2and3"),
+        "ipv6_enabled": profile.get("is_enabled_ipv6", True),
+        "minimum_protocol_version": profile.get(
+            "minimum_protocol_version", "TLSv1.2_2021"
+        ),
+    }
+
+
+HTTP_VERSIONS = {
+    "http1.1": cloudfront.HttpVersion.HTTP1_1,
+    "http2": cloudfront.HttpVersion.HTTP2,
+    "http3": cloudfront.HttpVersion.HTTP3,
+    "http2and3": cloudfront.HttpVersion.HTTP2_AND_3,
+}
+
+SECURITY_POLICIES = {
+    "TLSv1.2_2018": cloudfront.SecurityPolicyProtocol.TLS_V1_2_2018,
+    "TLSv1.2_2019": cloudfront.SecurityPolicyProtocol.TLS_V1_2_2019,
+    "TLSv1.2_2021": cloudfront.SecurityPolicyProtocol.TLS_V1_2_2021,
+}
+
+
+def distribution_protocol_options(conf) -> dict:
+    """Keyword arguments for cloudfront.Distribution from the protocol profile."""
+    profile = protocol_profile(conf)
+    return {
+        "http_version": HTTP_VERSIONS[profile["http_version"]],
+        "enable_ipv6": profile["ipv6_enabled"],
+        "minimum_protocol_version": SECURITY_POLICIES[
+            profile["minimum_protocol_version"]
+        ],
+    }
+
+
+def alias_record_types(conf) -> list:
+    """Route53 alias record types to create for a distribution."""
+    if protocol_profile(conf)["ipv6_enabled"]:
+        return ["A", "AAAA"]
+    return ["A"]
+
+
+# Rewrites extensionless deep links (e.g. /users/42) to the SPA entry point
+# at the edge, so S3 never answers them with a 403/404.
+SPA_REWRITE_FUNCTION = """
+function handler(event) {
+    var request = event.request;
+    var uri = request.uri;
+    if (uri.endsWith('/') || uri.lastIndexOf('.') < uri.lastIndexOf('/')) {
+        request.uri = '/index.html';
+    }
+    return request;
+}
+"""
+
+
+def site_cache_settings(conf) -> dict:
+    """Return the web site caching settings from `cloudfront_site_cache`."""
+    site_cache = conf.get("cloudfront_site_cache")
+    return {
+        "hashed_asset_paths": site_cache.get("hashed_asset_paths", []),
+        "asset_ttl": site_cache.get("asset_ttl", 31536000),
+        "html_default_ttl": site_cache.get("html_default_ttl", 60),
+        "html_max_ttl": site_cache.get("html_max_ttl", 300),
+        "spa_routing_enabled": site_cache.get("is_enabled_spa_routing", True),
+    }
+
+
+def asset_cache_policy(scope, conf):
+    """Long-lived cache policy for content-hashed assets."""
+    settings = site_cache_settings(conf)
+    return cloudfront.CachePolicy(
+        scope,
+        "hashed-asset-cache-policy",
+        comment="Content-hashed assets, cached until evicted",
+        default_ttl=Duration.seconds(settings["asset_ttl"]),
+        min_ttl=Duration.seconds(settings["asset_ttl"]),
+        max_ttl=Duration.seconds(settings["asset_ttl"]),
+        enable_accept_encoding_gzip=True,
+        enable_accept_encoding_brotli=True,
+    )
+
+
+def html_cache_policy(scope, conf):
+    """Short-lived cache policy for index.html and other unhashed documents.
+
+    The minimum TTL is zero so a no-cache/s-maxage header set on the object
+    at upload time wins over the defaults below.
+    """
+    settings = site_cache_settings(conf)
+    return cloudfront.CachePolicy(
+        scope,
+        "html-cache-policy",
+        comment="Unhashed documents, revalidated shortly after a release",
+        default_ttl=Duration.seconds(settings["html_default_ttl"]),
+        min_ttl=Duration.seconds(0),
+        max_ttl=Duration.seconds(settings["html_max_ttl"]),
+        enable_accept_encoding_gzip=True,
+        enable_accept_encoding_brotli=True,
+    )
+
+
+def spa_function_associations(scope, conf) -> list:
+    """Viewer-request association rewriting SPA deep links to index.html."""
+    if not site_cache_settings(conf)["spa_routing_enabled"]:
+        return []
+    spa_rewrite_function = cloudfront.Function(
+        scope,
+        "spa-rewrite-function",
+        code=cloudfront.FunctionCode.from_inline(SPA_REWRITE_FUNCTION),
+        comment="Rewrite SPA deep links to /index.html",
+    )
+    return [
+        cloudfront.FunctionAssociation(
+            function=spa_rewrite_function,
+            event_type=cloudfront.FunctionEventType.VIEWER_REQUEST,
+        )
+    ]
@@ -0,0 +1,358 @@
+"""SNS, SQS, Kinesis and schema settings shared by the messaging stacks."""
+import math
+
+from aws_cdk import (
+    Duration,
+    aws_kinesis as kinesis,
+    aws_sqs as sqs,
+    aws_sns_subscriptions as subs,
+)
+
+from helper import messaging_topology
+
+MAX_MESSAGE_SIZE_BYTES = 262144
+FIFO_SUFFIX = ".fifo"
+FILTER_POLICY_SCOPES = ["MessageAttributes", "MessageBody"]
+# SNS caps the value combinations of a filter policy
+MAX_FILTER_COMBINATIONS = 150
+STREAM_MODES = ["ON_DEMAND", "PROVISIONED"]
+# hours Kinesis retains records, one day to one year
+MIN_STREAM_RETENTION, MAX_STREAM_RETENTION = 24, 8760
+SECONDS_PER_DAY = 86400
+# item attribute DynamoDB expires idempotency records on, epoch seconds
+IDEMPOTENCY_TTL_ATTRIBUTE = "expires_at"
+# Glue Schema Registry formats, by the extension of their definition files
+SCHEMA_EXTENSIONS = {"AVRO": ".avsc", "PROTOBUF": ".proto", "JSON": ".json"}
+SCHEMA_COMPATIBILITIES = [
+    "NONE",
+    "DISABLED",
+    "BACKWARD",
+    "BACKWARD_ALL",
+    "FORWARD",
+    "FORWARD_ALL",
+    "FULL",
+    "FULL_ALL",
+]
+# characters Glue allows in a schema definition
+MAX_SCHEMA_DEFINITION_LENGTH = 170000
+
+
+def queue_settings(conf, service_name, overrides=None) -> dict:
+    """Return the queue settings of a service, `sqs_queues` defaults overridden.
+
+    `overrides` come from a single queue in the messaging topology and win
+    over the service's settings.
+    """
+    queues = conf.get("sqs_queues")
+    settings = dict(queues["defaults"])
+    settings.update(queues.get(service_name) or {})
+    settings.update(overrides or {})
+    # a redriven message keeps its original enqueue time, so the DLQ must
+    # retain messages longer than the source queue or they expire on arrival
+    if settings["dlq_retention_period"] <= settings["retention_period"]:
+        raise ValueError(
+            f"{service_name}: dlq_retention_period must exceed retention_period"
+        )
+    return settings
+
+
+def _common_options(settings) -> dict:
+    return {
+        "max_message_size_bytes": MAX_MESSAGE_SIZE_BYTES,
+        # long polling, receives wait for messages instead of returning empty
+        "receive_message_wait_time": Duration.seconds(
+            settings["receive_message_wait_time"]
+        ),
+        "visibility_timeout": Duration.seconds(settings["visibility_timeout"]),
+        "encryption": sqs.QueueEncryption.KMS_MANAGED,
+        # one KMS data key serves many messages for this long
+        "data_key_reuse": Duration.seconds(settings["data_key_reuse"]),
+    }
+
+
+def dlq_options(settings) -> dict:
+    """Keyword arguments for a dead-letter sqs.Queue."""
+    return {
+        **_common_options(settings),
+        "retention_period": Duration.seconds(settings["dlq_retention_period"]),
+    }
+
+
+def event_queue_options(settings, dead_letter_queue) -> dict:
+    """Keyword arguments for an event sqs.Queue redriving to `dead_letter_queue`."""
+    return {
+        **_common_options(settings),
+        "delivery_delay": Duration.seconds(0),
+        "retention_period": Duration.seconds(settings["retention_period"]),
+        "dead_letter_queue": sqs.DeadLetterQueue(
+            max_receive_count=settings["max_receive_count"], queue=dead_letter_queue
+        ),
+    }
+
+
+def fifo_name(name, fifo) -> str:
+    """SNS and SQS require the `.fifo` suffix on FIFO names."""
+    return f"{name}{FIFO_SUFFIX}" if fifo else name
+
+
+def topic_fifo_options(fifo) -> dict:
+    """Keyword arguments making an sns.Topic FIFO, empty for a standard topic."""
+    if not fifo:
+        return {}
+    return {
+        "fifo": True,
+        "content_based_deduplication": fifo["content_based_deduplication"],
+    }
+
+
+def queue_fifo_options(fifo, is_dead_letter_queue=False) -> dict:
+    """Keyword arguments making an sqs.Queue FIFO, empty for a standard queue.
+
+    The DLQ of a FIFO queue must be FIFO too, it only needs the ordering.
+    """
+    if not fifo:
+        return {}
+    options = {
+        "fifo": True,
+        "content_based_deduplication": fifo["content_based_deduplication"],
+    }
+    if fifo["is_enabled_high_throughput"] and not is_dead_letter_queue:
+        options["deduplication_scope"] = sqs.DeduplicationScope.MESSAGE_GROUP
+        options["fifo_throughput_limit"] = sqs.FifoThroughputLimit.PER_MESSAGE_GROUP_ID
+    return options
+
+
+def payload_threshold(conf) -> int:
+    """Body size above which producers offload to the payload bucket."""
+    threshold = conf.get("payload_offload")["threshold_bytes"]
+    # the pointer and message attributes must still fit in the message
+    if not 0 < threshold < MAX_MESSAGE_SIZE_BYTES:
+        raise ValueError(
+            f"payload_offload threshold_bytes must be below {MAX_MESSAGE_SIZE_BYTES}"
+        )
+    return threshold
+
+
+def payload_expiration_days(queue_settings_list) -> int:
+    """Days a payload is kept: until the last queue could still deliver it.
+
+    A pointer can wait in a queue and then in its DLQ, whose retention
+    counts from the original enqueue time, so the longest DLQ retention
+    bounds it.
+    """
+    if not queue_settings_list:
+        return 1
+    longest = max(settings["dlq_retention_period"] for settings in queue_settings_list)
+    return math.ceil(longest / SECONDS_PER_DAY)
+
+
+def email_worker_settings(
+    conf, queue_settings, low_priority_queue_settings=None
+) -> dict:
+    """Return the `email_worker` settings, checked against its queues' settings.
+
+    `total_concurrency` adds the low priority lane's pollers, when it has one.
+    """
+    settings = dict(conf.get("email_worker"))
+    settings["total_concurrency"] = settings["maximum_concurrency"]
+    if low_priority_queue_settings:
+        if not 2 <= settings["low_priority_maximum_concurrency"] <= 1000:
+            raise ValueError(
+                "email_worker: low_priority_maximum_concurrency must be 2-1000"
+            )
+        settings["total_concurrency"] += settings["low_priority_maximum_concurrency"]
+    if not 1 <= settings["batch_size"] <= 10000:
+        raise ValueError("email_worker: batch_size must be 1-10000")
+    # SQS event sources only take more than 10 messages with a batching window
+    if settings["batch_size"] > 10 and settings["max_batching_window"] < 1:
+        raise ValueError("email_worker: a batch_size over 10 needs max_batching_window")
+    if not 0 <= settings["max_batching_window"] <= 300:
+        raise ValueError("email_worker: max_batching_window must be 0-300 seconds")
+    if not 2 <= settings["maximum_concurrency"] <= 1000:
+        raise ValueError("email_worker: maximum_concurrency must be 2-1000")
+    # fewer reserved executions than pollers would throttle invocations and
+    # count the throttled batches as receives
+    if settings["reserved_concurrency"] < settings["total_concurrency"]:
+        raise ValueError(
+            "email_worker: reserved_concurrency must be at least the maximum "
+            "concurrency of its lanes"
+        )
+    # a batch still running when its messages become visible is sent twice
+    for lane_settings in [queue_settings, low_priority_queue_settings]:
+        if lane_settings and settings["timeout"] > lane_settings["visibility_timeout"]:
+            raise ValueError(
+                "email_worker: timeout must not exceed the queue visibility_timeout"
+            )
+    return settings
+
+
+def idempotency_ttl_seconds(queue_settings_list) -> int:
+    """Seconds a processed message id must be kept to catch redeliveries.
+
+    A message can come back until its DLQ retention has passed, counted from
+    the first enqueue, when it is redriven.
+    """
+    return max(settings["dlq_retention_period"] for settings in queue_settings_list)
+
+
+def schema_settings(conf, service_name, key, overrides=None) -> dict:
+    """Return a topic's schema settings, `schema_registry` defaults overridden.
+
+    The definition file defaults to `<definitions_path>/<service>/<key>` with
+    the extension of the data format, e.g. `schemas/api-service/event.avsc`.
+    """
+    registry = conf.get("schema_registry")
+    settings = {
+        "data_format": registry["data_format"],
+        "compatibility": registry["compatibility"],
+    }
+    settings.update(overrides or {})
+    if settings["data_format"] not in SCHEMA_EXTENSIONS:
+        raise ValueError(
+            f"{service_name}.{key}: data_format must be one of "
+            f"{list(SCHEMA_EXTENSIONS)}"
+        )
+    if settings["compatibility"] not in SCHEMA_COMPATIBILITIES:
+        raise ValueError(
+            f"{service_name}.{key}: compatibility must be one of "
+            f"{SCHEMA_COMPATIBILITIES}"
+        )
+    settings.setdefault(
+        "definition",
+        f"{registry['definitions_path']}/{service_name}/{key}"
+        f"{SCHEMA_EXTENSIONS[settings['data_format']]}",
+    )
+    return settings
+
+
+def schema_definition(settings) -> str:
+    """The definition file of a schema, its first version in the registry."""
+    with open(settings["definition"], encoding="utf-8") as definition_file:
+        definition = definition_file.read()
+    if len(definition) > MAX_SCHEMA_DEFINITION_LENGTH:
+        raise ValueError(
+            f"{settings['definition']}: over {MAX_SCHEMA_DEFINITION_LENGTH} characters"
+        )
+    return definition
+
+
+def stream_settings(conf, service_name, overrides=None) -> dict:
+    """Return a service's stream settings, `kinesis_streams` defaults overridden."""
+    streams = conf.get("kinesis_streams")
+    settings = dict(streams["defaults"])
+    settings.update(streams.get(service_name) or {})
+    settings.update(overrides or {})
+    if settings["stream_mode"] not in STREAM_MODES:
+        raise ValueError(f"{service_name}: stream_mode must be one of {STREAM_MODES}")
+    if not MIN_STREAM_RETENTION <= settings["retention_period"] <= MAX_STREAM_RETENTION:
+        raise ValueError(
+            f"{service_name}: retention_period must be {MIN_STREAM_RETENTION}-"
+            f"{MAX_STREAM_RETENTION} hours"
+        )
+    if settings["stream_mode"] == "PROVISIONED" and settings["shard_count"] < 1:
+        raise ValueError(f"{service_name}: a provisioned stream needs a shard")
+    return settings
+
+
+def stream_options(settings) -> dict:
+    """Keyword arguments for a kinesis.Stream."""
+    options = {
+        "stream_mode": kinesis.StreamMode[settings["stream_mode"]],
+        "retention_period": Duration.hours(settings["retention_period"]),
+        "encryption": kinesis.StreamEncryption.MANAGED,
+    }
+    # on-demand streams scale their own shards
+    if settings["stream_mode"] == "PROVISIONED":
+        options["shard_count"] = settings["shard_count"]
+    return options
+
+
+def subscription_settings(
+    conf, topic_service, subscriber, overrides=None, lane=None
+) -> dict:
+    """Return how `subscriber` takes the events of `topic_service`.
+
+    Settings live in `sns_subscriptions` under the topic's service and then
+    the subscribing service; a missing entry is a plain enveloped delivery.
+    `overrides` come from a single subscription in the messaging topology,
+    and a priority `lane` adds its condition to the filter policy.
+    """
+    subscriptions = conf.get("sns_subscriptions") or {}
+    settings = dict((subscriptions.get(topic_service) or {}).get(subscriber) or {})
+    settings.update(overrides or {})
+    unknown = sorted(set(settings) - set(messaging_topology.SUBSCRIPTION_KEYS))
+    if unknown:
+        raise ValueError(
+            f"{topic_service} -> {subscriber}: unknown subscription settings "
+            f"{unknown}, expected {messaging_topology.SUBSCRIPTION_KEYS}"
+        )
+    filter_policy = settings.get("filter_policy") or None
+    scope = settings.get("filter_policy_scope", "MessageAttributes")
+    if scope not in FILTER_POLICY_SCOPES:
+        raise ValueError(
+            f"{topic_service} -> {subscriber}: filter_policy_scope must be one of "
+            f"{FILTER_POLICY_SCOPES}"
+        )
+    if lane:
+        if scope != "MessageAttributes":
+            raise ValueError(
+                f"{topic_service} -> {subscriber}: priority lanes filter on "
+                "MessageAttributes"
+            )
+        filter_policy = lane_filter_policy(conf, filter_policy, lane)
+    if filter_policy and _filter_combinations(filter_policy) > MAX_FILTER_COMBINATIONS:
+        raise ValueError(
+            f"{topic_service} -> {subscriber}: filter_policy has more than "
+            f"{MAX_FILTER_COMBINATIONS} value combinations"
+        )
+    return {
+        "raw_message_delivery": settings.get("is_enabled_raw_message_delivery", False),
+        "filter_policy": filter_policy,
+        "filter_policy_scope": scope,
+    }
+
+
+def lane_filter_policy(conf, filter_policy, lane) -> dict:
+    """Add the priority lane condition to a subscription filter policy.
+
+    The low lane takes messages whose priority attribute is the low value.
+    The high lane takes every other message, also those without the
+    attribute, so producers only tag bulk traffic.
+    """
+    priority_lanes = conf.get("priority_lanes")
+    attribute = priority_lanes["attribute"]
+    low_value = priority_lanes["low_value"]
+    filter_policy = dict(filter_policy or {})
+    if attribute in filter_policy:
+        raise ValueError(f"filter_policy already filters on {attribute}")
+    if lane == "low":
+        filter_policy[attribute] = [low_value]
+    else:
+        filter_policy[attribute] = [{"exists": False}, {"anything-but": [low_value]}]
+    return filter_policy
+
+
+def _filter_combinations(policy) -> int:
+    return math.prod(
+        _filter_combinations(value) if isinstance(value, dict) else len(value)
+        for value in policy.values()
+    )
+
+
+def subscribe_queue(topic, queue, settings):
+    """Subscribe an SQS queue to a topic with its subscription settings."""
+    subscription = topic.add_subscription(
+        subs.SqsSubscription(
+            queue, raw_message_delivery=settings["raw_message_delivery"]
+        )
+    )
+    if settings["filter_policy"]:
+        # policies are kept as plain JSON so config can use any SNS operator
+        cfn_subscription = subscription.node.default_child
+        cfn_subscription.add_property_override(
+            "FilterPolicy", settings["filter_policy"]
+        )
+        cfn_subscription.add_property_override(
+            "FilterPolicyScope", settings["filter_policy_scope"]
+        )
+    return subscription
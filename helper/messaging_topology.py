@@ -0,0 +1,374 @@
+"""Parse and validate the `messaging` topology of topics, queues and subscriptions.
+
+Each service lists, by key, the `topics` it publishes, the Kinesis `streams`
+read by its `consumers`, and the `queues` it consumes. A queue subscribes
+to topics as `<service>.<topic key>`, or is `is_direct`. Its `relays_to`
+documents the topics its consumer republishes to; it only feeds the loop
+check and provisions nothing. Per-entry options: `fifo` and `schema` on
+topics; `fifo`, `is_enabled_priority_lanes` (adds a `<key>-low` queue) and
+`is_enabled_idempotency_table` on queues; `is_enabled_payload_offload` on a
+service. Names follow the `<project>-<service>-<key>` convention of the
+original event stacks; the README covers what each option provisions, and
+other option names fail validation.
+"""
+
+# the key of the original per-service topic and queue, kept on their SSM names
+DEFAULT_KEY = "event"
+# key suffix of the low priority lane of a queue
+LOW_PRIORITY_SUFFIX = "-low"
+# enhanced fan-out consumers Kinesis allows per stream
+MAX_STREAM_CONSUMERS = 20
+# settings of an `sns_subscriptions` entry or a topology subscription
+SUBSCRIPTION_KEYS = [
+    "is_enabled_raw_message_delivery",
+    "filter_policy_scope",
+    "filter_policy",
+]
+# option names of each kind of topology entry, others fail validation
+OPTION_KEYS = {
+    "service": ["is_enabled_payload_offload", "topics", "streams", "queues"],
+    "topic": ["fifo", "schema"],
+    "queue": [
+        "subscribes_to",
+        "is_direct",
+        "relays_to",
+        "fifo",
+        "is_enabled_priority_lanes",
+        "is_enabled_idempotency_table",
+        "settings",
+        "low_priority_settings",
+    ],
+    "stream": ["consumers", "settings"],
+    "subscription": ["topic", *SUBSCRIPTION_KEYS],
+    "fifo": [
+        "message_group_id",
+        "content_based_deduplication",
+        "is_enabled_high_throughput",
+    ],
+    "schema": ["data_format", "compatibility", "definition"],
+}
+
+
+def topic_ref(service_name, key) -> str:
+    return f"{service_name}.{key}"
+
+
+def _split_ref(ref, owner):
+    service_name, _, key = ref.partition(".")
+    if not key:
+        raise ValueError(f"{owner}: {ref} must be <service>.<topic key>")
+    return service_name, key
+
+
+def _fifo(entry):
+    fifo = entry.get("fifo")
+    # `fifo: {}` opts in with the defaults
+    if fifo is None or fifo is False:
+        return None
+    return {
+        "message_group_id": fifo.get("message_group_id"),
+        "content_based_deduplication": fifo.get("content_based_deduplication", True),
+        # deduplication and throughput limits per message group, not per queue
+        "is_enabled_high_throughput": fifo.get("is_enabled_high_throughput", True),
+    }
+
+
+def _schema(entry):
+    schema = entry.get("schema")
+    # `schema: {}` opts in with the `schema_registry` defaults
+    if schema is None or schema is False:
+        return None
+    return dict(schema)
+
+
+def load_topology(conf) -> dict:
+    """Normalized topology: services, topics and queues by reference."""
+    topology = {
+        "services": [],
+        "payload_offload": [],
+        "topics": {},
+        "queues": {},
+        "streams": {},
+        # (kind, owner, configured option names), checked by validate_topology
+        "options": [],
+    }
+
+    def options(kind, owner, entry):
+        if isinstance(entry, dict):
+            topology["options"].append((kind, owner, list(entry)))
+
+    for service_name, service in (conf.get("messaging") or {}).items():
+        service = service or {}
+        options("service", service_name, service)
+        topology["services"].append(service_name)
+        if service.get("is_enabled_payload_offload", False):
+            topology["payload_offload"].append(service_name)
+        for key, topic in (service.get("topics") or {}).items():
+            topic = topic or {}
+            options("topic", topic_ref(service_name, key), topic)
+            options("fifo", topic_ref(service_name, key), topic.get("fifo"))
+            options("schema", topic_ref(service_name, key), topic.get("schema"))
+            topology["topics"][topic_ref(service_name, key)] = {
+                **topic,
+                "service": service_name,
+                "key": key,
+                "fifo": _fifo(topic),
+                "schema": _schema(topic),
+            }
+        for key, queue in (service.get("queues") or {}).items():
+            queue = queue or {}
+            options("queue", topic_ref(service_name, key), queue)
+            options("fifo", topic_ref(service_name, key), queue.get("fifo"))
+            subscriptions = []
+            for entry in queue.get("subscribes_to") or []:
+                # a plain reference, or a mapping with per-subscription settings
+                if isinstance(entry, str):
+                    entry = {"topic": entry}
+                options("subscription", topic_ref(service_name, key), entry)
+                subscriptions.append(dict(entry))
+            settings = queue.get("settings") or {}
+            lanes = [(key, None, settings)]
+            if queue.get("is_enabled_priority_lanes", False):
+                lanes = [
+                    (key, "high", settings),
+                    (
+                        f"{key}{LOW_PRIORITY_SUFFIX}",
+                        "low",
+                        {**settings, **(queue.get("low_priority_settings") or {})},
+                    ),
+                ]
+            for lane_key, lane, lane_settings in lanes:
+                topology["queues"][topic_ref(service_name, lane_key)] = {
+                    "service": service_name,
+                    "key": lane_key,
+                    "lane": lane,
+                    # the configured key, shared by both priority lanes
+                    "base_key": key,
+                    "is_direct": queue.get("is_direct", False),
+                    "is_enabled_idempotency_table": queue.get(
+                        "is_enabled_idempotency_table", False
+                    ),
+                    "subscriptions": [dict(entry) for entry in subscriptions],
+                    "relays_to": list(queue.get("relays_to") or []),
+                    "settings": lane_settings,
+                    "fifo": _fifo(queue),
+                }
+        for key, stream in (service.get("streams") or {}).items():
+            stream = stream or {}
+            options("stream", topic_ref(service_name, key), stream)
+            topology["streams"][topic_ref(service_name, key)] = {
+                "service": service_name,
+                "key": key,
+                "consumers": list(stream.get("consumers") or []),
+                "settings": stream.get("settings") or {},
+            }
+    return topology
+
+
+def validate_topology(topology) -> list:
+    """Raise ValueError for a broken topology, return warnings for odd ones."""
+    topics, queues = topology["topics"], topology["queues"]
+    warnings = []
+
+    for kind, owner, keys in topology["options"]:
+        unknown = sorted(set(keys) - set(OPTION_KEYS[kind]))
+        if unknown:
+            raise ValueError(
+                f"{owner}: unknown {kind} options {unknown}, "
+                f"expected {OPTION_KEYS[kind]}"
+            )
+
+    for queue_ref, queue in queues.items():
+        for subscription in queue["subscriptions"]:
+            _split_ref(subscription["topic"], queue_ref)
+            if subscription["topic"] not in topics:
+                raise ValueError(
+                    f"{queue_ref} subscribes to unknown topic {subscription['topic']}"
+                )
+        for relay in queue["relays_to"]:
+            _split_ref(relay, queue_ref)
+            if relay not in topics:
+                raise ValueError(f"{queue_ref} relays to unknown topic {relay}")
+        if not queue["subscriptions"] and not queue["is_direct"]:
+            raise ValueError(
+                f"{queue_ref} is an orphan queue: it subscribes to no topic and "
+                "is not marked is_direct"
+            )
+        subscribed = [subscription["topic"] for subscription in queue["subscriptions"]]
+        if len(set(subscribed)) != len(subscribed):
+            raise ValueError(f"{queue_ref} subscribes to the same topic twice")
+
+    for ref, topic in topics.items():
+        if topic["fifo"] and not topic["fifo"]["message_group_id"]:
+            raise ValueError(f"{ref}: a fifo topic needs a message_group_id")
+    for queue_ref, queue in queues.items():
+        if not queue["fifo"]:
+            continue
+        # SNS only delivers to a FIFO queue from a FIFO topic
+        for subscription in queue["subscriptions"]:
+            if not topics[subscription["topic"]]["fifo"]:
+                raise ValueError(
+                    f"{queue_ref} is fifo but {subscription['topic']} is not"
+                )
+        if queue["is_direct"] and not queue["fifo"]["message_group_id"]:
+            raise ValueError(
+                f"{queue_ref}: a direct fifo queue needs a message_group_id"
+            )
+
+    for ref, stream in topology["streams"].items():
+        for consumer in stream["consumers"]:
+            if consumer not in topology["services"]:
+                raise ValueError(f"{ref} is consumed by unknown service {consumer}")
+        if len(set(stream["consumers"])) != len(stream["consumers"]):
+            raise ValueError(f"{ref} lists a consumer twice")
+        if len(stream["consumers"]) > MAX_STREAM_CONSUMERS:
+            raise ValueError(
+                f"{ref} has more than {MAX_STREAM_CONSUMERS} fan-out consumers"
+            )
+        if not stream["consumers"]:
+            warnings.append(f"{ref} has no consumer")
+
+    subscribed_topics = {
+        subscription["topic"]
+        for queue in queues.values()
+        for subscription in queue["subscriptions"]
+    }
+    for ref in topics:
+        if ref not in subscribed_topics:
+            warnings.append(f"{ref} has no queue subscribed")
+
+    cycle = find_relay_cycle(topology)
+    if cycle:
+        raise ValueError(
+            "messages would loop through relaying queues: " + " -> ".join(cycle)
+        )
+    return warnings
+
+
+def find_relay_cycle(topology):
+    """Topic refs of a loop through topic -> queue -> relay -> topic, or None."""
+    edges = {topic: [] for topic in topology["topics"]}
+    for queue_ref, queue in topology["queues"].items():
+        for subscription in queue["subscriptions"]:
+            edges.setdefault(subscription["topic"], []).extend(
+                (queue_ref, relay) for relay in queue["relays_to"]
+            )
+
+    visiting, done = [], set()
+
+    def visit(topic):
+        if topic in done:
+            return None
+        if topic in visiting:
+            return visiting[visiting.index(topic) :] + [topic]
+        visiting.append(topic)
+        for _, relay in edges.get(topic, []):
+            cycle = visit(relay)
+            if cycle:
+                return cycle
+        visiting.pop()
+        done.add(topic)
+        return None
+
+    for topic in sorted(edges):
+        cycle = visit(topic)
+        if cycle:
+            return cycle
+    return None
+
+
+def service_topics(topology, service_name) -> dict:
+    return {
+        ref: topic
+        for ref, topic in topology["topics"].items()
+        if topic["service"] == service_name
+    }
+
+
+def service_queues(topology, service_name) -> dict:
+    return {
+        ref: queue
+        for ref, queue in topology["queues"].items()
+        if queue["service"] == service_name
+    }
+
+
+def subscription_owner(topology, queue):
+    """Publishing service whose subscriptions stack holds the queue's subscriptions.
+
+    The publisher of its first topic: a queue has a single policy, so all of
+    its subscriptions live in one stack, even across publishers.
+    """
+    return topology["topics"][queue["subscriptions"][0]["topic"]]["service"]
+
+
+def subscription_queues(topology, service_name) -> dict:
+    return {
+        ref: queue
+        for ref, queue in topology["queues"].items()
+        if queue["subscriptions"]
+        and subscription_owner(topology, queue) == service_name
+    }
+
+
+def payload_queues(topology, service_name) -> dict:
+    """Queues that may receive pointers into the service's payload bucket.
+
+    Those subscribed to its topics, and its direct queues, which other
+    services send to.
+    """
+    return {
+        ref: queue
+        for ref, queue in topology["queues"].items()
+        if any(
+            topology["topics"][subscription["topic"]]["service"] == service_name
+            for subscription in queue["subscriptions"]
+        )
+        or (queue["is_direct"] and queue["service"] == service_name)
+    }
+
+
+def service_streams(topology, service_name) -> dict:
+    return {
+        ref: stream
+        for ref, stream in topology["streams"].items()
+        if stream["service"] == service_name
+    }
+
+
+def parameter_suffix(kind, key) -> str:
+    """SSM name suffix; the default key keeps the original parameter names."""
+    if key == DEFAULT_KEY:
+        return {
+            "topic": "AWS_SNS_EVENT_TOPIC_ARN",
+            "topic_message_group": "AWS_SNS_EVENT_MESSAGE_GROUP_ID",
+            "queue": "AWS_SQS_QUEUE_URL",
+            "queue_message_group": "AWS_SQS_MESSAGE_GROUP_ID",
+            "dlq": "AWS_SQS_DLQ_URL",
+            "age_alarm": "AWS_CLOUDWATCH_AGE_ALARM_ARN",
+            "age_alarm_name": "AWS_CLOUDWATCH_AGE_ALARM_NAME",
+            "idempotency_table": "AWS_DYNAMODB_IDEMPOTENCY_TABLE",
+            "idempotency_ttl": "AWS_DYNAMODB_IDEMPOTENCY_TTL_SECONDS",
+            "stream": "AWS_KINESIS_EVENT_STREAM_ARN",
+            "schema": "AWS_GLUE_EVENT_SCHEMA_ARN",
+        }[kind]
+    name = key.upper().replace("-", "_")
+    return {
+        "topic": f"AWS_SNS_{name}_TOPIC_ARN",
+        "topic_message_group": f"AWS_SNS_{name}_MESSAGE_GROUP_ID",
+        "queue": f"AWS_SQS_{name}_QUEUE_URL",
+        "queue_message_group": f"AWS_SQS_{name}_MESSAGE_GROUP_ID",
+        "dlq": f"AWS_SQS_{name}_DLQ_URL",
+        "age_alarm": f"AWS_CLOUDWATCH_{name}_AGE_ALARM_ARN",
+        "age_alarm_name": f"AWS_CLOUDWATCH_{name}_AGE_ALARM_NAME",
+        "idempotency_table": f"AWS_DYNAMODB_{name}_IDEMPOTENCY_TABLE",
+        "idempotency_ttl": f"AWS_DYNAMODB_{name}_IDEMPOTENCY_TTL_SECONDS",
+        "stream": f"AWS_KINESIS_{name}_STREAM_ARN",
+        "schema": f"AWS_GLUE_{name}_SCHEMA_ARN",
+    }[kind]
+
+
+def consumer_parameter_suffix(service_name, key) -> str:
+    """SSM name suffix, under the consumer, of its fan-out consumer ARN."""
+    name = topic_ref(service_name, key).upper().replace("-", "_").replace(".", "_")
+    return f"AWS_KINESIS_{name}_CONSUMER_ARN"
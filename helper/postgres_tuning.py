@@ -0,0 +1,131 @@
+"""Derive tuned postgres15 parameter group values from an RDS instance class."""
+
+# memory (GiB) and vCPU of the burstable classes
+BURSTABLE_CLASSES = {
+    "micro": (1, 2),
+    "small": (2, 2),
+    "medium": (4, 2),
+    "large": (8, 2),
+    "xlarge": (16, 4),
+    "2xlarge": (32, 8),
+}
+# memory (GiB) per vCPU of the fixed performance families
+FAMILY_MEMORY_PER_VCPU = {
+    "m5": 4,
+    "m6g": 4,
+    "m6i": 4,
+    "m7g": 4,
+    "r5": 8,
+    "r6g": 8,
+    "r6i": 8,
+    "r7g": 8,
+}
+SIZE_VCPUS = {
+    "large": 2,
+    "xlarge": 4,
+    "2xlarge": 8,
+    "4xlarge": 16,
+    "8xlarge": 32,
+    "12xlarge": 48,
+    "16xlarge": 64,
+}
+WORKLOADS = ["oltp", "mixed"]
+
+
+def instance_resources(instance_class) -> tuple:
+    """Memory in GiB and vCPU count of a db.* instance class."""
+    try:
+        _, family, size = instance_class.split(".")
+        if family in ("t3", "t4g"):
+            return BURSTABLE_CLASSES[size]
+        vcpus = SIZE_VCPUS[size]
+        return vcpus * FAMILY_MEMORY_PER_VCPU[family], vcpus
+    except (ValueError, KeyError):
+        raise ValueError(f"Unknown RDS instance class {instance_class}") from None
+
+
+def tuned_parameters(
+    instance_class,
+    workload="oltp",
+    auto_explain_min_duration=1000,
+    log_min_duration_statement=-1,
+    overrides=None,
+) -> dict:
+    """Parameter group values for postgres15, in the units RDS expects.
+
+    OLTP favours many short connections with small sorts; mixed trades
+    connections for larger work_mem and more parallelism. Overrides are
+    applied last and win over the derived values.
+    """
+    if workload not in WORKLOADS:
+        raise ValueError(f"Unknown workload {workload}, expected one of {WORKLOADS}")
+    memory_gib, vcpus = instance_resources(instance_class)
+    memory_kb = memory_gib * 1024 * 1024
+    oltp = workload == "oltp"
+
+    shared_buffers_kb = memory_kb // 4
+    max_connections = min(5000, max(50, memory_kb // (10240 if oltp else 20480)))
+    work_mem_kb = (memory_kb - shared_buffers_kb) // (
+        max_connections * (4 if oltp else 2)
+    )
+    work_mem_kb = min(262144, max(4096, work_mem_kb))
+
+    parameters = {
+        # memory, shared_buffers/effective_cache_size in 8kB pages
+        "shared_buffers": shared_buffers_kb // 8,
+        "effective_cache_size": memory_kb * 3 // 4 // 8,
+        "work_mem": work_mem_kb,
+        "maintenance_work_mem": min(2097152, memory_kb // 16),
+        "max_connections": max_connections,
+        # EBS storage, random reads cost about as much as sequential ones
+        "random_page_cost": "1.1",
+        "effective_io_concurrency": 200,
+        # parallelism
+        "max_worker_processes": max(8, vcpus),
+        "max_parallel_workers": vcpus,
+        "max_parallel_workers_per_gather": min(2, vcpus // 2)
+        if oltp
+        else max(1, vcpus // 2),
+        # write-ahead log
+        "checkpoint_completion_target": "0.9",
+        "max_wal_size": 2048 if oltp else 4096,
+        # autovacuum, more eager on frequently updated OLTP tables
+        "autovacuum_max_workers": max(3, vcpus // 2),
+        "autovacuum_naptime": 15 if oltp else 30,
+        "autovacuum_vacuum_scale_factor": "0.05" if oltp else "0.1",
+        "autovacuum_analyze_scale_factor": "0.02" if oltp else "0.05",
+        "autovacuum_vacuum_cost_limit": 2000,
+        **logging_parameters(auto_explain_min_duration, log_min_duration_statement),
+    }
+    parameters.update(overrides or {})
+    return {name: str(value) for name, value in parameters.items()}
+
+
+def logging_parameters(auto_explain_min_duration, log_min_duration_statement) -> dict:
+    """Query statistics and slow statement/plan logging."""
+    return {
+        "shared_preload_libraries": "pg_stat_statements,auto_explain",
+        "pg_stat_statements.track": "top",
+        "pg_stat_statements.max": 10000,
+        "track_io_timing": 1,
+        "auto_explain.log_min_duration": auto_explain_min_duration,
+        "auto_explain.log_analyze": 0,
+        "auto_explain.log_format": "json",
+        # statements slower than this (ms) are logged for the slow-query digest
+        "log_min_duration_statement": log_min_duration_statement,
+    }
+
+
+def aurora_cluster_parameters(
+    auto_explain_min_duration=1000, log_min_duration_statement=-1, overrides=None
+) -> dict:
+    """Cluster parameter group values for Aurora PostgreSQL Serverless v2.
+
+    Aurora sizes memory and connection settings from the current ACUs, so
+    only logging is set here; overrides are applied last.
+    """
+    parameters = logging_parameters(
+        auto_explain_min_duration, log_min_duration_statement
+    )
+    parameters.update(overrides or {})
+    return {name: str(value) for name, value in parameters.items()}
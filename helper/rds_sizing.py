@@ -0,0 +1,120 @@
+"""Validate per-service RDS instance sizing, availability and maintenance settings."""
+from helper import postgres_tuning
+
+MONITORING_INTERVALS = [0, 1, 5, 10, 15, 30, 60]
+MAX_SERVERLESS_CAPACITY = 256
+DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def _minute_of_day(clock) -> int:
+    hours, minutes = clock.split(":")
+    if not (0 <= int(hours) < 24 and 0 <= int(minutes) < 60):
+        raise ValueError(clock)
+    return int(hours) * 60 + int(minutes)
+
+
+def _week_ranges(start, end) -> list:
+    """Minute-of-week ranges of a window, split where it wraps round the week."""
+    if end <= start:
+        end += MINUTES_PER_WEEK
+    if end <= MINUTES_PER_WEEK:
+        return [(start, end)]
+    return [(start, MINUTES_PER_WEEK), (0, end - MINUTES_PER_WEEK)]
+
+
+def backup_window_ranges(window) -> list:
+    """Minute-of-week ranges of a daily hh24:mi-hh24:mi window."""
+    start, end = (_minute_of_day(clock) for clock in window.split("-"))
+    if (end - start) % MINUTES_PER_DAY < 30:
+        raise ValueError("must be at least 30 minutes")
+    ranges = []
+    for day in range(7):
+        ranges += _week_ranges(
+            day * MINUTES_PER_DAY + start,
+            day * MINUTES_PER_DAY + start + (end - start) % MINUTES_PER_DAY,
+        )
+    return ranges
+
+
+def maintenance_window_ranges(window) -> list:
+    """Minute-of-week ranges of a weekly ddd:hh24:mi-ddd:hh24:mi window."""
+    start, end = (
+        DAYS.index(bound[:3].lower()) * MINUTES_PER_DAY + _minute_of_day(bound[4:])
+        for bound in window.split("-")
+    )
+    if (end - start) % MINUTES_PER_WEEK < 30:
+        raise ValueError("must be at least 30 minutes")
+    return _week_ranges(start, end)
+
+
+def validate_sizing(identifier, database):
+    """Raise ValueError for settings RDS would reject."""
+
+    def fail(reason):
+        raise ValueError(f"{identifier} sizing: {reason}")
+
+    for key in ("instance_type", "read_replica_instance_type"):
+        if key in database:
+            try:
+                postgres_tuning.instance_resources(database[key])
+            except ValueError as error:
+                fail(f"{key}: {error}")
+    if database["monitoring_interval"] not in MONITORING_INTERVALS:
+        fail(f"monitoring_interval must be one of {MONITORING_INTERVALS}")
+    if not 1 <= database["backup_retention_period"] <= 35:
+        fail("backup_retention_period must be 1-35 days, replicas need backups")
+
+    try:
+        backup = backup_window_ranges(database["preferred_backup_window"])
+    except (ValueError, IndexError):
+        fail("preferred_backup_window must be hh24:mi-hh24:mi and 30 minutes or more")
+    try:
+        maintenance = maintenance_window_ranges(
+            database["preferred_maintenance_window"]
+        )
+    except (ValueError, IndexError):
+        fail(
+            "preferred_maintenance_window must be ddd:hh24:mi-ddd:hh24:mi "
+            "and 30 minutes or more"
+        )
+    if any(
+        start < other_end and other_start < end
+        for start, end in backup
+        for other_start, other_end in maintenance
+    ):
+        fail("preferred_backup_window overlaps preferred_maintenance_window")
+
+
+def instance_properties(identifier, database) -> dict:
+    """Validated CfnDBInstance sizing and maintenance keyword arguments."""
+    validate_sizing(identifier, database)
+    return {
+        "db_instance_class": database["instance_type"],
+        "multi_az": database["is_enabled_multiaz"],
+        "backup_retention_period": database["backup_retention_period"],
+        "preferred_backup_window": database["preferred_backup_window"],
+        "preferred_maintenance_window": database["preferred_maintenance_window"],
+        "monitoring_interval": database["monitoring_interval"],
+    }
+
+
+def serverless_scaling(identifier, aurora) -> dict:
+    """Validated Serverless v2 scaling configuration, in ACUs."""
+    min_capacity, max_capacity = aurora["min_capacity"], aurora["max_capacity"]
+    if any(
+        capacity * 2 != int(capacity * 2) for capacity in (min_capacity, max_capacity)
+    ):
+        raise ValueError(f"{identifier} aurora: capacity must be in 0.5 ACU steps")
+    if (
+        not 0 <= min_capacity <= max_capacity <= MAX_SERVERLESS_CAPACITY
+        or max_capacity < 1
+    ):
+        raise ValueError(
+            f"{identifier} aurora: need 0 <= min_capacity <= max_capacity <= "
+            f"{MAX_SERVERLESS_CAPACITY} and max_capacity of at least 1"
+        )
+    if aurora["reader_count"] not in range(16):
+        raise ValueError(f"{identifier} aurora: reader_count must be 0-15")
+    return {"min_capacity": min_capacity, "max_capacity": max_capacity}
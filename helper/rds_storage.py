@@ -0,0 +1,168 @@
+"""Validate RDS storage settings and work out the IOPS/throughput they give."""
+
+MAX_STORAGE_GIB = 65536
+# gp3 on RDS for PostgreSQL stripes volumes from 400 GiB up
+GP3_STRIPING_THRESHOLD_GIB = 400
+
+# baseline EBS IOPS and throughput (MiB/s) of the instance classes
+# helper/postgres_tuning.py sizes, from the EC2 EBS-optimized instance tables;
+# an R class has the EBS limits of the M class of its generation
+BURSTABLE_EBS_LIMITS = {
+    "micro": (500, 11),
+    "small": (1000, 22),
+    "medium": (2000, 44),
+    "large": (4000, 87),
+    "xlarge": (4000, 87),
+    "2xlarge": (4000, 87),
+}
+M5_EBS_LIMITS = {
+    "large": (3600, 81),
+    "xlarge": (6000, 143),
+    "2xlarge": (12000, 287),
+    "4xlarge": (18750, 593),
+    "8xlarge": (30000, 850),
+    "12xlarge": (40000, 1187),
+    "16xlarge": (60000, 1700),
+}
+M6G_EBS_LIMITS = {
+    "large": (3600, 78),
+    "xlarge": (6000, 148),
+    "2xlarge": (12000, 296),
+    "4xlarge": (20000, 593),
+    "8xlarge": (40000, 1187),
+    "12xlarge": (50000, 1687),
+    "16xlarge": (80000, 2375),
+}
+M6I_EBS_LIMITS = {
+    "large": (3600, 81),
+    "xlarge": (6000, 156),
+    "2xlarge": (12000, 312),
+    "4xlarge": (20000, 625),
+    "8xlarge": (40000, 1250),
+    "12xlarge": (60000, 1875),
+    "16xlarge": (80000, 2500),
+}
+M7G_EBS_LIMITS = dict(M6I_EBS_LIMITS, large=(3600, 78))
+EBS_LIMITS = {
+    "t3": BURSTABLE_EBS_LIMITS,
+    "t4g": BURSTABLE_EBS_LIMITS,
+    "m5": M5_EBS_LIMITS,
+    "r5": M5_EBS_LIMITS,
+    "m6g": M6G_EBS_LIMITS,
+    "r6g": M6G_EBS_LIMITS,
+    "m6i": M6I_EBS_LIMITS,
+    "r6i": M6I_EBS_LIMITS,
+    "m7g": M7G_EBS_LIMITS,
+    "r7g": M7G_EBS_LIMITS,
+}
+
+
+def instance_ebs_limits(instance_class):
+    """Baseline EBS IOPS and MiB/s of a db.* instance class, None if not listed."""
+    try:
+        _, family, size = instance_class.split(".")
+    except ValueError:
+        raise ValueError(f"Unknown RDS instance class {instance_class}") from None
+    return EBS_LIMITS.get(family, {}).get(size)
+
+
+def volume_performance(storage) -> tuple:
+    """IOPS and MiB/s the volume itself provides."""
+    storage_type = storage["storage_type"]
+    allocated = storage["allocated_storage"]
+    if storage_type == "gp2":
+        return min(16000, max(100, allocated * 3)), 250 if allocated > 170 else 128
+    if storage_type == "gp3":
+        if allocated < GP3_STRIPING_THRESHOLD_GIB:
+            return 3000, 125
+        return storage.get("iops") or 12000, storage.get("storage_throughput") or 500
+    # io1/io2 throughput scales with provisioned IOPS at 256 KiB per I/O
+    return storage["iops"], min(4000, storage["iops"] // 4)
+
+
+def validate_storage(identifier, storage):
+    """Raise ValueError for settings RDS for PostgreSQL would reject."""
+    storage_type = storage["storage_type"]
+    allocated = storage["allocated_storage"]
+    iops = storage.get("iops")
+    throughput = storage.get("storage_throughput")
+    max_allocated = storage.get("max_allocated_storage")
+
+    def fail(reason):
+        raise ValueError(f"{identifier} storage: {reason}")
+
+    if storage_type not in ("gp2", "gp3", "io1", "io2"):
+        fail(f"unsupported storage_type {storage_type}")
+    minimum = 100 if storage_type in ("io1", "io2") else 20
+    if not minimum <= allocated <= MAX_STORAGE_GIB:
+        fail(f"allocated_storage must be {minimum}-{MAX_STORAGE_GIB} GiB")
+    if max_allocated is not None and not (
+        allocated * 1.1 <= max_allocated <= MAX_STORAGE_GIB
+    ):
+        fail("max_allocated_storage must be at least 10% above allocated_storage")
+
+    if storage_type == "gp2" and (iops or throughput):
+        fail("gp2 does not take provisioned iops or storage_throughput")
+    if storage_type == "gp3" and (iops or throughput):
+        if allocated < GP3_STRIPING_THRESHOLD_GIB:
+            fail(
+                f"gp3 iops/storage_throughput need at least "
+                f"{GP3_STRIPING_THRESHOLD_GIB} GiB allocated"
+            )
+        if iops is not None and not 12000 <= iops <= 64000:
+            fail("gp3 iops must be 12000-64000")
+        if throughput is not None and not 500 <= throughput <= 4000:
+            fail("gp3 storage_throughput must be 500-4000 MiB/s")
+        if iops and throughput and throughput > iops / 4:
+            fail("gp3 storage_throughput may be at most iops / 4")
+    if storage_type in ("io1", "io2"):
+        if throughput:
+            fail(f"{storage_type} throughput follows iops and cannot be set")
+        if iops is None or not 1000 <= iops <= 256000:
+            fail(f"{storage_type} iops must be 1000-256000")
+        max_ratio = 50 if storage_type == "io1" else 1000
+        if not allocated / 2 <= iops <= allocated * max_ratio:
+            fail(f"{storage_type} iops must be 0.5-{max_ratio} per GiB")
+
+
+def storage_properties(identifier, storage) -> dict:
+    """Validated CfnDBInstance storage keyword arguments."""
+    validate_storage(identifier, storage)
+    return {
+        "storage_type": storage["storage_type"],
+        "allocated_storage": str(storage["allocated_storage"]),
+        "max_allocated_storage": storage.get("max_allocated_storage"),
+        "iops": storage.get("iops"),
+        "storage_throughput": storage.get("storage_throughput"),
+    }
+
+
+def storage_report(identifier, instance_class, storage) -> tuple:
+    """Effective IOPS/throughput line, and whether the instance caps the volume.
+
+    Only provisioned IOPS/throughput count as capped: the gp2/gp3 baseline
+    comes with the volume, so a small instance under it costs nothing extra.
+    """
+    volume_iops, volume_throughput = volume_performance(storage)
+    volume = (
+        f"{identifier}: {storage['storage_type']} {storage['allocated_storage']} GiB "
+        f"on {instance_class}"
+    )
+    instance_limits = instance_ebs_limits(instance_class)
+    if instance_limits is None:
+        report = (
+            f"{volume} gives up to {volume_iops} IOPS / {volume_throughput} MiB/s "
+            f"(instance baseline unknown)"
+        )
+        return report, False
+    instance_iops, instance_throughput = instance_limits
+    iops = min(volume_iops, instance_iops)
+    throughput = min(volume_throughput, instance_throughput)
+    report = (
+        f"{volume} gives {iops} IOPS / {throughput} MiB/s "
+        f"(volume {volume_iops} / {volume_throughput}, "
+        f"instance baseline {instance_iops} / {instance_throughput})"
+    )
+    is_capped = (iops, throughput) != (volume_iops, volume_throughput)
+    is_provisioned = bool(storage.get("iops") or storage.get("storage_throughput"))
+    return report, is_capped and is_provisioned
@@ -0,0 +1,77 @@
+"""Optional in-stack deployment of a built site to its web bucket."""
+from aws_cdk import Duration, aws_s3_deployment as s3deploy, aws_ssm as ssm
+from helper import cloudfront as cloudfront_helper
+
+HASHED_ASSET_CACHE_CONTROL = [
+    s3deploy.CacheControl.set_public(),
+    s3deploy.CacheControl.max_age(Duration.days(365)),
+    s3deploy.CacheControl.from_string("immutable"),
+]
+DOCUMENT_CACHE_CONTROL = [
+    s3deploy.CacheControl.set_public(),
+    s3deploy.CacheControl.max_age(Duration.seconds(0)),
+    s3deploy.CacheControl.s_max_age(Duration.seconds(60)),
+    s3deploy.CacheControl.must_revalidate(),
+]
+
+
+def site_bucket_deployment(scope, conf, site_key, bucket, distribution):
+    """Deploy `site_deployments.<site_key>.source_path` with BucketDeployment.
+
+    Hashed assets and documents are synced separately so each gets its own
+    Cache-Control; only the documents deployment invalidates, and only the
+    entry point. CI should prefer tools/site_deployer.py, which skips
+    unchanged objects and pre-compresses; this covers small sites and demos.
+    """
+    deployment = conf.get("site_deployments")[site_key]
+    if not deployment.get("is_enabled_bucket_deployment", False):
+        return
+    if deployment.get("is_enabled_versioned_releases", False):
+        raise ValueError(
+            f"{site_key}: BucketDeployment writes to the bucket root, which is "
+            "not served once versioned releases are enabled"
+        )
+    source = s3deploy.Source.asset(deployment["source_path"])
+    hashed_asset_patterns = [
+        path.lstrip("/")
+        for path in cloudfront_helper.site_cache_settings(conf)["hashed_asset_paths"]
+    ]
+
+    s3deploy.BucketDeployment(
+        scope,
+        f"{site_key}-hashed-asset-deployment",
+        destination_bucket=bucket,
+        sources=[source],
+        exclude=["*"],
+        include=hashed_asset_patterns,
+        cache_control=HASHED_ASSET_CACHE_CONTROL,
+        prune=False,
+    )
+    s3deploy.BucketDeployment(
+        scope,
+        f"{site_key}-document-deployment",
+        destination_bucket=bucket,
+        sources=[source],
+        exclude=hashed_asset_patterns,
+        cache_control=DOCUMENT_CACHE_CONTROL,
+        prune=False,
+        distribution=distribution,
+        distribution_paths=["/", "/index.html"],
+    )
+
+
+def release_origin_path(scope, conf, site_key):
+    """Origin path of the live release, or None to serve the bucket root.
+
+    tools/site_release.py switches releases by updating the distribution and
+    the `/<site>/<stage>/ACTIVE_RELEASE_PATH` parameter; resolving the origin
+    path from that parameter keeps `cdk deploy` on the live release. Publish
+    and activate a first release before enabling this.
+    """
+    deployment = conf.get("site_deployments")[site_key]
+    if not deployment.get("is_enabled_versioned_releases", False):
+        return None
+    site_name = site_key.replace("_", "-")
+    return ssm.StringParameter.value_for_string_parameter(
+        scope, f"/{site_name}/{conf.get('stage')}/ACTIVE_RELEASE_PATH"
+    )
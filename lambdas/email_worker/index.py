@@ -0,0 +1,247 @@
+"""Send the emails queued on the email-service event queue through SES.
+
+Invoked by the SQS event source with a batch of messages. Each body is an
+email as JSON, `{"to": [...], "subject": ..., "text": ..., "html": ...}`,
+optionally with `from`, `cc`, `bcc` and `reply_to`. Failed messages are
+returned as batch item failures, so only they are retried and, after
+`max_receive_count` receives, moved to the DLQ.
+
+SES limits the sends per second of the whole account. The event source
+runs at most MAX_CONCURRENCY invocations, so each one paces itself to its
+share of SES_MAX_SEND_RATE. When SES throttles anyway, the rest of the
+batch is handed back to the queue.
+
+With IDEMPOTENCY_TABLE set, each email is claimed in the table before it
+is sent, so a redelivered or redriven message is not sent twice. The claim
+is by the email's `idempotency_key`, else the SNS message id, else the id
+the message was first sent with: SQS gives a resent message a new id, so
+tools/sqs_redrive.py keeps the original one in a message attribute. A
+claim left by an invocation that died mid-send lapses after LEASE_SECONDS.
+"""
+import json
+import os
+import time
+
+THROTTLING_ERRORS = ["Throttling", "TooManyRequestsException", "LimitExceededException"]
+SENDING, SENT = "sending", "sent"
+# set by tools/sqs_redrive.py on the messages it moves back
+ORIGINAL_MESSAGE_ID_ATTRIBUTE = "original_message_id"
+
+
+class InvalidEmail(ValueError):
+    """A message body that is not an email this worker can send."""
+
+
+def parse_email(body) -> dict:
+    try:
+        email = json.loads(body)
+    except json.JSONDecodeError as error:
+        raise InvalidEmail(f"body is not JSON: {error}") from error
+    # enveloped SNS notification, when delivered through a topic
+    if isinstance(email, dict) and email.get("Type") == "Notification":
+        return parse_email(email["Message"])
+    if not isinstance(email, dict):
+        raise InvalidEmail("body is not a JSON object")
+    to = email.get("to")
+    if isinstance(to, str):
+        to = [to]
+    if not to:
+        raise InvalidEmail("no recipient in `to`")
+    if not email.get("subject"):
+        raise InvalidEmail("no `subject`")
+    if not email.get("text") and not email.get("html"):
+        raise InvalidEmail("no `text` or `html` body")
+    return {**email, "to": to}
+
+
+def message_id(record) -> str:
+    """Id of the message as first sent, kept through SNS and redrives."""
+    try:
+        body = json.loads(record["body"])
+    except json.JSONDecodeError:
+        body = None
+    if isinstance(body, dict) and body.get("Type") == "Notification":
+        return body["MessageId"]
+    attributes = record.get("messageAttributes") or {}
+    if ORIGINAL_MESSAGE_ID_ATTRIBUTE in attributes:
+        return attributes[ORIGINAL_MESSAGE_ID_ATTRIBUTE]["stringValue"]
+    return record["messageId"]
+
+
+def send_email_request(email, from_address) -> dict:
+    """Keyword arguments of the SESv2 SendEmail call for an email."""
+    body = {}
+    if email.get("text"):
+        body["Text"] = {"Data": email["text"], "Charset": "UTF-8"}
+    if email.get("html"):
+        body["Html"] = {"Data": email["html"], "Charset": "UTF-8"}
+    destination = {"ToAddresses": email["to"]}
+    if email.get("cc"):
+        destination["CcAddresses"] = email["cc"]
+    if email.get("bcc"):
+        destination["BccAddresses"] = email["bcc"]
+    request = {
+        "FromEmailAddress": email.get("from") or from_address,
+        "Destination": destination,
+        "Content": {
+            "Simple": {
+                "Subject": {"Data": email["subject"], "Charset": "UTF-8"},
+                "Body": body,
+            }
+        },
+    }
+    if email.get("reply_to"):
+        request["ReplyToAddresses"] = [email["reply_to"]]
+    return request
+
+
+class Pacer:
+    """Spaces calls `1 / rate` seconds apart."""
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 1 / rate
+        self.clock = clock
+        self.sleep = sleep
+        self.next_call = None
+
+    def wait(self):
+        now = self.clock()
+        if self.next_call is not None and now < self.next_call:
+            self.sleep(self.next_call - now)
+            now = self.next_call
+        self.next_call = now + self.interval
+
+
+def _error_code(error):
+    response = getattr(error, "response", None) or {}
+    return response.get("Error", {}).get("Code")
+
+
+class IdempotencyStore:
+    """Claims of email ids in the DynamoDB idempotency table."""
+
+    def __init__(self, dynamodb, table, ttl_seconds, lease_seconds, clock=time.time):
+        self.dynamodb = dynamodb
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+
+    def claim(self, email_id) -> bool:
+        """False when the email was sent, or is being sent, already."""
+        now = int(self.clock())
+        try:
+            self.dynamodb.put_item(
+                TableName=self.table,
+                Item={
+                    "id": {"S": email_id},
+                    "status": {"S": SENDING},
+                    "expires_at": {"N": str(now + self.lease_seconds)},
+                },
+                ConditionExpression=(
+                    "attribute_not_exists(id) OR "
+                    "(#status = :sending AND expires_at < :now)"
+                ),
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={
+                    ":sending": {"S": SENDING},
+                    ":now": {"N": str(now)},
+                },
+            )
+        except Exception as error:
+            if _error_code(error) == "ConditionalCheckFailedException":
+                return False
+            raise
+        return True
+
+    def complete(self, email_id):
+        self.dynamodb.update_item(
+            TableName=self.table,
+            Key={"id": {"S": email_id}},
+            UpdateExpression="SET #status = :sent, expires_at = :expires_at",
+            ExpressionAttributeNames={"#status": "status"},
+            ExpressionAttributeValues={
+                ":sent": {"S": SENT},
+                ":expires_at": {"N": str(int(self.clock()) + self.ttl_seconds)},
+            },
+        )
+
+    def release(self, email_id):
+        """Drop a claim whose send failed, so the retry can send it."""
+        self.dynamodb.delete_item(TableName=self.table, Key={"id": {"S": email_id}})
+
+
+def _settle(update, email_id, record):
+    """Update a claim after the send, logging failures.
+
+    Raising would fail the whole batch and resend the emails already sent;
+    a claim left `sending` lapses after the lease.
+    """
+    try:
+        update(email_id)
+    except Exception as error:
+        print(json.dumps({"messageId": record["messageId"], "error": str(error)}))
+
+
+def process(records, ses, from_address, pacer, store=None) -> dict:
+    """Send each record's email, return the SQS partial batch response."""
+    failures = []
+    for index, record in enumerate(records):
+        try:
+            email = parse_email(record["body"])
+        except InvalidEmail as error:
+            # retried until the redrive policy moves it to the DLQ for a look
+            print(json.dumps({"messageId": record["messageId"], "error": str(error)}))
+            failures.append(record["messageId"])
+            continue
+        email_id = email.get("idempotency_key") or message_id(record)
+        if store:
+            try:
+                if not store.claim(email_id):
+                    continue
+            except Exception as error:
+                print(
+                    json.dumps({"messageId": record["messageId"], "error": str(error)})
+                )
+                failures.append(record["messageId"])
+                continue
+        pacer.wait()
+        try:
+            ses.send_email(**send_email_request(email, from_address))
+        except Exception as error:
+            if store:
+                _settle(store.release, email_id, record)
+            if _error_code(error) in THROTTLING_ERRORS:
+                # over the account rate: return this and the rest to the queue
+                failures.extend(r["messageId"] for r in records[index:])
+                break
+            print(json.dumps({"messageId": record["messageId"], "error": str(error)}))
+            failures.append(record["messageId"])
+            continue
+        if store:
+            _settle(store.complete, email_id, record)
+    return {"batchItemFailures": [{"itemIdentifier": i} for i in failures]}
+
+
+_ses, _pacer, _store = None, None, None
+
+
+def handler(event, context):
+    global _ses, _pacer, _store
+    if _ses is None:
+        import boto3
+
+        _ses = boto3.client("sesv2")
+        # kept while the environment is warm, so pacing spans invocations
+        rate = float(os.environ["SES_MAX_SEND_RATE"]) / int(
+            os.environ["MAX_CONCURRENCY"]
+        )
+        _pacer = Pacer(rate)
+        if os.environ.get("IDEMPOTENCY_TABLE"):
+            _store = IdempotencyStore(
+                boto3.client("dynamodb"),
+                os.environ["IDEMPOTENCY_TABLE"],
+                int(os.environ["IDEMPOTENCY_TTL_SECONDS"]),
+                int(os.environ["LEASE_SECONDS"]),
+            )
+    return process(event["Records"], _ses, os.environ["FROM_ADDRESS"], _pacer, _store)
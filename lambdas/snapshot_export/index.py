@@ -0,0 +1,160 @@
+"""Export the service database snapshots to S3 as Parquet for Athena.
+
+Runs on a schedule. Each run starts an export of the newest automated
+snapshot of every service database that has not been exported yet, and
+publishes finished exports: their Parquet files are copied from the raw
+RDS export layout (`raw/<service>/<export>/<db>/<schema.table>/...`) to
+`curated/<service>/<db>__<schema_table>/snapshot_date=<date>/`, so the Glue
+crawler sees one table per database table, partitioned by snapshot date.
+"""
+import json
+import os
+
+RAW_PREFIX = "raw"
+CURATED_PREFIX = "curated"
+PUBLISHED_PREFIX = f"{CURATED_PREFIX}/_published"
+
+
+def latest_snapshot(rds, source):
+    """(arn, creation time) of the newest available automated snapshot, or None."""
+    if source["engine"] == "aurora-postgresql":
+        snapshots = rds.describe_db_cluster_snapshots(
+            DBClusterIdentifier=source["identifier"], SnapshotType="automated"
+        )["DBClusterSnapshots"]
+        arn_key = "DBClusterSnapshotArn"
+    else:
+        snapshots = rds.describe_db_snapshots(
+            DBInstanceIdentifier=source["identifier"], SnapshotType="automated"
+        )["DBSnapshots"]
+        arn_key = "DBSnapshotArn"
+    available = [s for s in snapshots if s["Status"] == "available"]
+    if not available:
+        return None
+    newest = max(available, key=lambda snapshot: snapshot["SnapshotCreateTime"])
+    return newest[arn_key], newest["SnapshotCreateTime"]
+
+
+def export_identifier(service, snapshot_time) -> str:
+    return f"{service}-{snapshot_time:%Y-%m-%d}"
+
+
+def start_export(rds, source, bucket, role_arn, kms_key_id):
+    """Export the newest snapshot once; the export id is unique per day."""
+    snapshot = latest_snapshot(rds, source)
+    if snapshot is None:
+        return None
+    snapshot_arn, snapshot_time = snapshot
+    identifier = export_identifier(source["service"], snapshot_time)
+    try:
+        rds.describe_export_tasks(ExportTaskIdentifier=identifier)
+        return None
+    except rds.exceptions.ExportTaskNotFoundFault:
+        pass
+    rds.start_export_task(
+        ExportTaskIdentifier=identifier,
+        SourceArn=snapshot_arn,
+        S3BucketName=bucket,
+        S3Prefix=f"{RAW_PREFIX}/{source['service']}",
+        IamRoleArn=role_arn,
+        KmsKeyId=kms_key_id,
+    )
+    return identifier
+
+
+def _keys(s3, bucket, prefix):
+    kwargs = {"Bucket": bucket, "Prefix": prefix}
+    while True:
+        response = s3.list_objects_v2(**kwargs)
+        for item in response.get("Contents", []):
+            yield item["Key"]
+        if not response.get("IsTruncated"):
+            return
+        kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+
+def curated_key(service, export_id, raw_key):
+    """Curated key of an exported Parquet file, None for export metadata."""
+    relative = raw_key[len(f"{RAW_PREFIX}/{service}/{export_id}/") :]
+    parts = relative.split("/")
+    if len(parts) < 3 or not parts[-1].endswith(".parquet"):
+        return None
+    # databases of one instance may share schema.table names
+    table = f"{parts[0]}__{parts[1].replace('.', '_')}"
+    snapshot_date = export_id[len(service) + 1 :]
+    # partition folders under the table keep their files apart
+    file_name = "-".join(parts[2:])
+    return (
+        f"{CURATED_PREFIX}/{service}/{table}/snapshot_date={snapshot_date}/{file_name}"
+    )
+
+
+def publish_export(s3, bucket, service, export_id) -> list:
+    """Copy a finished export to the curated layout, once."""
+    marker = f"{PUBLISHED_PREFIX}/{export_id}"
+    if any(key == marker for key in _keys(s3, bucket, marker)):
+        return []
+    copied = []
+    for raw_key in _keys(s3, bucket, f"{RAW_PREFIX}/{service}/{export_id}/"):
+        key = curated_key(service, export_id, raw_key)
+        if key is not None:
+            s3.copy_object(
+                Bucket=bucket, Key=key, CopySource={"Bucket": bucket, "Key": raw_key}
+            )
+            copied.append(key)
+    s3.put_object(Bucket=bucket, Key=marker, Body=json.dumps(copied).encode())
+    return copied
+
+
+def completed_exports(rds, service, bucket) -> list:
+    """Ids of the finished exports of a service into the bucket."""
+    kwargs = {}
+    export_ids = []
+    while True:
+        response = rds.describe_export_tasks(**kwargs)
+        for task in response["ExportTasks"]:
+            if (
+                task["Status"] == "COMPLETE"
+                and task["S3Bucket"] == bucket
+                and task.get("S3Prefix") == f"{RAW_PREFIX}/{service}"
+            ):
+                export_ids.append(task["ExportTaskIdentifier"])
+        if not response.get("Marker"):
+            return export_ids
+        kwargs["Marker"] = response["Marker"]
+
+
+def run(rds, s3, glue, sources, bucket, role_arn, kms_key_id, crawlers) -> dict:
+    summary = {"started": [], "published": []}
+    for source in sources:
+        service = source["service"]
+        started = start_export(rds, source, bucket, role_arn, kms_key_id)
+        if started:
+            summary["started"].append(started)
+        published = False
+        for export_id in completed_exports(rds, service, bucket):
+            if publish_export(s3, bucket, service, export_id):
+                summary["published"].append(export_id)
+                published = True
+        if published:
+            try:
+                glue.start_crawler(Name=crawlers[service])
+            except glue.exceptions.CrawlerRunningException:
+                pass
+    return summary
+
+
+def handler(event, context):
+    import boto3
+
+    summary = run(
+        boto3.client("rds"),
+        boto3.client("s3"),
+        boto3.client("glue"),
+        json.loads(os.environ["SOURCES"]),
+        os.environ["BUCKET"],
+        os.environ["EXPORT_ROLE_ARN"],
+        os.environ["KMS_KEY_ID"],
+        json.loads(os.environ["CRAWLERS"]),
+    )
+    print(json.dumps(summary))
+    return summary
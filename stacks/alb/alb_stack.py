@@ -9,6 +9,7 @@ from aws_cdk import (
 from aws_cdk.aws_certificatemanager import Certificate
 import aws_cdk as core
 from helper import config
+from helper import cloudfront as cloudfront_helper
 
 
 class AlbStack(Stack):
@@ -29,6 +30,8 @@ class AlbStack(Stack):
         web_arn = tls_certificate.certificate_arn
         api_domain = conf.get("api_domain")
         web_domain = conf.get("web_domain")
+        api_origin = cloudfront_helper.origin_settings(conf, "api")
+        protocol_profile = cloudfront_helper.protocol_profile(conf)
 
         public_subnet_ids = []
         public_subnet_ids.append(core.Fn.import_value("PublicSubnet-1"))
@@ -155,14 +158,20 @@ class AlbStack(Stack):
                             domain_name=self.alb.attr_dns_name,
                             id=self.alb.attr_dns_name,
                             origin_path="",
-                            connection_attempts=3,
-                            connection_timeout=10,
+                            connection_attempts=api_origin["connection_attempts"],
+                            connection_timeout=api_origin["connection_timeout"],
+                            origin_shield=cloudfront_helper.cfn_origin_shield(
+                                conf, "api"
+                            ),
                             custom_origin_config=cloudfront.CfnDistribution.CustomOriginConfigProperty(
                                 http_port=80,
                                 https_port=443,
                                 origin_protocol_policy="https-only",
                                 origin_ssl_protocols=["TLSv1.2"],
-                                origin_read_timeout=30,
+                                origin_keepalive_timeout=api_origin[
+                                    "keepalive_timeout"
+                                ],
+                                origin_read_timeout=api_origin["read_timeout"],
                             ),
                         )
                     ],
@@ -203,7 +212,9 @@ class AlbStack(Stack):
                     enabled=True,
                     viewer_certificate=cloudfront.CfnDistribution.ViewerCertificateProperty(
                         acm_certificate_arn=web_arn,  # update here
-                        minimum_protocol_version="TLSv1.2_2021",
+                        minimum_protocol_version=protocol_profile[
+                            "minimum_protocol_version"
+                        ],
                         ssl_support_method="sni-only",
                     ),
                     restrictions=cloudfront.CfnDistribution.RestrictionsProperty(
@@ -212,9 +223,9 @@ class AlbStack(Stack):
                         )
                     ),
                     # web_acl_id=web_acl_id,
-                    # http_version="http2",
+                    http_version=protocol_profile["http_version"],
                     # default_root_object="",
-                    # ipv6_enabled=False,
+                    ipv6_enabled=protocol_profile["ipv6_enabled"],
                     cache_behaviors=[
                         # cloudfront.CfnDistribution.CacheBehaviorProperty(
                         #     allowed_methods=[
@@ -259,12 +270,13 @@ class AlbStack(Stack):
             record_sets=[
                 r53.CfnRecordSetGroup.RecordSetProperty(
                     name=api_domain,
-                    type="A",
+                    type=record_type,
                     alias_target=r53.CfnRecordSetGroup.AliasTargetProperty(
                         hosted_zone_id="Z2FDTNDATAQYW2",  # for china region Z3RFFRIM2A3IF5
                         dns_name=alb_cloudfrontdistribution.attr_domain_name,
                     ),
                 )
+                for record_type in cloudfront_helper.alias_record_types(conf)
             ],
             hosted_zone_id=my_hosted_zone.hosted_zone_id,
         )
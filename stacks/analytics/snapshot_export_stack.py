@@ -0,0 +1,226 @@
+"""Import Module."""
+import json
+
+import aws_cdk as core
+from aws_cdk import (
+    aws_iam as iam,
+    aws_kms as kms,
+    aws_s3 as s3,
+    aws_glue as glue,
+    aws_athena as athena,
+    aws_events as events,
+    aws_events_targets as targets,
+    aws_lambda as lambda_,
+    Stack,
+)
+from constructs import Construct
+from helper import config
+
+
+class SnapshotExportStack(Stack):
+    """Class to export the service database snapshots to S3 for Athena"""
+
+    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        conf = config.Config(self.node.try_get_context("environment"))
+        project_name = conf.get("project_name")
+        stage = conf.get("stage")
+        engine = conf.get("engine")
+        api_service = conf.get("api_service_name")
+        account_service = conf.get("account_service_name")
+        snapshot_export = conf.get("snapshot_export")
+        services = [account_service, api_service]
+
+        # RDS exports are always KMS encrypted, the bucket and Athena share the key
+        export_key = kms.Key(
+            self,
+            "db-export-key",
+            alias=f"{project_name}-db-export-{stage}",
+            enable_key_rotation=True,
+        )
+        export_bucket = s3.Bucket(
+            self,
+            "db-export-bucket",
+            bucket_name=f"{project_name}-db-export-{stage}",
+            encryption=s3.BucketEncryption.KMS,
+            encryption_key=export_key,
+            bucket_key_enabled=True,
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            enforce_ssl=True,
+            lifecycle_rules=[
+                s3.LifecycleRule(
+                    prefix="raw/",
+                    expiration=core.Duration.days(
+                        snapshot_export["raw_retention_days"]
+                    ),
+                ),
+                s3.LifecycleRule(
+                    prefix="curated/",
+                    expiration=core.Duration.days(
+                        snapshot_export["curated_retention_days"]
+                    ),
+                ),
+                s3.LifecycleRule(
+                    prefix="athena-results/",
+                    expiration=core.Duration.days(
+                        snapshot_export["athena_results_retention_days"]
+                    ),
+                ),
+            ],
+        )
+
+        # role RDS assumes to write the export
+        export_role = iam.Role(
+            self,
+            "RDSSnapshotExportRole",
+            assumed_by=iam.ServicePrincipal("export.rds.amazonaws.com"),
+        )
+        export_bucket.grant_read_write(export_role, "raw/*")
+        export_bucket.grant_delete(export_role, "raw/*")
+
+        # one Glue database and crawler per service, tables from the curated layout
+        glue_role = iam.Role(
+            self,
+            "GlueCrawlerRole",
+            assumed_by=iam.ServicePrincipal("glue.amazonaws.com"),
+            managed_policies=[
+                iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "service-role/AWSGlueServiceRole"
+                )
+            ],
+        )
+        export_bucket.grant_read(glue_role, "curated/*")
+        crawlers = {}
+        for identifier in services:
+            database_name = f"{project_name}_{identifier}_{stage}".replace("-", "_")
+            glue_database = glue.CfnDatabase(
+                self,
+                f"{identifier}-glue-database",
+                catalog_id=self.account,
+                database_input=glue.CfnDatabase.DatabaseInputProperty(
+                    name=database_name,
+                    description=f"{identifier} snapshot exports",
+                ),
+            )
+            crawler = glue.CfnCrawler(
+                self,
+                f"{identifier}-glue-crawler",
+                name=f"{project_name}-{identifier}-snapshot-crawler-{stage}",
+                role=glue_role.role_arn,
+                database_name=database_name,
+                targets=glue.CfnCrawler.TargetsProperty(
+                    s3_targets=[
+                        glue.CfnCrawler.S3TargetProperty(
+                            path=f"s3://{export_bucket.bucket_name}/curated/{identifier}/"
+                        )
+                    ]
+                ),
+                # curated/<service>/<db>__<table>/snapshot_date=<date>/, tables at level 4
+                configuration=json.dumps(
+                    {
+                        "Version": 1.0,
+                        "Grouping": {"TableLevelConfiguration": 4},
+                        "CrawlerOutput": {
+                            "Partitions": {"AddOrUpdateBehavior": "InheritFromTable"}
+                        },
+                    }
+                ),
+                schema_change_policy=glue.CfnCrawler.SchemaChangePolicyProperty(
+                    update_behavior="UPDATE_IN_DATABASE",
+                    delete_behavior="LOG",
+                ),
+            )
+            crawler.add_dependency(glue_database)
+            crawlers[identifier] = crawler.ref
+
+        athena.CfnWorkGroup(
+            self,
+            "analytics-workgroup",
+            name=f"{project_name}-analytics-{stage}",
+            description="Reporting queries over the database snapshot exports",
+            state="ENABLED",
+            work_group_configuration=athena.CfnWorkGroup.WorkGroupConfigurationProperty(
+                enforce_work_group_configuration=True,
+                publish_cloud_watch_metrics_enabled=True,
+                bytes_scanned_cutoff_per_query=snapshot_export[
+                    "bytes_scanned_cutoff_per_query"
+                ],
+                result_configuration=athena.CfnWorkGroup.ResultConfigurationProperty(
+                    output_location=f"s3://{export_bucket.bucket_name}/athena-results/",
+                    encryption_configuration=athena.CfnWorkGroup.EncryptionConfigurationProperty(
+                        encryption_option="SSE_KMS", kms_key=export_key.key_arn
+                    ),
+                ),
+            ),
+        )
+
+        # scheduled function that starts exports and publishes finished ones
+        # same identifiers RDSStack gives the instances or clusters
+        suffix = "aurora-cluster" if engine == "aurora-postgresql" else "rds-instance"
+        sources = [
+            {
+                "service": identifier,
+                "engine": engine,
+                "identifier": f"{identifier}-{suffix}",
+            }
+            for identifier in services
+        ]
+        export_function = lambda_.Function(
+            self,
+            "snapshot-export-function",
+            function_name=f"{project_name}-snapshot-export-{stage}",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="index.handler",
+            code=lambda_.Code.from_asset("lambdas/snapshot_export"),
+            timeout=core.Duration.minutes(15),
+            memory_size=256,
+            environment={
+                "BUCKET": export_bucket.bucket_name,
+                "EXPORT_ROLE_ARN": export_role.role_arn,
+                "KMS_KEY_ID": export_key.key_arn,
+                "SOURCES": json.dumps(sources),
+                "CRAWLERS": self.to_json_string(crawlers),
+            },
+        )
+        export_bucket.grant_read_write(export_function)
+        export_key.grant_encrypt_decrypt(export_function)
+        export_function.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=[
+                    "rds:DescribeDBSnapshots",
+                    "rds:DescribeDBClusterSnapshots",
+                    "rds:DescribeExportTasks",
+                    "rds:StartExportTask",
+                ],
+                resources=["*"],
+            )
+        )
+        export_function.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["iam:PassRole"], resources=[export_role.role_arn]
+            )
+        )
+        # the export task encrypts with the caller's grant on the key
+        export_function.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["kms:CreateGrant", "kms:DescribeKey", "kms:RetireGrant"],
+                resources=[export_key.key_arn],
+            )
+        )
+        export_function.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["glue:StartCrawler"],
+                resources=[
+                    f"arn:aws:glue:{self.region}:{self.account}:crawler/{crawler_name}"
+                    for crawler_name in crawlers.values()
+                ],
+            )
+        )
+        export_key.grant_decrypt(glue_role)
+        events.Rule(
+            self,
+            "snapshot-export-schedule",
+            schedule=events.Schedule.expression(snapshot_export["schedule"]),
+            targets=[targets.LambdaFunction(export_function)],
+        )
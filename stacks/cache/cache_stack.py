@@ -0,0 +1,166 @@
+"""Import Module."""
+import aws_cdk as core
+from aws_cdk import (
+    aws_ec2 as ec2,
+    aws_elasticache as elasticache,
+    aws_ssm as ssm,
+    aws_cloudwatch as cloudwatch,
+    Stack,
+)
+from constructs import Construct
+from helper import config
+
+CACHE_PORT = 6379
+
+
+class CacheStack(Stack):
+    """Class to create the Redis/Valkey cache tier of the services"""
+
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        vpc,
+        private2_subnet_ids: list,
+        ecs_sec_group: ec2.SecurityGroup,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        conf = config.Config(self.node.try_get_context("environment"))
+        project_name = conf.get("project_name")
+        stage = conf.get("stage")
+        api_service = conf.get("api_service_name")
+        account_service = conf.get("account_service_name")
+        cache = conf.get("cache")
+        cache_name = f"{project_name}-cache"
+
+        # only the ECS tasks reach the cache
+        self.cache_sec_group = ec2.SecurityGroup(
+            self,
+            "cache-sg",
+            vpc=vpc,
+            description="Cache Security Group - ECS access only",
+            allow_all_outbound=False,
+        )
+        self.cache_sec_group.add_ingress_rule(
+            ecs_sec_group, ec2.Port.tcp(CACHE_PORT), "Allow ECS Cache Access"
+        )
+        if cache["is_serverless"]:
+            # ServerlessCache has no L1 class in this CDK version
+            serverless = cache["serverless"]
+            serverless_cache = core.CfnResource(
+                self,
+                "serverless-cache",
+                type="AWS::ElastiCache::ServerlessCache",
+                properties={
+                    "ServerlessCacheName": cache_name,
+                    "Engine": cache["engine"],
+                    "MajorEngineVersion": cache["major_engine_version"],
+                    "SubnetIds": private2_subnet_ids,
+                    "SecurityGroupIds": [self.cache_sec_group.security_group_id],
+                    "SnapshotRetentionLimit": cache["snapshot_retention_limit"],
+                    "CacheUsageLimits": {
+                        "DataStorage": {
+                            "Maximum": serverless["max_data_storage"],
+                            "Unit": "GB",
+                        },
+                        "ECPUPerSecond": {"Maximum": serverless["max_ecpu_per_second"]},
+                    },
+                },
+            )
+            endpoint_address = serverless_cache.get_att("Endpoint.Address").to_string()
+            endpoint_port = serverless_cache.get_att("Endpoint.Port").to_string()
+            # serverless metrics are per cache, memory as bytes of the storage limit
+            alarm_dimensions = {cache_name: {"clusterId": cache_name}}
+            memory_metric = "BytesUsedForCache"
+            memory_threshold = (
+                serverless["max_data_storage"]
+                * 1024**3
+                * cache["memory_alarm_threshold"]
+                / 100
+            )
+        else:
+            cache_subnet_group = elasticache.CfnSubnetGroup(
+                self,
+                "cache-subnet-group",
+                description="Cache Subnet Group",
+                subnet_ids=private2_subnet_ids,
+                cache_subnet_group_name=f"{cache_name}-subnet-group",
+            )
+            replication_group = elasticache.CfnReplicationGroup(
+                self,
+                "cache-replication-group",
+                replication_group_id=cache_name,
+                replication_group_description=f"{project_name} service cache",
+                engine=cache["engine"],
+                engine_version=cache["engine_version"],
+                cache_node_type=cache["node_type"],
+                cache_parameter_group_name=cache["parameter_group_name"],
+                # cluster mode, keys are sharded over the node groups
+                num_node_groups=cache["num_node_groups"],
+                replicas_per_node_group=cache["replicas_per_node_group"],
+                automatic_failover_enabled=True,
+                multi_az_enabled=cache["replicas_per_node_group"] > 0,
+                cache_subnet_group_name=cache_subnet_group.ref,
+                security_group_ids=[self.cache_sec_group.security_group_id],
+                port=CACHE_PORT,
+                at_rest_encryption_enabled=True,
+                transit_encryption_enabled=True,
+                auto_minor_version_upgrade=True,
+                snapshot_retention_limit=cache["snapshot_retention_limit"],
+                preferred_maintenance_window=cache["preferred_maintenance_window"],
+            )
+            endpoint_address = replication_group.attr_configuration_end_point_address
+            endpoint_port = replication_group.attr_configuration_end_point_port
+            # cluster mode metrics are per node, named <group>-<shard>-<node>
+            alarm_dimensions = {
+                f"{cache_name}-{shard:04d}-{node:03d}": {
+                    "CacheClusterId": f"{cache_name}-{shard:04d}-{node:03d}"
+                }
+                for shard in range(1, cache["num_node_groups"] + 1)
+                for node in range(1, cache["replicas_per_node_group"] + 2)
+            }
+            memory_metric = "DatabaseMemoryUsagePercentage"
+            memory_threshold = cache["memory_alarm_threshold"]
+
+        for alarm_target, dimensions in alarm_dimensions.items():
+            for metric_name, threshold, description in [
+                (memory_metric, memory_threshold, "cache memory is nearly full"),
+                (
+                    "Evictions",
+                    cache["evictions_alarm_threshold"],
+                    "keys are evicted to make room, the cache is too small",
+                ),
+            ]:
+                cloudwatch.CfnAlarm(
+                    self,
+                    f"{alarm_target}-{metric_name}",
+                    alarm_name=f"{alarm_target}-{metric_name}",
+                    comparison_operator="GreaterThanThreshold",
+                    metric_name=metric_name,
+                    namespace="AWS/ElastiCache",
+                    period=300,
+                    statistic="Sum" if metric_name == "Evictions" else "Maximum",
+                    threshold=threshold,
+                    alarm_description=f"{alarm_target}: {description}",
+                    dimensions=[
+                        cloudwatch.CfnAlarm.DimensionProperty(name=name, value=value)
+                        for name, value in dimensions.items()
+                    ],
+                    evaluation_periods=3,
+                )
+
+        for identifier in [account_service, api_service]:
+            ssm.StringParameter(
+                self,
+                f"/${identifier}-AWS_CACHE_ENDPOINT",
+                parameter_name=f"/{identifier}/{stage}/AWS_CACHE_ENDPOINT",
+                string_value=endpoint_address,
+            )
+            ssm.StringParameter(
+                self,
+                f"/${identifier}-AWS_CACHE_PORT",
+                parameter_name=f"/{identifier}/{stage}/AWS_CACHE_PORT",
+                string_value=endpoint_port,
+            )
@@ -12,6 +12,8 @@ from aws_cdk import (
 )
 from aws_cdk.aws_certificatemanager import Certificate
 from helper import config
+from helper import cloudfront as cloudfront_helper
+from helper import site_deployment
 
 
 class WebAdminStack(Stack):
@@ -105,6 +107,23 @@ class WebAdminStack(Stack):
             self, f"{bucket_name}-OAC", origin_access_control_config=web_oac_config
         )
 
+        web_origin = origins.S3Origin(
+            web_site_bucket,
+            origin_path=site_deployment.release_origin_path(self, conf, "web_admin"),
+            **cloudfront_helper.s3_origin_options(conf, "web_admin"),
+        )
+        # content-hashed assets never change under the same key
+        hashed_asset_behavior = cloudfront.BehaviorOptions(
+            allowed_methods=cloudfront.AllowedMethods.ALLOW_GET_HEAD_OPTIONS,
+            cached_methods=cloudfront.CachedMethods.CACHE_GET_HEAD_OPTIONS,
+            cache_policy=cloudfront_helper.asset_cache_policy(self, conf),
+            compress=True,
+            origin_request_policy=cloudfront.OriginRequestPolicy.CORS_S3_ORIGIN,
+            response_headers_policy=cloudfront.ResponseHeadersPolicy.CORS_ALLOW_ALL_ORIGINS,
+            viewer_protocol_policy=cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+            origin=web_origin,
+        )
+
         # create a distribution
         web_distribution = cloudfront.Distribution(
             self,
@@ -112,18 +131,28 @@ class WebAdminStack(Stack):
             default_behavior=cloudfront.BehaviorOptions(
                 allowed_methods=cloudfront.AllowedMethods.ALLOW_GET_HEAD_OPTIONS,
                 cached_methods=cloudfront.CachedMethods.CACHE_GET_HEAD_OPTIONS,
-                cache_policy=cloudfront.CachePolicy.CACHING_OPTIMIZED,
+                cache_policy=cloudfront_helper.html_cache_policy(self, conf),
                 compress=True,
                 origin_request_policy=cloudfront.OriginRequestPolicy.CORS_S3_ORIGIN,
                 response_headers_policy=cloudfront.ResponseHeadersPolicy.CORS_ALLOW_ALL_ORIGINS,
                 viewer_protocol_policy=cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
-                origin=origins.S3Origin(web_site_bucket),
+                function_associations=cloudfront_helper.spa_function_associations(
+                    self, conf
+                ),
+                origin=web_origin,
             ),
+            additional_behaviors={
+                path_pattern: hashed_asset_behavior
+                for path_pattern in cloudfront_helper.site_cache_settings(conf)[
+                    "hashed_asset_paths"
+                ]
+            },
             domain_names=[web_admin_domain],
             default_root_object="index.html",
             price_class=cloudfront.PriceClass.PRICE_CLASS_100,
             web_acl_id=waf_web_acl_id,
             certificate=tls_certificate,
+            **cloudfront_helper.distribution_protocol_options(conf),
         )
 
         web_oac_bucket_statement = iam.PolicyStatement(
@@ -203,18 +232,23 @@ class WebAdminStack(Stack):
             "DistributionConfig.Origins.0.OriginAccessControlId", web_oac.ref
         )
 
+        site_deployment.site_bucket_deployment(
+            self, conf, "web_admin", web_site_bucket, web_distribution
+        )
+
         r53.CfnRecordSetGroup(
             self,
             "web-admin-A-Record",
             record_sets=[
                 r53.CfnRecordSetGroup.RecordSetProperty(
                     name=web_admin_domain,
-                    type="A",
+                    type=record_type,
                     alias_target=r53.CfnRecordSetGroup.AliasTargetProperty(
                         hosted_zone_id="Z2FDTNDATAQYW2",  # for china region Z3RFFRIM2A3IF5
                         dns_name=web_distribution.distribution_domain_name,
                     ),
                 )
+                for record_type in cloudfront_helper.alias_record_types(conf)
             ],
             hosted_zone_id=my_hosted_zone.hosted_zone_id,
         )
@@ -125,6 +125,29 @@ class IAMStack(Stack):
                     "Action": ["s3:ListAllMyBuckets", "s3:ListBucket"],
                     "Resource": "*",
                 },
+                {
+                    "Sid": "SiteDeployerExports",
+                    "Effect": "Allow",
+                    "Action": ["cloudformation:ListExports"],
+                    "Resource": "*",
+                },
+                {
+                    "Sid": "SiteReleaseSwitch",
+                    "Effect": "Allow",
+                    "Action": [
+                        "cloudfront:GetDistributionConfig",
+                        "cloudfront:UpdateDistribution",
+                    ],
+                    "Resource": "*",
+                },
+                {
+                    "Sid": "SiteReleasePointer",
+                    "Effect": "Allow",
+                    "Action": ["ssm:PutParameter", "ssm:GetParameter"],
+                    "Resource": [
+                        f"arn:aws:ssm:{region}:{account_id}:parameter/web-*/{stage}/ACTIVE_RELEASE_PATH",
+                    ],
+                },
             ],
         }
         cicd_policy_document = iam.PolicyDocument.from_json(CICD_STATEMENT_JSON)
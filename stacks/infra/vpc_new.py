@@ -101,6 +101,12 @@ class VPCStack(Stack):
                 "Name",
                 f"{project_name}-{subnet_type}-{availability_zone[-1]}",
             )
+        # private2 tier hosts the data services, e.g. the cache
+        self.private2_subnet_ids = [
+            vpc_tiers_objs[subnet_name].subnet_id
+            for subnet_name, subnet_details in vpc_tiers.items()
+            if subnet_details[0] == "private2"
+        ]
         # # create a VPC Peering to Tooling Account
         # self.vpc_peering_tooling = ec2.CfnVPCPeeringConnection(
         #     self,
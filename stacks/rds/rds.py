@@ -1,8 +1,20 @@
 """Import Module."""
 import aws_cdk as core
-from aws_cdk import aws_iam as iam, aws_ec2 as ec2, aws_rds as rds, Stack
+from aws_cdk import (
+    aws_iam as iam,
+    aws_ec2 as ec2,
+    aws_rds as rds,
+    aws_ssm as ssm,
+    aws_route53 as r53,
+    aws_cloudwatch as cloudwatch,
+    aws_logs as logs,
+    Stack,
+)
 from constructs import Construct
 from helper import config
+from helper import postgres_tuning
+from helper import rds_sizing
+from helper import rds_storage
 
 
 class RDSStack(Stack):
@@ -14,6 +26,7 @@ class RDSStack(Stack):
         construct_id: str,
         vpc,
         jump_sec_group: ec2.SecurityGroup,
+        ecs_sec_group: ec2.SecurityGroup = None,
         **kwargs,
     ) -> None:
         super().__init__(scope, construct_id, **kwargs)
@@ -26,9 +39,16 @@ class RDSStack(Stack):
         tooling_cidr_block = conf.get("tooling_cidr_block")
         api_service = conf.get("api_service_name")
         account_service = conf.get("account_service_name")
-        instance_type = conf.get("instance_type")
         rds_certification = conf.get("rds_certification")
-        is_enabled_multiaz = conf.get("is_enabled_multiaz")
+        stage = conf.get("stage")
+        rds_databases = conf.get("rds_databases")
+        rds_proxy = conf.get("rds_proxy")
+        project_name = conf.get("project_name")
+        replica_lag_threshold = conf.get("rds_replica_lag_threshold")
+        rds_tuning = conf.get("rds_tuning")
+        rds_log_retention_days = conf.get("rds_log_retention_days")
+        engine = conf.get("engine")
+        aurora_engine_version = conf.get("aurora_engine_version")
         # Create database security group for rds
         self.database_sec_group = ec2.SecurityGroup(
             self, "rds-sg", vpc=vpc, allow_all_outbound=False
@@ -64,40 +84,474 @@ class RDSStack(Stack):
             ],
         )
 
-        # create RDS parameter group
-        postgres_parameter_group = rds.CfnDBParameterGroup(
+        def create_parameter_group(identifier, instance_class, database):
+            """postgres15 parameter group tuned for one service and instance class"""
+            return rds.CfnDBParameterGroup(
+                self,
+                f"{identifier}-postgres-parameter-group",
+                family="postgres15",
+                description=f"postgres15 {database['workload']} profile for {identifier} on {instance_class}",
+                parameters=postgres_tuning.tuned_parameters(
+                    instance_class,
+                    workload=database["workload"],
+                    auto_explain_min_duration=rds_tuning["auto_explain_min_duration"],
+                    log_min_duration_statement=rds_tuning["log_min_duration_statement"],
+                    # environment overrides first, service overrides win
+                    overrides={
+                        **rds_tuning.get("parameter_overrides", {}),
+                        **database.get("parameter_overrides", {}),
+                    },
+                ),
+            )
+
+        def create_postgresql_log_group(db_instance_identifier, kind="instance"):
+            """Log group RDS exports postgresql logs to, with a slow-query count"""
+            log_group = logs.CfnLogGroup(
+                self,
+                f"{db_instance_identifier}-postgresql-log-group",
+                log_group_name=f"/aws/rds/{kind}/{db_instance_identifier}/postgresql",
+                retention_in_days=rds_log_retention_days,
+            )
+            # statements over log_min_duration_statement, auto_explain plans excluded
+            logs.CfnMetricFilter(
+                self,
+                f"{db_instance_identifier}-slow-query-filter",
+                log_group_name=log_group.ref,
+                filter_pattern='"duration:" -"plan:"',
+                metric_transformations=[
+                    logs.CfnMetricFilter.MetricTransformationProperty(
+                        metric_namespace=f"{project_name}/RDS",
+                        metric_name=f"{db_instance_identifier}-SlowQueryCount",
+                        metric_value="1",
+                        default_value=0,
+                    )
+                ],
+            )
+            return log_group
+
+        # ECS tasks reach a proxied database only through its proxy, with IAM auth
+        direct_access = [
+            identifier
+            for identifier in [account_service, api_service]
+            if not rds_databases[identifier].get("is_enabled_proxy", False)
+            # Aurora readers share the cluster security group with the writer
+            or (
+                engine == "aurora-postgresql"
+                and rds_databases[identifier]["aurora"]["reader_count"]
+            )
+        ]
+        if ecs_sec_group is not None and direct_access:
+            self.database_sec_group.add_ingress_rule(
+                ecs_sec_group, ec2.Port.tcp(5432), "Allow ECS RDS Access"
+            )
+        replica_resources = []
+
+        def replica_sec_group():
+            """Shared by the read replicas, created with the first one"""
+            if not replica_resources:
+                # RDS Proxy cannot front RDS read replicas, reads go to them directly
+                sec_group = ec2.SecurityGroup(
+                    self, "rds-replica-sg", vpc=vpc, allow_all_outbound=False
+                )
+                sec_group.add_ingress_rule(
+                    jump_sec_group, ec2.Port.tcp(5432), "Allow isolated sg RDS Access "
+                )
+                sec_group.add_ingress_rule(
+                    ec2.Peer.ipv4(tooling_cidr_block),
+                    ec2.Port.tcp(5432),
+                    "Allow tooling subnet RDS Access ",
+                )
+                if ecs_sec_group is not None:
+                    sec_group.add_ingress_rule(
+                        ecs_sec_group, ec2.Port.tcp(5432), "Allow ECS RDS Reader Access"
+                    )
+                replica_resources.append(sec_group)
+            return replica_resources[0]
+
+        proxy_resources = []
+
+        def proxy_sec_group_and_role():
+            """Shared by the proxies, created with the first one"""
+            if not proxy_resources:
+                # RDS Proxy security group, ECS tasks connect through the proxy
+                proxy_sec_group = ec2.SecurityGroup(
+                    self, "rds-proxy-sg", vpc=vpc, allow_all_outbound=False
+                )
+                self.database_sec_group.connections.allow_from(
+                    proxy_sec_group, ec2.Port.tcp(5432), "Allow RDS Proxy Access"
+                )
+                if ecs_sec_group is not None:
+                    proxy_sec_group.add_ingress_rule(
+                        ecs_sec_group, ec2.Port.tcp(5432), "Allow ECS RDS Proxy Access"
+                    )
+                # role the proxy uses to read the managed master user secrets
+                proxy_role = iam.Role(
+                    self,
+                    "RDSProxyRole",
+                    assumed_by=iam.ServicePrincipal("rds.amazonaws.com"),
+                )
+                proxy_resources.extend([proxy_sec_group, proxy_role])
+            return proxy_resources
+
+        # ECS tasks run with the role exported as task-execution-role-arn
+        ecs_task_role = iam.Role.from_role_arn(
+            self,
+            "ECSTaskRole",
+            core.Fn.import_value("task-execution-role-arn"),
+            mutable=False,
+        )
+        proxy_connect_arns = []
+        # private zone for the per-service reader endpoints
+        rds_private_zone = r53.PrivateHostedZone(
             self,
-            "postgres-parameter-group",
-            family="postgres15",
-            description="postgres15 parameter group",
+            "rds-private-zone",
+            zone_name=f"rds.{project_name}.internal",
+            vpc=vpc,
         )
 
-        db_instance_identifiers = [account_service, api_service]
-        for identifier in db_instance_identifiers:
-            rds.CfnDBInstance(
+        def create_reader_records(identifier, reader_addresses):
+            """Weighted reader record spreading reads over the given addresses"""
+            reader_endpoint = f"{identifier}-reader.{rds_private_zone.zone_name}"
+            for index, address in enumerate(reader_addresses, start=1):
+                r53.CfnRecordSet(
+                    self,
+                    f"{identifier}-reader-record-{index}",
+                    hosted_zone_id=rds_private_zone.hosted_zone_id,
+                    name=reader_endpoint,
+                    type="CNAME",
+                    ttl="5",
+                    set_identifier=f"{identifier}-reader-{index}",
+                    weight=1,
+                    resource_records=[address],
+                )
+            return reader_endpoint
+
+        def create_instance_database(identifier, database):
+            """RDS for PostgreSQL primary with optional read replicas"""
+            instance_type = database["instance_type"]
+            # enhanced monitoring is off with an interval of 0
+            monitoring_role = (
+                monitoring_role_arn.role_arn
+                if database["monitoring_interval"]
+                else None
+            )
+            postgres_parameter_group = create_parameter_group(
+                identifier, instance_type, database
+            )
+            report, is_capped = rds_storage.storage_report(
+                identifier, instance_type, database["storage"]
+            )
+            core.Annotations.of(self).add_info(report)
+            if is_capped:
+                core.Annotations.of(self).add_warning(
+                    f"{identifier}: provisioned storage performance exceeds what {instance_type} can use"
+                )
+            log_group = create_postgresql_log_group(f"{identifier}-rds-instance")
+            db_instance = rds.CfnDBInstance(
                 self,
                 f"{identifier}-rds-instance",
                 engine="postgres",
                 engine_version="15",
                 ca_certificate_identifier=rds_certification,
-                multi_az=is_enabled_multiaz,
                 auto_minor_version_upgrade=True,
                 db_subnet_group_name=rds_subnet_group.db_subnet_group_name,
                 db_instance_identifier=f"{identifier}-rds-instance",
                 db_parameter_group_name=postgres_parameter_group.ref,
-                db_instance_class=instance_type,
                 vpc_security_groups=[self.database_sec_group.security_group_id],
-                allocated_storage="20",
+                **rds_sizing.instance_properties(identifier, database),
+                **rds_storage.storage_properties(identifier, database["storage"]),
                 db_name=f"{identifier.replace('-','_')}_db",
                 publicly_accessible=False,
                 storage_encrypted=True,
                 deletion_protection=True,
-                preferred_maintenance_window="Mon:12:58-Mon:13:28",
-                preferred_backup_window="07:16-07:46",
                 enable_performance_insights=True,
                 performance_insights_retention_period=7,
-                monitoring_interval=30,
-                monitoring_role_arn=monitoring_role_arn.role_arn,
+                monitoring_role_arn=monitoring_role,
                 manage_master_user_password=True,
                 master_username="superadmin",
+                enable_cloudwatch_logs_exports=["postgresql"],
+            )
+            db_instance.add_dependency(log_group)
+
+            # read replicas, reached through a weighted reader record
+            replicas = []
+            replica_count = database.get("read_replica_count", 0)
+            replica_parameter_group = postgres_parameter_group
+            if (
+                replica_count
+                and database["read_replica_instance_type"] != instance_type
+            ):
+                # memory settings follow the replica class, not the primary's
+                replica_parameter_group = create_parameter_group(
+                    f"{identifier}-replica",
+                    database["read_replica_instance_type"],
+                    database,
+                )
+            for replica_number in range(1, replica_count + 1):
+                replica_identifier = f"{identifier}-rds-replica-{replica_number}"
+                replica_log_group = create_postgresql_log_group(replica_identifier)
+                replica = rds.CfnDBInstance(
+                    self,
+                    replica_identifier,
+                    source_db_instance_identifier=db_instance.ref,
+                    db_instance_identifier=replica_identifier,
+                    db_instance_class=database["read_replica_instance_type"],
+                    ca_certificate_identifier=rds_certification,
+                    auto_minor_version_upgrade=True,
+                    db_parameter_group_name=replica_parameter_group.ref,
+                    vpc_security_groups=[replica_sec_group().security_group_id],
+                    publicly_accessible=False,
+                    deletion_protection=True,
+                    enable_performance_insights=True,
+                    performance_insights_retention_period=7,
+                    monitoring_interval=database["monitoring_interval"],
+                    monitoring_role_arn=monitoring_role,
+                    enable_cloudwatch_logs_exports=["postgresql"],
+                )
+                replica.add_dependency(replica_log_group)
+                cloudwatch.CfnAlarm(
+                    self,
+                    f"{replica_identifier}-replica-lag",
+                    alarm_name=f"{replica_identifier}-replica-lag",
+                    comparison_operator="GreaterThanThreshold",
+                    metric_name="ReplicaLag",
+                    namespace="AWS/RDS",
+                    period=60,
+                    statistic="Maximum",
+                    threshold=replica_lag_threshold,
+                    alarm_description=f"{replica_identifier} lags more than {replica_lag_threshold}s behind the primary",
+                    dimensions=[
+                        cloudwatch.CfnAlarm.DimensionProperty(
+                            name="DBInstanceIdentifier", value=replica.ref
+                        )
+                    ],
+                    evaluation_periods=5,
+                )
+                replicas.append(replica)
+
+            return {
+                "endpoint": db_instance.attr_endpoint_address,
+                # reads are spread over the replicas through a weighted record
+                "reader_endpoint": (
+                    create_reader_records(
+                        identifier,
+                        [replica.attr_endpoint_address for replica in replicas],
+                    )
+                    if replicas
+                    else None
+                ),
+                "secret_arn": db_instance.attr_master_user_secret_secret_arn,
+                "proxy_targets": {"db_instance_identifiers": [db_instance.ref]},
+            }
+
+        def create_aurora_database(identifier, database):
+            """Aurora PostgreSQL Serverless v2 cluster, a writer and optional readers"""
+            aurora = database["aurora"]
+            rds_sizing.validate_sizing(identifier, database)
+            cluster_identifier = f"{identifier}-aurora-cluster"
+            # tuned settings follow the ACUs, the cluster group only sets logging
+            cluster_parameter_group = rds.CfnDBClusterParameterGroup(
+                self,
+                f"{identifier}-aurora-parameter-group",
+                family=f"aurora-postgresql{aurora_engine_version.split('.')[0]}",
+                description=f"aurora-postgresql logging profile for {identifier}",
+                parameters=postgres_tuning.aurora_cluster_parameters(
+                    auto_explain_min_duration=rds_tuning["auto_explain_min_duration"],
+                    log_min_duration_statement=rds_tuning["log_min_duration_statement"],
+                    overrides={
+                        **rds_tuning.get("parameter_overrides", {}),
+                        **database.get("parameter_overrides", {}),
+                    },
+                ),
+            )
+            log_group = create_postgresql_log_group(cluster_identifier, kind="cluster")
+            cluster = rds.CfnDBCluster(
+                self,
+                cluster_identifier,
+                engine="aurora-postgresql",
+                engine_version=aurora_engine_version,
+                db_cluster_identifier=cluster_identifier,
+                db_cluster_parameter_group_name=cluster_parameter_group.ref,
+                db_subnet_group_name=rds_subnet_group.ref,
+                vpc_security_group_ids=[self.database_sec_group.security_group_id],
+                serverless_v2_scaling_configuration=rds.CfnDBCluster.ServerlessV2ScalingConfigurationProperty(
+                    **rds_sizing.serverless_scaling(identifier, aurora)
+                ),
+                database_name=f"{identifier.replace('-','_')}_db",
+                storage_encrypted=True,
+                deletion_protection=True,
+                backup_retention_period=database["backup_retention_period"],
+                preferred_backup_window=database["preferred_backup_window"],
+                preferred_maintenance_window=database["preferred_maintenance_window"],
+                manage_master_user_password=True,
+                master_username="superadmin",
+                enable_cloudwatch_logs_exports=["postgresql"],
+            )
+            cluster.add_dependency(log_group)
+            # enhanced monitoring is off with an interval of 0
+            monitoring_role = (
+                monitoring_role_arn.role_arn
+                if database["monitoring_interval"]
+                else None
+            )
+            writer = None
+            for reader_number in range(aurora["reader_count"] + 1):
+                # the first instance becomes the writer; readers in promotion
+                # tier 0-1 scale with it so a failover lands on a warm reader
+                instance_identifier = (
+                    f"{identifier}-aurora-reader-{reader_number}"
+                    if reader_number
+                    else f"{identifier}-aurora-writer"
+                )
+                instance = rds.CfnDBInstance(
+                    self,
+                    instance_identifier,
+                    engine="aurora-postgresql",
+                    db_cluster_identifier=cluster.ref,
+                    db_instance_identifier=instance_identifier,
+                    db_instance_class="db.serverless",
+                    ca_certificate_identifier=rds_certification,
+                    auto_minor_version_upgrade=True,
+                    promotion_tier=1 if reader_number else 0,
+                    publicly_accessible=False,
+                    enable_performance_insights=True,
+                    performance_insights_retention_period=7,
+                    monitoring_interval=database["monitoring_interval"],
+                    monitoring_role_arn=monitoring_role,
+                )
+                if writer is None:
+                    writer = instance
+                    continue
+                instance.add_dependency(writer)
+                cloudwatch.CfnAlarm(
+                    self,
+                    f"{instance_identifier}-replica-lag",
+                    alarm_name=f"{instance_identifier}-replica-lag",
+                    comparison_operator="GreaterThanThreshold",
+                    metric_name="AuroraReplicaLag",
+                    namespace="AWS/RDS",
+                    period=60,
+                    statistic="Maximum",
+                    # AuroraReplicaLag is reported in milliseconds
+                    threshold=replica_lag_threshold * 1000,
+                    alarm_description=f"{instance_identifier} lags more than {replica_lag_threshold}s behind the writer",
+                    dimensions=[
+                        cloudwatch.CfnAlarm.DimensionProperty(
+                            name="DBInstanceIdentifier", value=instance.ref
+                        )
+                    ],
+                    evaluation_periods=5,
+                )
+            return {
+                "endpoint": cluster.attr_endpoint_address,
+                "reader_endpoint": (
+                    cluster.attr_read_endpoint_address
+                    if aurora["reader_count"]
+                    else None
+                ),
+                "secret_arn": cluster.attr_master_user_secret_secret_arn,
+                "proxy_targets": {"db_cluster_identifiers": [cluster.ref]},
+            }
+
+        for identifier in [account_service, api_service]:
+            database = rds_databases[identifier]
+            if engine == "aurora-postgresql":
+                outputs = create_aurora_database(identifier, database)
+            else:
+                outputs = create_instance_database(identifier, database)
+            ssm.StringParameter(
+                self,
+                f"/${identifier}-AWS_RDS_ENDPOINT",
+                parameter_name=f"/{identifier}/{stage}/AWS_RDS_ENDPOINT",
+                string_value=outputs["endpoint"],
+            )
+            ssm.StringParameter(
+                self,
+                f"/${identifier}-AWS_RDS_SECRET_ARN",
+                parameter_name=f"/{identifier}/{stage}/AWS_RDS_SECRET_ARN",
+                string_value=outputs["secret_arn"],
+            )
+
+            proxy_endpoint = None
+            if database.get("is_enabled_proxy", False):
+                proxy_sec_group, proxy_role = proxy_sec_group_and_role()
+                proxy_role.add_to_policy(
+                    iam.PolicyStatement(
+                        actions=["secretsmanager:GetSecretValue"],
+                        resources=[outputs["secret_arn"]],
+                    )
+                )
+                db_proxy = rds.CfnDBProxy(
+                    self,
+                    f"{identifier}-rds-proxy",
+                    db_proxy_name=f"{identifier}-rds-proxy",
+                    engine_family="POSTGRESQL",
+                    role_arn=proxy_role.role_arn,
+                    vpc_subnet_ids=private_subnets_ids,
+                    vpc_security_group_ids=[proxy_sec_group.security_group_id],
+                    require_tls=rds_proxy["require_tls"],
+                    idle_client_timeout=rds_proxy["idle_client_timeout"],
+                    auth=[
+                        rds.CfnDBProxy.AuthFormatProperty(
+                            auth_scheme="SECRETS",
+                            iam_auth="REQUIRED",
+                            secret_arn=outputs["secret_arn"],
+                        )
+                    ],
+                )
+                db_proxy.node.add_dependency(proxy_role)
+                rds.CfnDBProxyTargetGroup(
+                    self,
+                    f"{identifier}-rds-proxy-target-group",
+                    db_proxy_name=db_proxy.ref,
+                    target_group_name="default",
+                    **outputs["proxy_targets"],
+                    connection_pool_configuration_info=rds.CfnDBProxyTargetGroup.ConnectionPoolConfigurationInfoFormatProperty(
+                        connection_borrow_timeout=rds_proxy[
+                            "connection_borrow_timeout"
+                        ],
+                        max_connections_percent=rds_proxy["max_connections_percent"],
+                        max_idle_connections_percent=rds_proxy[
+                            "max_idle_connections_percent"
+                        ],
+                        session_pinning_filters=rds_proxy["session_pinning_filters"],
+                    ),
+                )
+                # prx-xxxx resource id from arn:aws:rds:<region>:<account>:db-proxy:prx-xxxx
+                proxy_resource_id = core.Fn.select(
+                    6, core.Fn.split(":", db_proxy.attr_db_proxy_arn)
+                )
+                proxy_connect_arns.append(
+                    f"arn:aws:rds-db:{self.region}:{self.account}:dbuser:{proxy_resource_id}/*"
+                )
+                ssm.StringParameter(
+                    self,
+                    f"/${identifier}-AWS_RDS_PROXY_ENDPOINT",
+                    parameter_name=f"/{identifier}/{stage}/AWS_RDS_PROXY_ENDPOINT",
+                    string_value=db_proxy.attr_endpoint,
+                )
+                proxy_endpoint = db_proxy.attr_endpoint
+
+            # without readers, reads go to the proxy or, when not proxied, the primary
+            reader_endpoint = outputs["reader_endpoint"] or create_reader_records(
+                identifier, [proxy_endpoint or outputs["endpoint"]]
+            )
+            ssm.StringParameter(
+                self,
+                f"/${identifier}-AWS_RDS_READER_ENDPOINT",
+                parameter_name=f"/{identifier}/{stage}/AWS_RDS_READER_ENDPOINT",
+                string_value=reader_endpoint,
+            )
+
+        if proxy_connect_arns:
+            # IAM authentication from the ECS tasks to the proxies
+            iam.ManagedPolicy(
+                self,
+                "RDSProxyConnectPolicy",
+                roles=[ecs_task_role],
+                statements=[
+                    iam.PolicyStatement(
+                        actions=["rds-db:connect"], resources=proxy_connect_arns
+                    )
+                ],
             )
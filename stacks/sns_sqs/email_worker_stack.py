@@ -0,0 +1,109 @@
+"""Import Module."""
+import aws_cdk as core
+from aws_cdk import (
+    Stack,
+    aws_iam as iam,
+    aws_lambda as lambda_,
+    aws_lambda_event_sources as event_sources,
+    aws_sqs as sqs,
+    aws_dynamodb as dynamodb,
+)
+from constructs import Construct
+from helper import config
+from helper import messaging
+from helper import messaging_topology
+
+
+class EmailWorkerStack(Stack):
+    """Class to create the Lambda that sends the email queue through SES"""
+
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        topology: dict,
+        queue: sqs.IQueue,
+        low_priority_queue: sqs.IQueue = None,
+        idempotency_table: dynamodb.ITable = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        conf = config.Config(self.node.try_get_context("environment"))
+        project_name = conf.get("project_name")
+        stage = conf.get("stage")
+        service_name = conf.get("email_service_name")
+        queue_ref = messaging_topology.topic_ref(
+            service_name, messaging_topology.DEFAULT_KEY
+        )
+        lane_settings = {
+            ref: messaging.queue_settings(
+                conf, service_name, topology["queues"][ref]["settings"]
+            )
+            for ref in [queue_ref, queue_ref + messaging_topology.LOW_PRIORITY_SUFFIX]
+            if ref in topology["queues"]
+        }
+        email_worker = messaging.email_worker_settings(
+            conf,
+            lane_settings[queue_ref],
+            lane_settings.get(queue_ref + messaging_topology.LOW_PRIORITY_SUFFIX)
+            if low_priority_queue
+            else None,
+        )
+
+        environment = {
+            "FROM_ADDRESS": email_worker["from_address"],
+            "SES_MAX_SEND_RATE": str(email_worker["ses_max_send_rate"]),
+            "MAX_CONCURRENCY": str(email_worker["total_concurrency"]),
+        }
+        if idempotency_table:
+            environment.update(
+                {
+                    "IDEMPOTENCY_TABLE": idempotency_table.table_name,
+                    "IDEMPOTENCY_TTL_SECONDS": str(
+                        messaging.idempotency_ttl_seconds(lane_settings.values())
+                    ),
+                    # a claim outlives the invocation that made it
+                    "LEASE_SECONDS": str(email_worker["timeout"]),
+                }
+            )
+        worker_function = lambda_.Function(
+            self,
+            "email-worker-function",
+            function_name=f"{project_name}-email-worker-{stage}",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="index.handler",
+            code=lambda_.Code.from_asset("lambdas/email_worker"),
+            timeout=core.Duration.seconds(email_worker["timeout"]),
+            memory_size=email_worker["memory_size"],
+            reserved_concurrent_executions=email_worker["reserved_concurrency"],
+            environment=environment,
+        )
+        if idempotency_table:
+            idempotency_table.grant_read_write_data(worker_function)
+        # pollers scale with the backlog up to maximum_concurrency, and only
+        # the failed messages of a batch are retried; each priority lane
+        # scales on its own, so bulk mail cannot take the interactive pollers
+        lanes = [(queue, email_worker["maximum_concurrency"])]
+        if low_priority_queue:
+            lanes.append(
+                (low_priority_queue, email_worker["low_priority_maximum_concurrency"])
+            )
+        for lane_queue, max_concurrency in lanes:
+            worker_function.add_event_source(
+                event_sources.SqsEventSource(
+                    lane_queue,
+                    batch_size=email_worker["batch_size"],
+                    max_batching_window=core.Duration.seconds(
+                        email_worker["max_batching_window"]
+                    ),
+                    max_concurrency=max_concurrency,
+                    report_batch_item_failures=True,
+                )
+            )
+        worker_function.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["ses:SendEmail", "ses:SendRawEmail"],
+                resources=[f"arn:aws:ses:{self.region}:{self.account}:identity/*"],
+            )
+        )
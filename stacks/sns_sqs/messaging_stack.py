@@ -0,0 +1,460 @@
+"""Import Module."""
+from constructs import Construct
+from aws_cdk import (
+    Stack,
+    aws_sns as sns,
+    aws_sqs as sqs,
+    aws_ssm as ssm,
+    aws_iam as iam,
+    aws_kinesis as kinesis,
+    aws_s3 as s3,
+    aws_cloudwatch as cloudwatch,
+    aws_dynamodb as dynamodb,
+    aws_glue as glue,
+)
+import aws_cdk as core
+from helper import config
+from helper import messaging
+from helper import messaging_topology
+
+
+class ServiceMessagingStack(Stack):
+    """Class to create the topics, queues, streams and stores of a service"""
+
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        service_name: str,
+        topology: dict,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        # Declare vars
+        conf = config.Config(self.node.try_get_context("environment"))
+        project_name = conf.get("project_name")
+        stage = conf.get("stage")
+        self.topics = {}
+        self.queues = {}
+        self.streams = {}
+        self.schemas = {}
+        self.lane_alarms = {}
+
+        def construct_id_for(key, name):
+            # the default key keeps the construct ids of the original stacks
+            if key == messaging_topology.DEFAULT_KEY:
+                return name
+            return f"{key}-{name}"
+
+        def parameter(kind, key, value):
+            suffix = messaging_topology.parameter_suffix(kind, key)
+            parameter_id = suffix
+            if kind == "topic" and key == messaging_topology.DEFAULT_KEY:
+                parameter_id = "SSM_SNS_TOPIC_ARN"
+            service_parameter(service_name, parameter_id, suffix, value)
+
+        def service_parameter(owner, parameter_id, suffix, value):
+            ssm.StringParameter(
+                self,
+                f"/${owner}-{parameter_id}",
+                parameter_name=f"/{owner}/{stage}/{suffix}",
+                string_value=value,
+            )
+
+        task_roles = []
+
+        def task_role():
+            # ECS tasks run with the role exported as task-execution-role-arn
+            if not task_roles:
+                task_roles.append(
+                    iam.Role.from_role_arn(
+                        self,
+                        "ECSTaskRole",
+                        core.Fn.import_value("task-execution-role-arn"),
+                        mutable=False,
+                    )
+                )
+            return task_roles[0]
+
+        # create sns topics
+        for ref, topic in messaging_topology.service_topics(
+            topology, service_name
+        ).items():
+            key = topic["key"]
+            fifo = topic["fifo"]
+            self.topics[ref] = sns.Topic(
+                self,
+                construct_id_for(key, "SNSTopic"),
+                topic_name=messaging.fifo_name(
+                    f"{project_name}-{service_name}-{key}", fifo
+                ),
+                display_name=f"{project_name}-{service_name}-{key}",
+                **messaging.topic_fifo_options(fifo),
+            )
+            parameter("topic", key, self.topics[ref].topic_arn)
+            if fifo:
+                if fifo["is_enabled_high_throughput"]:
+                    # not in this CDK version's CfnTopic
+                    self.topics[ref].node.default_child.add_property_override(
+                        "FifoThroughputScope", "MessageGroup"
+                    )
+                # the field producers use as MessageGroupId
+                parameter("topic_message_group", key, fifo["message_group_id"])
+
+        # schema registry of the service, a schema per topic with one
+        schema_topics = {
+            ref: topic
+            for ref, topic in messaging_topology.service_topics(
+                topology, service_name
+            ).items()
+            if topic["schema"] is not None
+        }
+        self.schema_registry = None
+        if schema_topics:
+            self.schema_registry = glue.CfnRegistry(
+                self,
+                "SchemaRegistry",
+                name=f"{project_name}-{service_name}-events",
+                description=f"Event schemas of {service_name}",
+            )
+            parameter_id = "AWS_GLUE_SCHEMA_REGISTRY_ARN"
+            service_parameter(
+                service_name,
+                parameter_id,
+                parameter_id,
+                self.schema_registry.attr_arn,
+            )
+        for ref, topic in schema_topics.items():
+            key = topic["key"]
+            schema_settings = messaging.schema_settings(
+                conf, service_name, key, topic["schema"]
+            )
+            self.schemas[ref] = glue.CfnSchema(
+                self,
+                construct_id_for(key, "EventSchema"),
+                name=f"{project_name}-{service_name}-{key}",
+                registry=glue.CfnSchema.RegistryProperty(
+                    arn=self.schema_registry.attr_arn
+                ),
+                data_format=schema_settings["data_format"],
+                # checked when producers register a new version
+                compatibility=schema_settings["compatibility"],
+                schema_definition=messaging.schema_definition(schema_settings),
+            )
+            parameter("schema", key, self.schemas[ref].attr_arn)
+        if schema_topics:
+            # producers register versions, consumers look them up by the id
+            # carried in each message
+            iam.ManagedPolicy(
+                self,
+                "SchemaRegistryPolicy",
+                roles=[task_role()],
+                statements=[
+                    iam.PolicyStatement(
+                        actions=[
+                            "glue:GetRegistry",
+                            "glue:GetSchema",
+                            "glue:GetSchemaByDefinition",
+                            "glue:RegisterSchemaVersion",
+                            "glue:PutSchemaVersionMetadata",
+                            "glue:QuerySchemaVersionMetadata",
+                        ],
+                        resources=[
+                            self.schema_registry.attr_arn,
+                            *[schema.attr_arn for schema in self.schemas.values()],
+                        ],
+                    ),
+                    # a lookup by schema version id names no registry or schema
+                    iam.PolicyStatement(
+                        actions=["glue:GetSchemaVersion"], resources=["*"]
+                    ),
+                ],
+            )
+
+        # create kinesis streams, with an enhanced fan-out consumer per service
+        # so each reads its own 2 MB/s per shard
+        for ref, stream in messaging_topology.service_streams(
+            topology, service_name
+        ).items():
+            key = stream["key"]
+            self.streams[ref] = kinesis.Stream(
+                self,
+                f"{key}-KinesisStream",
+                stream_name=f"{project_name}-{service_name}-{key}",
+                **messaging.stream_options(
+                    messaging.stream_settings(conf, service_name, stream["settings"])
+                ),
+            )
+            parameter("stream", key, self.streams[ref].stream_arn)
+            for consumer in stream["consumers"]:
+                stream_consumer = kinesis.CfnStreamConsumer(
+                    self,
+                    f"{key}-{consumer}-StreamConsumer",
+                    consumer_name=consumer,
+                    stream_arn=self.streams[ref].stream_arn,
+                )
+                # under the consumer, which reads with SubscribeToShard
+                suffix = messaging_topology.consumer_parameter_suffix(service_name, key)
+                service_parameter(
+                    consumer, suffix, suffix, stream_consumer.attr_consumer_arn
+                )
+
+        # create sqs queues, each with its DLQ
+        idempotency_retention = {}
+        for ref, queue in messaging_topology.service_queues(
+            topology, service_name
+        ).items():
+            key = queue["key"]
+            fifo = queue["fifo"]
+            queue_settings = messaging.queue_settings(
+                conf, service_name, queue["settings"]
+            )
+            dlq = sqs.Queue(
+                self,
+                construct_id_for(key, f"/${service_name}-MainDLQQueue"),
+                queue_name=messaging.fifo_name(
+                    f"{project_name}-{service_name}-{key}-dlq", fifo
+                ),
+                **messaging.dlq_options(queue_settings),
+                **messaging.queue_fifo_options(fifo, is_dead_letter_queue=True),
+            )
+            parameter("dlq", key, dlq.queue_url)
+            self.queues[ref] = sqs.Queue(
+                self,
+                construct_id_for(key, f"/${service_name}-EventQueue"),
+                queue_name=messaging.fifo_name(
+                    f"{project_name}-{service_name}-{key}-queue", fifo
+                ),
+                **messaging.event_queue_options(queue_settings, dlq),
+                **messaging.queue_fifo_options(fifo),
+            )
+            parameter("queue", key, self.queues[ref].queue_url)
+            if queue["lane"]:
+                # per-lane backlog age, what a lane consumer scales on
+                max_age = conf.get("priority_lanes")["max_age_alarm"][queue["lane"]]
+                self.lane_alarms[ref] = cloudwatch.Alarm(
+                    self,
+                    f"{key}-{queue['lane']}-lane-age-alarm",
+                    alarm_name=f"{project_name}-{service_name}-{key}-age",
+                    alarm_description=(
+                        f"{service_name} {queue['lane']} priority messages wait "
+                        f"over {max_age}s"
+                    ),
+                    metric=self.queues[ref].metric_approximate_age_of_oldest_message(
+                        period=core.Duration.minutes(1), statistic="Maximum"
+                    ),
+                    threshold=max_age,
+                    evaluation_periods=3,
+                    comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
+                )
+                # for the consumer's scaling policy or alerting to act on
+                parameter("age_alarm", key, self.lane_alarms[ref].alarm_arn)
+                parameter("age_alarm_name", key, self.lane_alarms[ref].alarm_name)
+            if fifo and fifo["message_group_id"]:
+                parameter("queue_message_group", key, fifo["message_group_id"])
+            if queue["is_enabled_idempotency_table"]:
+                idempotency_retention.setdefault(queue["base_key"], []).append(
+                    queue_settings
+                )
+
+        # idempotency tables, one per consumer queue and shared by its lanes:
+        # consumers record processed message ids to drop redeliveries
+        self.idempotency_tables = {}
+        for key, lane_settings in idempotency_retention.items():
+            ref = messaging_topology.topic_ref(service_name, key)
+            self.idempotency_tables[ref] = dynamodb.Table(
+                self,
+                construct_id_for(key, "IdempotencyTable"),
+                table_name=f"{project_name}-{service_name}-{key}-idempotency",
+                partition_key=dynamodb.Attribute(
+                    name="id", type=dynamodb.AttributeType.STRING
+                ),
+                billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+                encryption=dynamodb.TableEncryption.AWS_MANAGED,
+                time_to_live_attribute=messaging.IDEMPOTENCY_TTL_ATTRIBUTE,
+                removal_policy=core.RemovalPolicy.DESTROY,
+            )
+            parameter("idempotency_table", key, self.idempotency_tables[ref].table_name)
+            parameter(
+                "idempotency_ttl",
+                key,
+                str(messaging.idempotency_ttl_seconds(lane_settings)),
+            )
+        if self.idempotency_tables:
+            iam.ManagedPolicy(
+                self,
+                "IdempotencyTablePolicy",
+                roles=[task_role()],
+                statements=[
+                    iam.PolicyStatement(
+                        actions=[
+                            "dynamodb:GetItem",
+                            "dynamodb:PutItem",
+                            "dynamodb:UpdateItem",
+                            "dynamodb:DeleteItem",
+                            "dynamodb:ConditionCheckItem",
+                        ],
+                        resources=[
+                            table.table_arn
+                            for table in self.idempotency_tables.values()
+                        ],
+                    )
+                ],
+            )
+
+        # bucket for message bodies over the size limit, sent as pointers
+        self.payload_bucket = None
+        if service_name in topology["payload_offload"]:
+            expiration_days = messaging.payload_expiration_days(
+                [
+                    messaging.queue_settings(conf, queue["service"], queue["settings"])
+                    for queue in messaging_topology.payload_queues(
+                        topology, service_name
+                    ).values()
+                ]
+            )
+            self.payload_bucket = s3.Bucket(
+                self,
+                "payload-bucket",
+                bucket_name=f"{project_name}-{service_name}-payloads-{stage}",
+                encryption=s3.BucketEncryption.KMS_MANAGED,
+                bucket_key_enabled=True,
+                block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+                enforce_ssl=True,
+                lifecycle_rules=[
+                    s3.LifecycleRule(
+                        expiration=core.Duration.days(expiration_days),
+                        abort_incomplete_multipart_upload_after=core.Duration.days(1),
+                    )
+                ],
+            )
+            # producers write payloads, every consumer reads them; expiry
+            # deletes them, as a consumer cannot know it is the last reader
+            iam.ManagedPolicy(
+                self,
+                "PayloadBucketPolicy",
+                roles=[task_role()],
+                statements=[
+                    iam.PolicyStatement(
+                        actions=["s3:PutObject", "s3:AbortMultipartUpload"],
+                        resources=[self.payload_bucket.arn_for_objects("*")],
+                    ),
+                    iam.PolicyStatement(
+                        actions=["s3:GetObject"],
+                        resources=[self.payload_bucket.arn_for_objects("*")],
+                    ),
+                ],
+            )
+            parameter_id = "AWS_S3_PAYLOAD_BUCKET_NAME"
+            service_parameter(
+                service_name,
+                parameter_id,
+                parameter_id,
+                self.payload_bucket.bucket_name,
+            )
+            parameter_id = "AWS_S3_PAYLOAD_THRESHOLD_BYTES"
+            service_parameter(
+                service_name,
+                parameter_id,
+                parameter_id,
+                str(messaging.payload_threshold(conf)),
+            )
+
+        # attributes of the original per-service stacks
+        default_ref = messaging_topology.topic_ref(
+            service_name, messaging_topology.DEFAULT_KEY
+        )
+        self.sns_topic = self.topics.get(default_ref)
+        self.sqs_event_queue = self.queues.get(default_ref)
+        self.sqs_low_priority_queue = self.queues.get(
+            default_ref + messaging_topology.LOW_PRIORITY_SUFFIX
+        )
+        self.idempotency_table = self.idempotency_tables.get(default_ref)
+
+
+class MessagingSubscriptionsStack(Stack):
+    """Class to subscribe queues to the topics of a publishing service"""
+
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        service_name: str,
+        topology: dict,
+        topic_arns: dict,
+        queue_arns: dict,
+        **kwargs,
+    ) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        # Declare vars
+        conf = config.Config(self.node.try_get_context("environment"))
+        api_service = conf.get("api_service_name")
+        account_service = conf.get("account_service_name")
+        # the queue the original api/account subs stack subscribed keeps its
+        # construct ids: a new logical id would create the same subscription
+        # and policy, then delete them with the old one
+        legacy_queue_ref = {
+            api_service: f"{account_service}.{messaging_topology.DEFAULT_KEY}",
+            account_service: f"{api_service}.{messaging_topology.DEFAULT_KEY}",
+        }.get(service_name)
+        legacy_topic_ref = messaging_topology.topic_ref(
+            service_name, messaging_topology.DEFAULT_KEY
+        )
+
+        for queue_ref, queue in messaging_topology.subscription_queues(
+            topology, service_name
+        ).items():
+            is_legacy = queue_ref == legacy_queue_ref
+            # imported, so the subscriptions and policy stay in this stack and
+            # the service stacks do not reference each other
+            sqs_queue = sqs.Queue.from_queue_arn(
+                self,
+                "sqs-queue" if is_legacy else f"{queue_ref}-queue",
+                queue_arns[queue_ref],
+            )
+            # one policy per queue, a second QueuePolicy would replace the first;
+            # the original stacks both named theirs after the api service
+            policy = sqs.QueuePolicy(
+                self,
+                f"{api_service}-QueuePolicy"
+                if is_legacy
+                else f"{queue['service']}-{queue['key']}-QueuePolicy",
+                queues=[sqs_queue],
+            )
+            for subscription in queue["subscriptions"]:
+                topic = sns.Topic.from_topic_arn(
+                    self,
+                    "sns-topic"
+                    if is_legacy and subscription["topic"] == legacy_topic_ref
+                    else f"{queue_ref}-{subscription['topic']}-topic",
+                    topic_arns[subscription["topic"]],
+                )
+                topic_service = topology["topics"][subscription["topic"]]["service"]
+                overrides = {k: v for k, v in subscription.items() if k != "topic"}
+                subscription_construct = messaging.subscribe_queue(
+                    topic,
+                    sqs_queue,
+                    messaging.subscription_settings(
+                        conf,
+                        topic_service,
+                        queue["service"],
+                        overrides,
+                        lane=queue["lane"],
+                    ),
+                )
+                policy.document.add_statements(
+                    iam.PolicyStatement(
+                        actions=["SQS:SendMessage"],
+                        effect=iam.Effect.ALLOW,
+                        principals=[iam.ServicePrincipal("sns.amazonaws.com")],
+                        conditions={
+                            "ArnEquals": {
+                                "aws:SourceArn": topic_arns[subscription["topic"]]
+                            }
+                        },
+                        resources=[queue_arns[queue_ref]],
+                    )
+                )
+                subscription_construct.node.add_dependency(policy)
@@ -0,0 +1,68 @@
+"""In-memory AWS stand-ins and helpers shared by the unit test modules."""
+import hashlib
+
+
+class Conf(dict):
+    """Dict standing in for helper.config.Config."""
+
+
+class LocalS3:
+    """In-memory S3 stand-in computing ETags the way S3 does."""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.put_calls = 0
+
+    def list_objects_v2(self, Bucket, Prefix="", ContinuationToken=None):
+        keys = sorted(k for k in self.objects if k.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        page = keys[start : start + 2]
+        response = {
+            "Contents": [
+                {"Key": k, "ETag": f'"{self.objects[k]["ETag"]}"'} for k in page
+            ],
+            "IsTruncated": start + 2 < len(keys),
+        }
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = str(start + 2)
+        return response
+
+    def put_object(self, Bucket, Key, Body, **metadata):
+        self.put_calls += 1
+        self.objects[Key] = dict(
+            metadata, Body=Body, ETag=hashlib.md5(Body).hexdigest()
+        )
+
+    def create_multipart_upload(self, Bucket, Key, **metadata):
+        upload_id = f"upload-{len(self.uploads)}"
+        self.uploads[upload_id] = {"metadata": metadata, "parts": {}}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId]["parts"][PartNumber] = Body
+        return {"ETag": f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        upload = self.uploads.pop(UploadId)
+        parts = [upload["parts"][p["PartNumber"]] for p in MultipartUpload["Parts"]]
+        digest = hashlib.md5(b"".join(hashlib.md5(p).digest() for p in parts))
+        self.objects[Key] = dict(
+            upload["metadata"],
+            Body=b"".join(parts),
+            ETag=f"{digest.hexdigest()}-{len(parts)}",
+        )
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+
+    def delete_objects(self, Bucket, Delete):
+        for item in Delete["Objects"]:
+            self.objects.pop(item["Key"], None)
+
+
+def write_site(root, files):
+    for name, body in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(body)
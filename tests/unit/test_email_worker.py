@@ -0,0 +1,182 @@
+import json
+
+import pytest
+
+from lambdas.email_worker import index
+
+FROM = "no-reply@example.com"
+
+
+class ThrottlingError(Exception):
+    response = {"Error": {"Code": "TooManyRequestsException"}}
+
+
+class LocalSES:
+    def __init__(self, throttle_after=None):
+        self.sent = []
+        self.throttle_after = throttle_after
+
+    def send_email(self, **request):
+        if self.throttle_after is not None and len(self.sent) >= self.throttle_after:
+            raise ThrottlingError()
+        self.sent.append(request)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class ConditionalCheckFailed(Exception):
+    response = {"Error": {"Code": "ConditionalCheckFailedException"}}
+
+
+class LocalDynamoDB:
+    """Items keyed by id, with just the conditions the worker uses."""
+
+    def __init__(self, clock):
+        self.items = {}
+        self.clock = clock
+
+    def put_item(self, TableName, Item, **condition):
+        current = self.items.get(Item["id"]["S"])
+        if current and not (
+            current["status"] == index.SENDING and current["expires_at"] < self.clock()
+        ):
+            raise ConditionalCheckFailed()
+        self.items[Item["id"]["S"]] = {
+            "status": Item["status"]["S"],
+            "expires_at": int(Item["expires_at"]["N"]),
+        }
+
+    def update_item(self, TableName, Key, ExpressionAttributeValues, **update):
+        self.items[Key["id"]["S"]] = {
+            "status": ExpressionAttributeValues[":sent"]["S"],
+            "expires_at": int(ExpressionAttributeValues[":expires_at"]["N"]),
+        }
+
+    def delete_item(self, TableName, Key):
+        self.items.pop(Key["id"]["S"], None)
+
+
+def record(message_id, body):
+    return {"messageId": message_id, "body": json.dumps(body)}
+
+
+EMAIL = {"to": "user@example.com", "subject": "Welcome", "text": "Hello"}
+
+
+def test_parse_email():
+    assert index.parse_email(json.dumps(EMAIL))["to"] == ["user@example.com"]
+    notification = {"Type": "Notification", "Message": json.dumps(EMAIL)}
+    assert index.parse_email(json.dumps(notification))["subject"] == "Welcome"
+    with pytest.raises(index.InvalidEmail, match="subject"):
+        index.parse_email(json.dumps({"to": ["user@example.com"], "text": "Hi"}))
+    with pytest.raises(index.InvalidEmail, match="JSON"):
+        index.parse_email("not json")
+
+
+def test_send_email_request():
+    request = index.send_email_request(
+        {**index.parse_email(json.dumps(EMAIL)), "html": "<p>Hello</p>"}, FROM
+    )
+    assert request["FromEmailAddress"] == FROM
+    assert request["Destination"] == {"ToAddresses": ["user@example.com"]}
+    assert set(request["Content"]["Simple"]["Body"]) == {"Text", "Html"}
+
+
+def test_process_reports_only_failed_messages():
+    ses = LocalSES()
+    clock = Clock()
+    response = index.process(
+        [record("1", EMAIL), record("2", {"to": []}), record("3", EMAIL)],
+        ses,
+        FROM,
+        index.Pacer(2, clock=clock, sleep=clock.sleep),
+    )
+    assert response == {"batchItemFailures": [{"itemIdentifier": "2"}]}
+    assert len(ses.sent) == 2
+    # two sends per second: the second waits half a second
+    assert clock.slept == [0.5]
+
+
+def test_process_returns_the_rest_of_the_batch_when_throttled():
+    clock = Clock()
+    response = index.process(
+        [record(str(i), EMAIL) for i in range(4)],
+        LocalSES(throttle_after=1),
+        FROM,
+        index.Pacer(100, clock=clock, sleep=clock.sleep),
+    )
+    assert [f["itemIdentifier"] for f in response["batchItemFailures"]] == [
+        "1",
+        "2",
+        "3",
+    ]
+
+
+def test_process_sends_each_email_once():
+    clock = Clock()
+    dynamodb = LocalDynamoDB(clock)
+    store = index.IdempotencyStore(dynamodb, "emails", 1209600, 20, clock=clock)
+    pacer = index.Pacer(100, clock=clock, sleep=clock.sleep)
+    ses = LocalSES()
+    keyed = {**EMAIL, "idempotency_key": "welcome-42"}
+    batch = [record("1", EMAIL), record("2", keyed), record("3", keyed)]
+    assert index.process(batch, ses, FROM, pacer, store) == {"batchItemFailures": []}
+    # the redelivered batch is skipped, not failed
+    assert index.process(batch, ses, FROM, pacer, store) == {"batchItemFailures": []}
+    assert len(ses.sent) == 2
+    assert dynamodb.items["welcome-42"]["status"] == index.SENT
+
+    # a throttled send drops its claim so the retry can send it
+    index.process([record("4", EMAIL)], LocalSES(throttle_after=0), FROM, pacer, store)
+    assert "4" not in dynamodb.items
+    # a claim left by a crashed invocation lapses after the lease
+    store.claim("5")
+    assert not store.claim("5")
+    clock.now += 21
+    assert store.claim("5")
+
+
+def test_message_id_survives_sns_and_redrives():
+    envelope = {"Type": "Notification", "MessageId": "sns-1", "Message": "{}"}
+    assert index.message_id(record("sqs-2", envelope)) == "sns-1"
+    redriven = {
+        **record("sqs-3", EMAIL),
+        "messageAttributes": {
+            "original_message_id": {"stringValue": "sqs-1", "dataType": "String"}
+        },
+    }
+    assert index.message_id(redriven) == "sqs-1"
+    assert index.message_id(record("sqs-4", EMAIL)) == "sqs-4"
+
+
+def test_a_failed_claim_update_does_not_fail_the_batch():
+    class FailingDynamoDB(LocalDynamoDB):
+        def update_item(self, **update):
+            raise ConditionalCheckFailed()
+
+    clock = Clock()
+    store = index.IdempotencyStore(
+        FailingDynamoDB(clock), "emails", 60, 20, clock=clock
+    )
+    ses = LocalSES()
+    response = index.process(
+        [record("1", EMAIL), record("2", EMAIL)],
+        ses,
+        FROM,
+        index.Pacer(100, clock=clock, sleep=clock.sleep),
+        store,
+    )
+    # both were sent, retrying them would send them again
+    assert response == {"batchItemFailures": []}
+    assert len(ses.sent) == 2
@@ -0,0 +1,221 @@
+import pytest
+from aws_cdk import aws_sqs as sqs
+
+from helper import messaging
+from tests.unit.local_aws import Conf
+
+
+def test_queue_settings_override_defaults_per_service():
+    conf = Conf(
+        sqs_queues={
+            "defaults": {"retention_period": 345600, "dlq_retention_period": 1209600},
+            "email-service": {"retention_period": 3600},
+        }
+    )
+    assert messaging.queue_settings(conf, "email-service")["retention_period"] == 3600
+    assert messaging.queue_settings(conf, "api-service")["retention_period"] == 345600
+
+    conf["sqs_queues"]["api-service"] = {"dlq_retention_period": 345600}
+    with pytest.raises(ValueError, match="dlq_retention_period"):
+        messaging.queue_settings(conf, "api-service")
+
+
+def test_subscription_settings():
+    conf = Conf(
+        sns_subscriptions={
+            "api-service": {
+                "account-service": {
+                    "is_enabled_raw_message_delivery": True,
+                    "filter_policy": {"event_type": ["account.updated"]},
+                }
+            }
+        }
+    )
+    assert messaging.subscription_settings(conf, "api-service", "account-service") == {
+        "raw_message_delivery": True,
+        "filter_policy": {"event_type": ["account.updated"]},
+        "filter_policy_scope": "MessageAttributes",
+    }
+    assert messaging.subscription_settings(conf, "account-service", "api-service") == {
+        "raw_message_delivery": False,
+        "filter_policy": None,
+        "filter_policy_scope": "MessageAttributes",
+    }
+
+    # a topology subscription overrides the config entry, by the same keys
+    assert messaging.subscription_settings(
+        conf,
+        "account-service",
+        "api-service",
+        {"is_enabled_raw_message_delivery": True},
+    )["raw_message_delivery"]
+    with pytest.raises(ValueError, match="is_enabled_raw_message_delivery"):
+        messaging.subscription_settings(
+            conf, "account-service", "api-service", {"raw_message_delivery": True}
+        )
+
+    too_wide = {f"key{n}": ["a", "b", "c"] for n in range(5)}
+    conf["sns_subscriptions"]["api-service"]["account-service"] = {
+        "filter_policy": too_wide
+    }
+    with pytest.raises(ValueError, match="combinations"):
+        messaging.subscription_settings(conf, "api-service", "account-service")
+
+
+def test_fifo_options():
+    fifo = {
+        "message_group_id": "account_id",
+        "content_based_deduplication": True,
+        "is_enabled_high_throughput": True,
+    }
+    assert messaging.fifo_name("demo-api-service-ledger", fifo).endswith(".fifo")
+    assert messaging.fifo_name("demo-api-service-event", None) == (
+        "demo-api-service-event"
+    )
+    assert messaging.queue_fifo_options(None) == {}
+    options = messaging.queue_fifo_options(fifo)
+    assert options["fifo_throughput_limit"] == (
+        sqs.FifoThroughputLimit.PER_MESSAGE_GROUP_ID
+    )
+    assert "fifo_throughput_limit" not in messaging.queue_fifo_options(
+        fifo, is_dead_letter_queue=True
+    )
+
+
+def test_stream_settings():
+    conf = Conf(
+        kinesis_streams={
+            "defaults": {
+                "stream_mode": "PROVISIONED",
+                "shard_count": 1,
+                "retention_period": 24,
+            },
+            "api-service": {"shard_count": 4},
+        }
+    )
+    settings = messaging.stream_settings(conf, "api-service")
+    assert messaging.stream_options(settings)["shard_count"] == 4
+    on_demand = messaging.stream_settings(
+        conf, "api-service", {"stream_mode": "ON_DEMAND"}
+    )
+    assert "shard_count" not in messaging.stream_options(on_demand)
+
+    with pytest.raises(ValueError, match="retention_period"):
+        messaging.stream_settings(conf, "api-service", {"retention_period": 12})
+    with pytest.raises(ValueError, match="stream_mode"):
+        messaging.stream_settings(conf, "api-service", {"stream_mode": "SHARDED"})
+
+
+def test_payload_offload_settings():
+    assert (
+        messaging.payload_expiration_days(
+            [{"dlq_retention_period": 1209600}, {"dlq_retention_period": 345601}]
+        )
+        == 14
+    )
+    assert messaging.payload_expiration_days([{"dlq_retention_period": 90000}]) == 2
+    conf = Conf(payload_offload={"threshold_bytes": 196608})
+    assert messaging.payload_threshold(conf) == 196608
+    with pytest.raises(ValueError, match="threshold_bytes"):
+        messaging.payload_threshold(Conf(payload_offload={"threshold_bytes": 262144}))
+
+
+def test_email_worker_settings():
+    email_worker = {
+        "batch_size": 10,
+        "max_batching_window": 0,
+        "maximum_concurrency": 5,
+        "reserved_concurrency": 5,
+        "timeout": 20,
+    }
+    queue_settings = {"visibility_timeout": 120}
+    assert messaging.email_worker_settings(
+        Conf(email_worker=email_worker), queue_settings
+    )
+    for override, message in [
+        ({"batch_size": 100}, "max_batching_window"),
+        ({"reserved_concurrency": 2}, "reserved_concurrency"),
+        ({"timeout": 300}, "visibility_timeout"),
+        ({"maximum_concurrency": 1}, "maximum_concurrency"),
+    ]:
+        with pytest.raises(ValueError, match=message):
+            messaging.email_worker_settings(
+                Conf(email_worker={**email_worker, **override}), queue_settings
+            )
+
+    # the low priority lane's pollers count against the reserved concurrency
+    email_worker["low_priority_maximum_concurrency"] = 2
+    with pytest.raises(ValueError, match="reserved_concurrency"):
+        messaging.email_worker_settings(
+            Conf(email_worker=email_worker), queue_settings, queue_settings
+        )
+    email_worker["reserved_concurrency"] = 7
+    settings = messaging.email_worker_settings(
+        Conf(email_worker=email_worker), queue_settings, queue_settings
+    )
+    assert settings["total_concurrency"] == 7
+
+
+def test_idempotency_ttl_covers_a_redrive():
+    assert (
+        messaging.idempotency_ttl_seconds(
+            [{"dlq_retention_period": 1209600}, {"dlq_retention_period": 345601}]
+        )
+        == 1209600
+    )
+
+
+def test_priority_lane_filter_policies():
+    conf = Conf(
+        priority_lanes={"attribute": "priority", "low_value": "low"},
+        sns_subscriptions={
+            "account-service": {
+                "api-service": {"filter_policy": {"event_type": ["account.updated"]}}
+            }
+        },
+    )
+    high = messaging.subscription_settings(
+        conf, "account-service", "api-service", lane="high"
+    )
+    assert high["filter_policy"] == {
+        "event_type": ["account.updated"],
+        "priority": [{"exists": False}, {"anything-but": ["low"]}],
+    }
+    low = messaging.subscription_settings(
+        conf, "account-service", "api-service", lane="low"
+    )
+    assert low["filter_policy"]["priority"] == ["low"]
+    plain = messaging.subscription_settings(conf, "account-service", "api-service")
+    assert plain["filter_policy"] == {"event_type": ["account.updated"]}
+
+    with pytest.raises(ValueError, match="MessageAttributes"):
+        messaging.subscription_settings(
+            conf,
+            "account-service",
+            "api-service",
+            {"filter_policy_scope": "MessageBody"},
+            lane="low",
+        )
+
+
+def test_schema_settings(tmp_path):
+    conf = Conf(
+        schema_registry={
+            "data_format": "AVRO",
+            "compatibility": "BACKWARD",
+            "definitions_path": "schemas",
+        }
+    )
+    settings = messaging.schema_settings(conf, "api-service", "event", {})
+    assert settings["definition"] == "schemas/api-service/event.avsc"
+    protobuf = messaging.schema_settings(
+        conf, "api-service", "ledger", {"data_format": "PROTOBUF"}
+    )
+    assert protobuf["definition"].endswith("ledger.proto")
+    with pytest.raises(ValueError, match="compatibility"):
+        messaging.schema_settings(conf, "api-service", "event", {"compatibility": "X"})
+
+    definition = tmp_path / "event.avsc"
+    definition.write_text('{"type": "string"}')
+    settings["definition"] = str(definition)
+    assert messaging.schema_definition(settings) == '{"type": "string"}'
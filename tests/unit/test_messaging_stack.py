@@ -0,0 +1,100 @@
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+
+from helper import messaging_topology
+from stacks.sns_sqs.messaging_stack import (
+    MessagingSubscriptionsStack,
+    ServiceMessagingStack,
+)
+from tests.unit.local_aws import Conf
+
+ARN = "arn:aws:{service}:us-west-2:123456789012:demo-{name}"
+
+
+def subscriptions_template(services, service_name):
+    """Template of the subscriptions stack of `service_name`, with dev config."""
+    topology = messaging_topology.load_topology(Conf(messaging=services))
+    app = core.App(context={"environment": "dev"})
+    stack = MessagingSubscriptionsStack(
+        app,
+        "subs-stack",
+        service_name=service_name,
+        topology=topology,
+        topic_arns={
+            ref: ARN.format(service="sns", name=ref) for ref in topology["topics"]
+        },
+        queue_arns={
+            ref: ARN.format(service="sqs", name=ref) for ref in topology["queues"]
+        },
+    )
+    return assertions.Template.from_stack(stack)
+
+
+def test_topology_subscription_overrides_raw_delivery():
+    template = subscriptions_template(
+        {
+            "api-service": {"topics": {"event": {}, "audit": {}}},
+            "account-service": {
+                "queues": {
+                    "event": {
+                        "subscribes_to": [
+                            "api-service.event",
+                            {
+                                "topic": "api-service.audit",
+                                "is_enabled_raw_message_delivery": True,
+                            },
+                        ]
+                    }
+                }
+            },
+        },
+        "api-service",
+    )
+    template.resource_count_is("AWS::SNS::Subscription", 2)
+    for name, raw_message_delivery in [("event", False), ("audit", True)]:
+        template.has_resource_properties(
+            "AWS::SNS::Subscription",
+            {
+                "TopicArn": ARN.format(service="sns", name=f"api-service.{name}"),
+                "RawMessageDelivery": raw_message_delivery,
+            },
+        )
+
+
+def test_priority_lanes_publish_their_age_alarms():
+    topology = messaging_topology.load_topology(
+        Conf(
+            messaging={
+                "email-service": {
+                    "queues": {
+                        "event": {"is_direct": True, "is_enabled_priority_lanes": True}
+                    }
+                }
+            }
+        )
+    )
+    app = core.App(context={"environment": "dev"})
+    stack = ServiceMessagingStack(
+        app, "email-stack", service_name="email-service", topology=topology
+    )
+    assert list(stack.lane_alarms) == ["email-service.event", "email-service.event-low"]
+    template = assertions.Template.from_stack(stack)
+    template.resource_count_is("AWS::CloudWatch::Alarm", 2)
+    template.has_resource_properties(
+        "AWS::CloudWatch::Alarm",
+        {
+            "MetricName": "ApproximateAgeOfOldestMessage",
+            "AlarmName": assertions.Match.string_like_regexp(
+                "-email-service-event-low-age$"
+            ),
+        },
+    )
+    for suffix in [
+        "AWS_CLOUDWATCH_AGE_ALARM_ARN",
+        "AWS_CLOUDWATCH_AGE_ALARM_NAME",
+        "AWS_CLOUDWATCH_EVENT_LOW_AGE_ALARM_ARN",
+        "AWS_CLOUDWATCH_EVENT_LOW_AGE_ALARM_NAME",
+    ]:
+        template.has_resource_properties(
+            "AWS::SSM::Parameter", {"Name": f"/email-service/dev/{suffix}"}
+        )
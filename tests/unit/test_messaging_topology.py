@@ -0,0 +1,341 @@
+import pytest
+
+from helper import messaging
+from helper import messaging_topology
+from tests.unit.local_aws import Conf
+
+
+def topology(**services):
+    return messaging_topology.load_topology(Conf(messaging=services))
+
+
+def test_load_topology():
+    loaded = topology(
+        **{
+            "api-service": {"topics": {"event": {}}},
+            "account-service": {
+                "queues": {
+                    "event": {
+                        "subscribes_to": [
+                            "api-service.event",
+                            {
+                                "topic": "api-service.audit",
+                                "is_enabled_raw_message_delivery": True,
+                            },
+                        ],
+                        "settings": {"visibility_timeout": 120},
+                    }
+                }
+            },
+        }
+    )
+    assert loaded["services"] == ["api-service", "account-service"]
+    assert loaded["topics"]["api-service.event"]["key"] == "event"
+    queue = loaded["queues"]["account-service.event"]
+    assert queue["subscriptions"] == [
+        {"topic": "api-service.event"},
+        {"topic": "api-service.audit", "is_enabled_raw_message_delivery": True},
+    ]
+    assert queue["settings"] == {"visibility_timeout": 120}
+    assert not queue["is_direct"]
+    # the subscriptions stack passes all but the topic as overrides
+    settings = [
+        messaging.subscription_settings(
+            Conf(),
+            "api-service",
+            "account-service",
+            {k: v for k, v in subscription.items() if k != "topic"},
+        )
+        for subscription in queue["subscriptions"]
+    ]
+    assert [s["raw_message_delivery"] for s in settings] == [False, True]
+
+
+def test_validate_topology_rejects_broken_references():
+    with pytest.raises(ValueError, match="unknown topic api-service.event"):
+        messaging_topology.validate_topology(
+            topology(
+                **{
+                    "account-service": {
+                        "queues": {"event": {"subscribes_to": ["api-service.event"]}}
+                    }
+                }
+            )
+        )
+    with pytest.raises(ValueError, match="orphan queue"):
+        messaging_topology.validate_topology(
+            topology(**{"email-service": {"queues": {"event": {}}}})
+        )
+    with pytest.raises(ValueError, match="<service>.<topic key>"):
+        messaging_topology.validate_topology(
+            topology(
+                **{
+                    "api-service": {"topics": {"event": {}}},
+                    "account-service": {
+                        "queues": {"event": {"subscribes_to": ["api-service"]}}
+                    },
+                }
+            )
+        )
+
+
+@pytest.mark.parametrize(
+    "queue, message",
+    [
+        ({"is_direct": True, "is_enable_priority_lanes": True}, "unknown queue"),
+        ({"is_direct": True, "fifo": {"group_id": "id"}}, "unknown fifo"),
+        (
+            {"subscribes_to": [{"topic": "api-service.event", "raw": True}]},
+            r"unknown subscription options \['raw'\]",
+        ),
+    ],
+)
+def test_validate_topology_rejects_unknown_options(queue, message):
+    loaded = topology(
+        **{
+            "api-service": {"topics": {"event": {}}},
+            "account-service": {"queues": {"event": queue}},
+        }
+    )
+    with pytest.raises(ValueError, match=f"account-service.event: {message}"):
+        messaging_topology.validate_topology(loaded)
+
+
+def test_validate_topology_warns_about_unsubscribed_topics():
+    warnings = messaging_topology.validate_topology(
+        topology(
+            **{
+                "api-service": {"topics": {"event": {}, "audit": {}}},
+                "account-service": {
+                    "queues": {"event": {"subscribes_to": ["api-service.event"]}}
+                },
+                "email-service": {"queues": {"event": {"is_direct": True}}},
+            }
+        )
+    )
+    assert warnings == ["api-service.audit has no queue subscribed"]
+
+
+def test_validate_topology_rejects_relay_cycles():
+    services = {
+        "api-service": {
+            "topics": {"event": {}},
+            "queues": {
+                "event": {
+                    "subscribes_to": ["account-service.event"],
+                    "relays_to": ["api-service.event"],
+                }
+            },
+        },
+        "account-service": {
+            "topics": {"event": {}},
+            "queues": {
+                "event": {
+                    "subscribes_to": ["api-service.event"],
+                    "relays_to": ["account-service.event"],
+                }
+            },
+        },
+    }
+    with pytest.raises(ValueError, match="loop through relaying queues"):
+        messaging_topology.validate_topology(topology(**services))
+
+    # services subscribing to each other is fine while neither relays
+    for service in services.values():
+        service["queues"]["event"]["relays_to"] = []
+    assert messaging_topology.validate_topology(topology(**services)) == []
+
+
+def test_parameter_suffix_keeps_the_original_names():
+    assert (
+        messaging_topology.parameter_suffix("topic", "event")
+        == "AWS_SNS_EVENT_TOPIC_ARN"
+    )
+    assert messaging_topology.parameter_suffix("queue", "event") == "AWS_SQS_QUEUE_URL"
+    assert messaging_topology.parameter_suffix("dlq", "event") == "AWS_SQS_DLQ_URL"
+    assert (
+        messaging_topology.parameter_suffix("queue", "order-created")
+        == "AWS_SQS_ORDER_CREATED_QUEUE_URL"
+    )
+
+
+def test_validate_topology_fifo_rules():
+    services = {
+        "account-service": {
+            "topics": {"ledger": {"fifo": {"message_group_id": "account_id"}}}
+        },
+        "api-service": {
+            "queues": {
+                "ledger": {"subscribes_to": ["account-service.ledger"], "fifo": {}}
+            }
+        },
+    }
+    loaded = topology(**services)
+    assert loaded["queues"]["api-service.ledger"]["fifo"] == {
+        "message_group_id": None,
+        "content_based_deduplication": True,
+        "is_enabled_high_throughput": True,
+    }
+    assert messaging_topology.validate_topology(loaded) == []
+
+    services["account-service"]["topics"]["ledger"] = {}
+    with pytest.raises(ValueError, match="is fifo but account-service.ledger"):
+        messaging_topology.validate_topology(topology(**services))
+
+    with pytest.raises(ValueError, match="direct fifo queue needs a message_group_id"):
+        messaging_topology.validate_topology(
+            topology(
+                **{
+                    "email-service": {
+                        "queues": {"event": {"is_direct": True, "fifo": {}}}
+                    }
+                }
+            )
+        )
+
+
+def test_validate_topology_streams():
+    services = {
+        "api-service": {"streams": {"event": {"consumers": ["account-service"]}}},
+        "account-service": {},
+    }
+    loaded = topology(**services)
+    assert loaded["streams"]["api-service.event"]["consumers"] == ["account-service"]
+    assert messaging_topology.validate_topology(loaded) == []
+    assert (
+        messaging_topology.consumer_parameter_suffix("api-service", "event")
+        == "AWS_KINESIS_API_SERVICE_EVENT_CONSUMER_ARN"
+    )
+
+    services["api-service"]["streams"]["event"]["consumers"] = ["audit-service"]
+    with pytest.raises(ValueError, match="unknown service audit-service"):
+        messaging_topology.validate_topology(topology(**services))
+
+
+def test_subscription_queues_group_by_first_publisher():
+    loaded = topology(
+        **{
+            "api-service": {
+                "topics": {"event": {}},
+                "queues": {"event": {"subscribes_to": ["account-service.event"]}},
+            },
+            "account-service": {
+                "topics": {"event": {}},
+                "queues": {
+                    "event": {
+                        "subscribes_to": ["api-service.event", "account-service.event"]
+                    }
+                },
+            },
+            "email-service": {"queues": {"event": {"is_direct": True}}},
+        }
+    )
+    assert list(messaging_topology.subscription_queues(loaded, "api-service")) == [
+        "account-service.event"
+    ]
+    assert list(messaging_topology.subscription_queues(loaded, "account-service")) == [
+        "api-service.event"
+    ]
+    assert messaging_topology.subscription_queues(loaded, "email-service") == {}
+
+
+def test_payload_queues():
+    loaded = topology(
+        **{
+            "api-service": {
+                "is_enabled_payload_offload": True,
+                "topics": {"event": {}},
+            },
+            "account-service": {
+                "topics": {"event": {}},
+                "queues": {
+                    "event": {"subscribes_to": ["api-service.event"]},
+                    "audit": {"subscribes_to": ["account-service.event"]},
+                },
+            },
+            "email-service": {"queues": {"event": {"is_direct": True}}},
+        }
+    )
+    assert loaded["payload_offload"] == ["api-service"]
+    assert list(messaging_topology.payload_queues(loaded, "api-service")) == [
+        "account-service.event"
+    ]
+    assert list(messaging_topology.payload_queues(loaded, "email-service")) == [
+        "email-service.event"
+    ]
+
+
+def test_priority_lanes():
+    loaded = topology(
+        **{
+            "account-service": {"topics": {"event": {}}},
+            "api-service": {
+                "queues": {
+                    "event": {
+                        "subscribes_to": ["account-service.event"],
+                        "is_enabled_priority_lanes": True,
+                        "settings": {"visibility_timeout": 60},
+                        "low_priority_settings": {"visibility_timeout": 600},
+                    }
+                }
+            },
+        }
+    )
+    high = loaded["queues"]["api-service.event"]
+    low = loaded["queues"]["api-service.event-low"]
+    assert (high["lane"], low["lane"]) == ("high", "low")
+    assert low["settings"] == {"visibility_timeout": 600}
+    assert low["subscriptions"] == high["subscriptions"]
+    assert low["subscriptions"] is not high["subscriptions"]
+    assert (
+        messaging_topology.parameter_suffix("queue", low["key"])
+        == "AWS_SQS_EVENT_LOW_QUEUE_URL"
+    )
+
+
+def test_idempotency_table_is_shared_by_the_lanes():
+    loaded = topology(
+        **{
+            "account-service": {"topics": {"event": {}}},
+            "api-service": {
+                "queues": {
+                    "event": {
+                        "subscribes_to": ["account-service.event"],
+                        "is_enabled_priority_lanes": True,
+                        "is_enabled_idempotency_table": True,
+                    }
+                }
+            },
+        }
+    )
+    lanes = [
+        loaded["queues"]["api-service.event"],
+        loaded["queues"]["api-service.event-low"],
+    ]
+    assert {queue["base_key"] for queue in lanes} == {"event"}
+    assert all(queue["is_enabled_idempotency_table"] for queue in lanes)
+    assert (
+        messaging_topology.parameter_suffix("idempotency_table", "event")
+        == "AWS_DYNAMODB_IDEMPOTENCY_TABLE"
+    )
+    assert (
+        messaging_topology.parameter_suffix("idempotency_ttl", "order-created")
+        == "AWS_DYNAMODB_ORDER_CREATED_IDEMPOTENCY_TTL_SECONDS"
+    )
+
+
+def test_topic_schema():
+    loaded = topology(
+        **{
+            "api-service": {
+                "topics": {"event": {"schema": {}}, "audit": {}},
+                "queues": {"event": {"is_direct": True}},
+            }
+        }
+    )
+    assert loaded["topics"]["api-service.event"]["schema"] == {}
+    assert loaded["topics"]["api-service.audit"]["schema"] is None
+    assert (
+        messaging_topology.parameter_suffix("schema", "event")
+        == "AWS_GLUE_EVENT_SCHEMA_ARN"
+    )
@@ -0,0 +1,62 @@
+import gzip
+
+from tools import pg_query_digest
+
+PREFIX = "2024-01-01 10:00:0{} UTC:10.0.1.5(5432{}):app@accounts:[41{}]:"
+
+LOG = [
+    PREFIX.format(1, 1, 1)
+    + "LOG:  duration: 120.5 ms  statement: SELECT * FROM users WHERE id = 42",
+    PREFIX.format(2, 2, 2)
+    + "LOG:  duration: 880.0 ms  execute <unnamed>: SELECT * FROM users",
+    "\tWHERE id = $1",
+    PREFIX.format(3, 3, 3)
+    + "LOG:  duration: 15.0 ms  statement: INSERT INTO t (a, b) VALUES (1, 'x'), (2, 'y')",
+    PREFIX.format(4, 4, 4) + "LOG:  duration: 1500.0 ms  plan:",
+    '\t{"Query Text": "SELECT pg_sleep(1.5)"}',
+    PREFIX.format(5, 5, 5) + 'ERROR:  relation "missing" does not exist',
+    PREFIX.format(6, 6, 6)
+    + "LOG:  duration: 30.0 ms  statement: insert into t (a, b) values (3, 'z') -- c",
+]
+
+
+def test_fingerprint_collapses_literals_lists_and_comments():
+    fingerprint = pg_query_digest.fingerprint
+    assert fingerprint("SELECT * FROM t WHERE id IN (1, 2, 3) AND n = 'o''k';") == (
+        "select * from t where id in (?) and n = ?"
+    )
+    assert fingerprint("/* app */ SELECT  a1 FROM t WHERE x = $2") == (
+        "select a1 from t where x = ?"
+    )
+    assert fingerprint("INSERT INTO t VALUES (1, 'a'), (2, 'b')") == (
+        "insert into t values (?)"
+    )
+
+
+def test_digest_groups_statements_and_skips_plans_and_errors():
+    summary = pg_query_digest.digest(LOG)
+
+    assert [entry["fingerprint"] for entry in summary] == [
+        "select * from users where id = ?",
+        "insert into t (a, b) values (?)",
+    ]
+    select = summary[0]
+    assert select["count"] == 2
+    assert select["total_ms"] == 1000.5
+    assert select["p99_ms"] == 880.0
+    assert select["databases"] == ["accounts"]
+    assert summary[1]["count"] == 2
+
+
+def test_sort_by_p99_and_read_gzip(tmp_path):
+    path = tmp_path / "postgresql.log.gz"
+    with gzip.open(path, "wt") as log_file:
+        log_file.write("\n".join(LOG + [LOG[3].replace("15.0", "5000.0")]) + "\n")
+
+    summary = pg_query_digest.digest(
+        pg_query_digest.read_lines([str(path)]), sort="p99"
+    )
+
+    assert summary[0]["fingerprint"].startswith("insert")
+    assert summary[0]["max_ms"] == 5000.0
+    assert pg_query_digest.percentile([1, 2, 3, 4], 0.5) == 2
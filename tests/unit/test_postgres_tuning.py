@@ -0,0 +1,43 @@
+import pytest
+
+from helper import postgres_tuning
+
+
+def test_memory_settings_scale_with_instance_class():
+    small = postgres_tuning.tuned_parameters("db.t3.small")
+    large = postgres_tuning.tuned_parameters("db.r7g.2xlarge")
+    # 25% / 75% of memory, in 8kB pages
+    assert small["shared_buffers"] == str(2 * 1024 * 1024 // 4 // 8)
+    assert large["effective_cache_size"] == str(64 * 1024 * 1024 * 3 // 4 // 8)
+    assert int(large["max_connections"]) > int(small["max_connections"])
+    assert large["max_parallel_workers"] == "8"
+    assert "pg_stat_statements" in small["shared_preload_libraries"]
+
+
+def test_workload_and_overrides():
+    oltp = postgres_tuning.tuned_parameters("db.m7g.xlarge", workload="oltp")
+    mixed = postgres_tuning.tuned_parameters("db.m7g.xlarge", workload="mixed")
+    assert int(mixed["work_mem"]) > int(oltp["work_mem"])
+    assert int(mixed["max_connections"]) < int(oltp["max_connections"])
+
+    tuned = postgres_tuning.tuned_parameters(
+        "db.t4g.medium", auto_explain_min_duration=250, overrides={"work_mem": 8192}
+    )
+    assert tuned["work_mem"] == "8192"
+    assert tuned["auto_explain.log_min_duration"] == "250"
+
+
+def test_unknown_class_or_workload():
+    with pytest.raises(ValueError):
+        postgres_tuning.tuned_parameters("db.x9.large")
+    with pytest.raises(ValueError):
+        postgres_tuning.tuned_parameters("db.t3.small", workload="olap")
+
+
+def test_aurora_cluster_parameters_only_set_logging():
+    parameters = postgres_tuning.aurora_cluster_parameters(
+        log_min_duration_statement=500, overrides={"work_mem": "8192"}
+    )
+    assert parameters["log_min_duration_statement"] == "500"
+    assert parameters["work_mem"] == "8192"
+    assert "shared_buffers" not in parameters
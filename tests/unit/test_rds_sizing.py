@@ -0,0 +1,86 @@
+import pytest
+
+from helper import rds_sizing
+
+
+def database(**settings):
+    return dict(
+        {
+            "instance_type": "db.t4g.small",
+            "is_enabled_multiaz": False,
+            "backup_retention_period": 1,
+            "preferred_backup_window": "07:16-07:46",
+            "preferred_maintenance_window": "Mon:12:58-Mon:13:28",
+            "monitoring_interval": 30,
+        },
+        **settings,
+    )
+
+
+def test_instance_properties():
+    assert rds_sizing.instance_properties(
+        "api-service", database(instance_type="db.r7g.2xlarge", is_enabled_multiaz=True)
+    ) == {
+        "db_instance_class": "db.r7g.2xlarge",
+        "multi_az": True,
+        "backup_retention_period": 1,
+        "preferred_backup_window": "07:16-07:46",
+        "preferred_maintenance_window": "Mon:12:58-Mon:13:28",
+        "monitoring_interval": 30,
+    }
+
+
+def test_windows_wrapping_midnight_and_the_week():
+    rds_sizing.validate_sizing(
+        "api-service",
+        database(
+            preferred_backup_window="23:00-23:40",
+            preferred_maintenance_window="Sun:23:50-Mon:00:30",
+        ),
+    )
+    assert rds_sizing.maintenance_window_ranges("Sun:23:50-Mon:00:30") == [
+        (10070, 10080),
+        (0, 30),
+    ]
+    assert rds_sizing.backup_window_ranges("23:45-00:15")[-2:] == [
+        (10065, 10080),
+        (0, 15),
+    ]
+
+
+@pytest.mark.parametrize(
+    "settings",
+    [
+        {"instance_type": "db.x9.large"},
+        {"read_replica_instance_type": "db.m7g.huge"},
+        {"monitoring_interval": 20},
+        {"backup_retention_period": 0},
+        {"preferred_backup_window": "07:16-07:30"},
+        {"preferred_backup_window": "7am-8am"},
+        {"preferred_maintenance_window": "Mon:13:00"},
+        {"preferred_maintenance_window": "Tue:07:00-Tue:07:30"},
+        {
+            "preferred_backup_window": "23:45-00:15",
+            "preferred_maintenance_window": "Wed:00:00-Wed:00:30",
+        },
+    ],
+)
+def test_invalid_sizing(settings):
+    with pytest.raises(ValueError, match="api-service sizing"):
+        rds_sizing.validate_sizing("api-service", database(**settings))
+
+
+def test_serverless_scaling():
+    aurora = {"min_capacity": 0.5, "max_capacity": 8, "reader_count": 1}
+    assert rds_sizing.serverless_scaling("api-service", aurora) == {
+        "min_capacity": 0.5,
+        "max_capacity": 8,
+    }
+    for settings in [
+        {"min_capacity": 0.25},
+        {"min_capacity": 16},
+        {"max_capacity": 512},
+        {"reader_count": 16},
+    ]:
+        with pytest.raises(ValueError, match="api-service aurora"):
+            rds_sizing.serverless_scaling("api-service", dict(aurora, **settings))
@@ -0,0 +1,79 @@
+import copy
+
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+import pytest
+from aws_cdk import aws_ec2 as ec2
+
+from helper import config
+from stacks.rds.rds import RDSStack
+from tests.unit.local_aws import Conf
+
+
+def synth(monkeypatch, **database_settings):
+    """RDSStack template with the dev config and both databases overridden."""
+    data = copy.deepcopy(config.Config("dev").data)
+    for database in data["rds_databases"].values():
+        database.update(database_settings)
+    monkeypatch.setattr(config, "Config", lambda environment: Conf(data))
+    app = core.App(context={"environment": "dev"})
+    base = core.Stack(app, "base")
+    vpc = ec2.Vpc(base, "vpc")
+    jump_sec_group = ec2.SecurityGroup(base, "jump-sg", vpc=vpc)
+    ecs_sec_group = ec2.SecurityGroup(base, "ecs-sg", vpc=vpc)
+    stack = RDSStack(
+        app,
+        "rds-stack",
+        vpc,
+        jump_sec_group=jump_sec_group,
+        ecs_sec_group=ecs_sec_group,
+    )
+    return assertions.Template.from_stack(stack)
+
+
+def ecs_ingress(template):
+    """Descriptions of the security group ingress rules from the ECS group."""
+    return {
+        logical_id: rule["Properties"]["Description"]
+        for logical_id, rule in template.find_resources(
+            "AWS::EC2::SecurityGroupIngress"
+        ).items()
+        if "ecssg" in str(rule["Properties"]["SourceSecurityGroupId"])
+    }
+
+
+def test_proxied_databases_are_only_reachable_through_the_proxy(monkeypatch):
+    template = synth(monkeypatch, is_enabled_proxy=True, read_replica_count=0)
+    assert list(ecs_ingress(template).values()) == ["Allow ECS RDS Proxy Access"]
+    template.resource_properties_count_is(
+        "AWS::Route53::RecordSet",
+        {
+            "ResourceRecords": [
+                {
+                    "Fn::GetAtt": [
+                        assertions.Match.string_like_regexp("rdsproxy"),
+                        "Endpoint",
+                    ]
+                }
+            ]
+        },
+        2,
+    )
+
+
+@pytest.mark.parametrize(
+    "settings, descriptions",
+    [
+        (
+            {"is_enabled_proxy": True, "read_replica_count": 1},
+            ["Allow ECS RDS Proxy Access", "Allow ECS RDS Reader Access"],
+        ),
+        (
+            {"is_enabled_proxy": False, "read_replica_count": 0},
+            ["Allow ECS RDS Access"],
+        ),
+    ],
+)
+def test_direct_ecs_access(monkeypatch, settings, descriptions):
+    template = synth(monkeypatch, **settings)
+    assert sorted(ecs_ingress(template).values()) == descriptions
@@ -0,0 +1,82 @@
+import pytest
+
+from helper import rds_storage
+
+
+def storage(**settings):
+    return dict({"storage_type": "gp3", "allocated_storage": 20}, **settings)
+
+
+def test_effective_performance_is_capped_by_the_instance():
+    report, is_capped = rds_storage.storage_report(
+        "api-service", "db.t3.small", storage()
+    )
+    assert "1000 IOPS / 22 MiB/s" in report
+    # the gp3 baseline is not paid for, so a small instance is fine
+    assert not is_capped
+
+    report, is_capped = rds_storage.storage_report(
+        "api-service",
+        "db.r7g.4xlarge",
+        storage(allocated_storage=400, iops=16000, storage_throughput=1000),
+    )
+    assert "16000 IOPS / 625 MiB/s" in report
+    assert is_capped
+
+    report, is_capped = rds_storage.storage_report(
+        "api-service",
+        "db.m5.4xlarge",
+        storage(allocated_storage=400, iops=20000, storage_throughput=500),
+    )
+    assert "18750 IOPS / 500 MiB/s" in report
+    assert is_capped
+
+    report, is_capped = rds_storage.storage_report(
+        "api-service",
+        "db.t3.2xlarge",
+        storage(storage_type="io1", allocated_storage=100, iops=5000),
+    )
+    assert "4000 IOPS / 87 MiB/s" in report
+    assert is_capped
+
+
+def test_instance_classes_outside_the_table_are_not_capped():
+    report, is_capped = rds_storage.storage_report(
+        "api-service",
+        "db.x2g.large",
+        storage(allocated_storage=400, iops=64000, storage_throughput=4000),
+    )
+    assert "up to 64000 IOPS / 4000 MiB/s (instance baseline unknown)" in report
+    assert not is_capped
+    with pytest.raises(ValueError):
+        rds_storage.instance_ebs_limits("r7g.large")
+
+
+def test_storage_properties():
+    assert rds_storage.storage_properties(
+        "api-service", storage(max_allocated_storage=100)
+    ) == {
+        "storage_type": "gp3",
+        "allocated_storage": "20",
+        "max_allocated_storage": 100,
+        "iops": None,
+        "storage_throughput": None,
+    }
+
+
+@pytest.mark.parametrize(
+    "settings",
+    [
+        {"storage_type": "standard"},
+        {"allocated_storage": 10},
+        {"max_allocated_storage": 21},
+        {"iops": 12000},
+        {"allocated_storage": 400, "iops": 12000, "storage_throughput": 4000},
+        {"storage_type": "gp2", "iops": 3000},
+        {"storage_type": "io1", "allocated_storage": 100},
+        {"storage_type": "io1", "allocated_storage": 100, "iops": 6000},
+    ],
+)
+def test_invalid_storage_is_rejected(settings):
+    with pytest.raises(ValueError):
+        rds_storage.validate_storage("api-service", storage(**settings))
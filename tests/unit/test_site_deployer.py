@@ -0,0 +1,125 @@
+import gzip
+
+import pytest
+
+from tools import site_deployer
+from tests.unit.local_aws import Conf, LocalS3, write_site
+
+
+class LocalCloudFront:
+    def __init__(self):
+        self.invalidations = []
+
+    def create_invalidation(self, DistributionId, InvalidationBatch):
+        self.invalidations.append(InvalidationBatch["Paths"]["Items"])
+        return {"Invalidation": {"Id": f"I{len(self.invalidations)}"}}
+
+
+def deploy(s3, cloudfront, source, **kwargs):
+    return site_deployer.deploy(
+        s3,
+        cloudfront,
+        "site-bucket",
+        "DIST",
+        str(source),
+        ["/static/*"],
+        multipart_threshold=64 * 1024,
+        multipart_chunksize=32 * 1024,
+        **kwargs,
+    )
+
+
+def test_deploy_uploads_with_metadata_and_skips_unchanged(tmp_path):
+    html = b"<html>" + b"x" * 4096 + b"</html>"
+    write_site(
+        tmp_path,
+        {
+            "index.html": html,
+            "static/app.1a2b.js": b"console.log(1);" * 200,
+            "static/big.bin": bytes(range(256)) * 600,
+        },
+    )
+    s3, cloudfront = LocalS3(), LocalCloudFront()
+
+    first = deploy(s3, cloudfront, tmp_path)
+    assert len(first["uploaded"]) == 3
+    # nothing was overwritten, so nothing needs invalidating
+    assert first["invalidation_paths"] == []
+    assert cloudfront.invalidations == []
+
+    index = s3.objects["index.html"]
+    assert index["ContentEncoding"] == "gzip"
+    assert index["ContentType"] == "text/html"
+    assert index["CacheControl"] == site_deployer.DOCUMENT_CACHE_CONTROL
+    assert gzip.decompress(index["Body"]) == html
+    asset = s3.objects["static/app.1a2b.js"]
+    assert asset["CacheControl"] == site_deployer.HASHED_ASSET_CACHE_CONTROL
+    # large objects go through multipart upload and still compare by ETag
+    assert s3.objects["static/big.bin"]["ETag"].endswith("-5")
+
+    puts = s3.put_calls
+    second = deploy(s3, cloudfront, tmp_path)
+    assert second["uploaded"] == []
+    assert second["skipped"] == 3
+    assert s3.put_calls == puts
+
+
+def test_deploy_invalidates_only_overwritten_and_deleted_objects(tmp_path):
+    write_site(
+        tmp_path,
+        {"index.html": b"v1", "static/app.1.js": b"a", "robots.txt": b"r"},
+    )
+    s3, cloudfront = LocalS3(), LocalCloudFront()
+    deploy(s3, cloudfront, tmp_path)
+
+    (tmp_path / "index.html").write_bytes(b"v2")
+    (tmp_path / "static/app.1.js").unlink()
+    write_site(tmp_path, {"static/app.2.js": b"b"})
+    summary = deploy(s3, cloudfront, tmp_path, delete=True)
+
+    assert summary["uploaded"] == ["index.html", "static/app.2.js"]
+    assert summary["deleted"] == ["static/app.1.js"]
+    assert "static/app.1.js" not in s3.objects
+    assert cloudfront.invalidations == [["/", "/index.html", "/static/app.1.js"]]
+
+
+def test_force_uploads_unchanged_files(tmp_path):
+    write_site(tmp_path, {"index.html": b"v1"})
+    s3, cloudfront = LocalS3(), LocalCloudFront()
+    deploy(s3, cloudfront, tmp_path)
+    assert deploy(s3, cloudfront, tmp_path)["uploaded"] == []
+    summary = deploy(s3, cloudfront, tmp_path, force=True)
+    assert summary["uploaded"] == ["index.html"]
+    assert cloudfront.invalidations == [["/", "/index.html"]]
+
+
+def test_dry_run_does_not_touch_the_bucket(tmp_path):
+    write_site(tmp_path, {"index.html": b"v1"})
+    s3, cloudfront = LocalS3(), LocalCloudFront()
+    summary = deploy(s3, cloudfront, tmp_path, dry_run=True)
+    assert summary["uploaded"] == ["index.html"]
+    assert s3.objects == {}
+
+
+def test_coalesce_invalidation_paths():
+    keys = [f"static/js/chunk{i}.js" for i in range(20)] + ["index.html", "a.txt"]
+    assert site_deployer.coalesce_invalidation_paths(keys, max_paths=5) == [
+        "/",
+        "/a.txt",
+        "/index.html",
+        "/static/js/*",
+    ]
+    assert site_deployer.coalesce_invalidation_paths(keys, max_paths=1) == ["/*"]
+    assert site_deployer.coalesce_invalidation_paths([]) == []
+
+
+def test_versioned_sites_are_published_as_releases():
+    conf = Conf(
+        site_deployments={
+            "web_app": {"is_enabled_versioned_releases": True},
+            "web_admin": {"is_enabled_versioned_releases": False},
+        }
+    )
+    site_deployer.check_unversioned(conf, "web-admin")
+    with pytest.raises(ValueError, match="tools.site_release publish"):
+        site_deployer.check_unversioned(conf, "web-app")
@@ -0,0 +1,123 @@
+import io
+
+import pytest
+
+from tools import site_release
+from tests.unit.local_aws import LocalS3, write_site
+
+
+class NoSuchKey(Exception):
+    pass
+
+
+class LocalReleaseS3(LocalS3):
+    """LocalS3 with the extra calls releases need."""
+
+    class exceptions:
+        NoSuchKey = NoSuchKey
+
+    def __init__(self):
+        super().__init__()
+        self.copies = []
+
+    def list_objects_v2(
+        self, Bucket, Prefix="", ContinuationToken=None, Delimiter=None
+    ):
+        if Delimiter is None:
+            return super().list_objects_v2(Bucket, Prefix, ContinuationToken)
+        prefixes = sorted(
+            {
+                Prefix + k[len(Prefix) :].split(Delimiter)[0] + Delimiter
+                for k in self.objects
+                if k.startswith(Prefix) and Delimiter in k[len(Prefix) :]
+            }
+        )
+        return {
+            "CommonPrefixes": [{"Prefix": p} for p in prefixes],
+            "IsTruncated": False,
+        }
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise NoSuchKey(Key)
+        return {"Body": io.BytesIO(self.objects[Key]["Body"])}
+
+    def copy_object(self, Bucket, Key, CopySource):
+        self.copies.append(Key)
+        self.objects[Key] = dict(self.objects[CopySource["Key"]])
+
+
+class LocalCloudFront:
+    def __init__(self, origin_path=""):
+        self.config = {
+            "Origins": {
+                "Items": [{"Id": "s3", "OriginPath": origin_path, "S3OriginConfig": {}}]
+            }
+        }
+        self.etag = 1
+
+    def get_distribution_config(self, Id):
+        return {"DistributionConfig": self.config, "ETag": str(self.etag)}
+
+    def update_distribution(self, Id, IfMatch, DistributionConfig):
+        assert IfMatch == str(self.etag)
+        self.config = DistributionConfig
+        self.etag += 1
+
+
+class LocalSSM:
+    def __init__(self):
+        self.parameters = {}
+
+    def put_parameter(self, Name, Value, Type, Overwrite):
+        self.parameters[Name] = Value
+
+
+def test_publish_copies_unchanged_files_and_carries_previous_assets(tmp_path):
+    s3 = LocalReleaseS3()
+    v1, v2 = tmp_path / "v1", tmp_path / "v2"
+    write_site(v1, {"index.html": b"one", "logo.svg": b"l", "static/app.1.js": b"a1"})
+    write_site(v2, {"index.html": b"two", "logo.svg": b"l", "static/app.2.js": b"a2"})
+
+    site_release.publish_release(s3, "site", str(v1), "1", ["/static/*"])
+    summary = site_release.publish_release(
+        s3, "site", str(v2), "2", ["/static/*"], previous_release_id="1"
+    )
+
+    assert summary["uploaded"] == [
+        "releases/2/index.html",
+        "releases/2/static/app.2.js",
+    ]
+    # unchanged file copied server-side, old hashed asset kept for cached pages
+    assert summary["copied"] == ["releases/2/logo.svg", "releases/2/static/app.1.js"]
+    assert s3.objects["releases/1/index.html"]["Body"] == b"one"
+    assert site_release.read_manifest(s3, "site", "2")["files"] == [
+        "index.html",
+        "logo.svg",
+        "static/app.2.js",
+    ]
+    assert site_release.list_releases(s3, "site") == ["1", "2"]
+
+    with pytest.raises(ValueError):
+        site_release.publish_release(s3, "site", str(v2), "2", ["/static/*"])
+
+
+def test_activate_and_roll_back_switch_origin_path_only(tmp_path):
+    s3, cloudfront, ssm = LocalReleaseS3(), LocalCloudFront(), LocalSSM()
+    write_site(tmp_path, {"index.html": b"one"})
+    site_release.publish_release(s3, "site", str(tmp_path), "1", [])
+    site_release.publish_release(s3, "site", str(tmp_path), "2", [])
+    puts = s3.put_calls
+
+    for release_id in ["2", "1"]:
+        site_release.activate_release(
+            s3, cloudfront, ssm, "site", "DIST", release_id, "/web-app/dev/ACTIVE"
+        )
+        assert site_release.active_release(cloudfront, "DIST") == release_id
+        assert ssm.parameters["/web-app/dev/ACTIVE"] == f"/releases/{release_id}"
+    assert s3.put_calls == puts
+
+    with pytest.raises(ValueError):
+        site_release.activate_release(
+            s3, cloudfront, ssm, "site", "DIST", "3", "/web-app/dev/ACTIVE"
+        )
@@ -0,0 +1,129 @@
+import datetime
+
+from lambdas.snapshot_export import index
+from tests.unit.local_aws import LocalS3
+
+BUCKET = "db-export"
+
+
+class LocalRDS:
+    class exceptions:
+        class ExportTaskNotFoundFault(Exception):
+            pass
+
+    def __init__(self, snapshots):
+        self.snapshots = snapshots
+        self.tasks = []
+
+    def describe_db_snapshots(self, DBInstanceIdentifier, SnapshotType):
+        return {"DBSnapshots": self.snapshots.get(DBInstanceIdentifier, [])}
+
+    def describe_export_tasks(self, ExportTaskIdentifier=None, Marker=None):
+        tasks = [
+            task
+            for task in self.tasks
+            if ExportTaskIdentifier in (None, task["ExportTaskIdentifier"])
+        ]
+        # like RDS, an unknown identifier is an error, not an empty list
+        if ExportTaskIdentifier and not tasks:
+            raise self.exceptions.ExportTaskNotFoundFault(ExportTaskIdentifier)
+        return {"ExportTasks": tasks}
+
+    def start_export_task(self, **task):
+        self.tasks.append(
+            {
+                "ExportTaskIdentifier": task["ExportTaskIdentifier"],
+                "SourceArn": task["SourceArn"],
+                "S3Bucket": task["S3BucketName"],
+                "S3Prefix": task["S3Prefix"],
+                "Status": "STARTING",
+            }
+        )
+
+
+class LocalExportS3(LocalS3):
+    def copy_object(self, Bucket, Key, CopySource):
+        self.objects[Key] = dict(self.objects[CopySource["Key"]])
+
+
+class LocalGlue:
+    class exceptions:
+        class CrawlerRunningException(Exception):
+            pass
+
+    def __init__(self):
+        self.started = []
+
+    def start_crawler(self, Name):
+        self.started.append(Name)
+
+
+def snapshot(arn, day, status="available"):
+    return {
+        "DBSnapshotArn": arn,
+        "SnapshotCreateTime": datetime.datetime(2024, 1, day, 7, 30),
+        "Status": status,
+    }
+
+
+def test_curated_key_partitions_by_table_and_snapshot_date():
+    raw = "raw/api-service/api-service-2024-01-02/api_service_db/public.users/1/part-00000.gz.parquet"
+    assert index.curated_key("api-service", "api-service-2024-01-02", raw) == (
+        "curated/api-service/api_service_db__public_users/snapshot_date=2024-01-02/"
+        "1-part-00000.gz.parquet"
+    )
+    # the same schema.table in another database of the instance stays apart
+    other = raw.replace("api_service_db", "audit_db")
+    assert index.curated_key("api-service", "api-service-2024-01-02", other) == (
+        "curated/api-service/audit_db__public_users/snapshot_date=2024-01-02/"
+        "1-part-00000.gz.parquet"
+    )
+    metadata = (
+        "raw/api-service/api-service-2024-01-02/export_info_api-service-2024-01-02.json"
+    )
+    assert index.curated_key("api-service", "api-service-2024-01-02", metadata) is None
+
+
+def test_exports_newest_snapshot_once_and_publishes_when_complete():
+    rds = LocalRDS(
+        {
+            "api-service-rds-instance": [
+                snapshot("arn:1", 1),
+                snapshot("arn:2", 2),
+                snapshot("arn:3", 3, status="creating"),
+            ]
+        }
+    )
+    s3, glue = LocalExportS3(), LocalGlue()
+    sources = [
+        {
+            "service": "api-service",
+            "engine": "postgres",
+            "identifier": "api-service-rds-instance",
+        }
+    ]
+    crawlers = {"api-service": "api-crawler"}
+
+    def run():
+        return index.run(rds, s3, glue, sources, BUCKET, "role", "key", crawlers)
+
+    assert run() == {"started": ["api-service-2024-01-02"], "published": []}
+    assert rds.tasks[0]["SourceArn"] == "arn:2"
+    assert run() == {"started": [], "published": []}
+
+    export = "raw/api-service/api-service-2024-01-02"
+    s3.put_object(Bucket=BUCKET, Key=f"{export}/export_info.json", Body=b"{}")
+    s3.put_object(
+        Bucket=BUCKET, Key=f"{export}/db/public.users/1/part-0.parquet", Body=b"p"
+    )
+    rds.tasks[0]["Status"] = "COMPLETE"
+
+    assert run() == {"started": [], "published": ["api-service-2024-01-02"]}
+    assert (
+        s3.objects[
+            "curated/api-service/db__public_users/snapshot_date=2024-01-02/1-part-0.parquet"
+        ]["Body"]
+        == b"p"
+    )
+    assert glue.started == ["api-crawler"]
+    assert run()["published"] == []
@@ -0,0 +1,189 @@
+import json
+import threading
+
+from tools import sqs_redrive
+
+DLQ_URL = "https://sqs.local/dlq"
+QUEUE_URL = "https://sqs.local/queue"
+
+
+class LocalSQS:
+    """In-memory SQS stand-in; received messages stay in flight."""
+
+    def __init__(self, bodies, fail_ids=()):
+        self.queues = {DLQ_URL: [], QUEUE_URL: []}
+        self.in_flight = {}
+        self.fail_ids = set(fail_ids)
+        self.lock = threading.Lock()
+        for index, body in enumerate(bodies):
+            self.queues[DLQ_URL].append(
+                {
+                    "MessageId": f"m{index}",
+                    "Body": body,
+                    "Attributes": {
+                        "ApproximateReceiveCount": "10",
+                        "SentTimestamp": str(1700000000000 + index),
+                    },
+                }
+            )
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages, **kwargs):
+        assert MaxNumberOfMessages <= 10
+        with self.lock:
+            messages = self.queues[QueueUrl][:MaxNumberOfMessages]
+            del self.queues[QueueUrl][:MaxNumberOfMessages]
+            for message in messages:
+                message["ReceiptHandle"] = f"rh-{message['MessageId']}"
+                self.in_flight[message["ReceiptHandle"]] = message
+        return {"Messages": messages} if messages else {}
+
+    def send_message_batch(self, QueueUrl, Entries):
+        assert len(Entries) <= 10
+        successful, failed = [], []
+        with self.lock:
+            for entry in Entries:
+                if entry["MessageBody"] in self.fail_ids:
+                    failed.append({"Id": entry["Id"], "Code": "InternalError"})
+                    continue
+                self.queues[QueueUrl].append({"Body": entry["MessageBody"]})
+                successful.append({"Id": entry["Id"]})
+        return {"Successful": successful, "Failed": failed}
+
+    def delete_message_batch(self, QueueUrl, Entries):
+        with self.lock:
+            for entry in Entries:
+                del self.in_flight[entry["ReceiptHandle"]]
+        return {"Successful": [{"Id": entry["Id"]} for entry in Entries]}
+
+
+class LocalSSM:
+    def __init__(self, parameters):
+        self.parameters = parameters
+
+    def get_parameter(self, Name):
+        return {"Parameter": {"Value": self.parameters[Name]}}
+
+
+def notification(message, event_type):
+    return json.dumps(
+        {
+            "Type": "Notification",
+            "TopicArn": "arn:aws:sns:us-west-2:123:demo-account-service-event",
+            "Message": json.dumps(message),
+            "MessageAttributes": {
+                "event_type": {"Type": "String", "Value": event_type}
+            },
+        }
+    )
+
+
+def test_queue_urls():
+    ssm = LocalSSM(
+        {
+            "/api-service/dev/AWS_SQS_DLQ_URL": DLQ_URL,
+            "/api-service/dev/AWS_SQS_QUEUE_URL": QUEUE_URL,
+            "/api-service/dev/AWS_SQS_EVENT_LOW_DLQ_URL": "low-dlq",
+            "/api-service/dev/AWS_SQS_EVENT_LOW_QUEUE_URL": "low-queue",
+        }
+    )
+    assert sqs_redrive.queue_urls(ssm, "api-service", "dev") == (DLQ_URL, QUEUE_URL)
+    assert sqs_redrive.queue_urls(ssm, "api-service", "dev", "event-low") == (
+        "low-dlq",
+        "low-queue",
+    )
+
+
+def test_signature_groups_by_source_attributes_and_shape():
+    def message(body):
+        return {"Body": body}
+
+    updated = sqs_redrive.signature(
+        message(notification({"account_id": 1}, "account.updated"))
+    )
+    assert updated == sqs_redrive.signature(
+        message(notification({"account_id": 2}, "account.updated"))
+    )
+    assert "demo-account-service-event event_type=account.updated" in updated[1]
+    assert updated != sqs_redrive.signature(
+        message(notification({"account_id": "2"}, "account.updated"))
+    )
+    assert sqs_redrive.signature(message("<html>"))[1] == "direct not-json"
+
+
+def test_inspect_groups_a_sample():
+    bodies = [notification({"account_id": i}, "account.updated") for i in range(5)]
+    bodies += ["not json"] * 3
+    groups = sqs_redrive.inspect(LocalSQS(bodies), DLQ_URL, sample=100)
+    assert sorted(group["count"] for group in groups.values()) == [3, 5]
+    assert all(group["max_receive_count"] == 10 for group in groups.values())
+
+    assert (
+        sum(
+            group["count"]
+            for group in sqs_redrive.inspect(
+                LocalSQS(bodies), DLQ_URL, sample=4
+            ).values()
+        )
+        == 4
+    )
+
+
+def test_redrive_moves_in_batches_and_keeps_failed_sends():
+    bodies = [f"body-{i}" for i in range(45)]
+    sqs = LocalSQS(bodies, fail_ids={"body-7"})
+    summary = sqs_redrive.redrive(sqs, DLQ_URL, QUEUE_URL, workers=3)
+    assert (summary["moved"], summary["failed"]) == (44, 1)
+    assert len(sqs.queues[QUEUE_URL]) == 44
+    # only the failed send is still held by the DLQ
+    assert [m["Body"] for m in sqs.in_flight.values()] == ["body-7"]
+
+
+def test_redrive_one_signature_dry_run_and_limit():
+    bodies = [notification({"id": i}, "account.updated") for i in range(12)]
+    bodies += ["not json"] * 8
+    not_json = sqs_redrive.signature({"Body": "not json"})[0]
+
+    sqs = LocalSQS(bodies)
+    summary = sqs_redrive.redrive(
+        sqs, DLQ_URL, QUEUE_URL, signature_id=not_json, workers=2
+    )
+    assert (summary["moved"], summary["skipped"]) == (8, 12)
+    assert {m["Body"] for m in sqs.queues[QUEUE_URL]} == {"not json"}
+
+    sqs = LocalSQS(bodies)
+    summary = sqs_redrive.redrive(sqs, DLQ_URL, QUEUE_URL, dry_run=True)
+    assert summary["moved"] == 20 and not sqs.queues[QUEUE_URL]
+
+    sqs = LocalSQS(bodies)
+    summary = sqs_redrive.redrive(sqs, DLQ_URL, QUEUE_URL, max_messages=15)
+    assert summary["moved"] == 15
+
+
+def test_rate_limiter_spaces_batches():
+    now = [0.0]
+    slept = []
+
+    def sleep(seconds):
+        slept.append(seconds)
+        now[0] += seconds
+
+    limiter = sqs_redrive.RateLimiter(20, clock=lambda: now[0], sleep=sleep)
+    for _ in range(3):
+        limiter.acquire(10)
+    # 10 messages at 20 a second take half a second each
+    assert slept == [0.5, 0.5]
+
+
+def test_redriven_messages_keep_their_original_id():
+    message = {"MessageId": "m1", "Body": "b"}
+    entry = sqs_redrive._send_entry(0, message, is_fifo=False)
+    original = entry["MessageAttributes"]["original_message_id"]
+    assert original["StringValue"] == "m1"
+    # a second redrive keeps the id the message was first sent with
+    again = {
+        "MessageId": "m2",
+        "Body": "b",
+        "MessageAttributes": entry["MessageAttributes"],
+    }
+    entry = sqs_redrive._send_entry(0, again, is_fifo=False)
+    assert entry["MessageAttributes"]["original_message_id"]["StringValue"] == "m1"
@@ -0,0 +1,150 @@
+"""Summarise the slow statements in exported Postgres logs by query shape.
+
+Statements slower than `log_min_duration_statement` are logged by RDS and
+exported to CloudWatch Logs. Download a log (console, `aws rds
+download-db-log-file-portion` or `aws logs filter-log-events`) and this
+groups the statements by fingerprint, with literals replaced by `?`, and
+ranks them by total or p99 duration. Plain `filter-log-events` text output
+prefixes each line with the event fields, so query only the messages, one
+per row, as below.
+
+Usage:
+    python -m tools.pg_query_digest postgresql.log.2024-01-01-10 --top 10
+    python -m tools.pg_query_digest *.gz --sort p99
+    aws logs filter-log-events ... --query 'events[].[message]' --output text | python -m tools.pg_query_digest
+"""
+import argparse
+import gzip
+import hashlib
+import math
+import re
+import sys
+
+# RDS log_line_prefix is %t:%r:%u@%d:[%p]:
+LOG_LINE = re.compile(
+    r"^(?P<time>\S+ \S+ [A-Z]+):(?P<host>\S*?):(?P<user>[^:@]*)@(?P<database>[^:]*):"
+    r"\[(?P<pid>\d+)\]:(?P<level>[A-Z0-9]+):\s+(?P<message>.*)$"
+)
+DURATION = re.compile(
+    r"^duration: (?P<duration>[\d.]+) ms\s+"
+    r"(?:statement|execute [^:]*|bind [^:]*|parse [^:]*): (?P<statement>.*)$",
+    re.DOTALL,
+)
+
+NORMALIZERS = [
+    (re.compile(r"/\*.*?\*/", re.DOTALL), " "),
+    (re.compile(r"--[^\n]*"), " "),
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\$\d+"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\s+"), " "),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(?)"),
+    (re.compile(r"(\(\?\))(?:\s*,\s*\(\?\))+"), r"\1"),
+]
+
+
+def fingerprint(statement) -> str:
+    """Statement with comments, literals, parameters and lists collapsed."""
+    for pattern, replacement in NORMALIZERS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip().rstrip(";").strip().lower()
+
+
+def fingerprint_id(shape) -> str:
+    return hashlib.md5(shape.encode()).hexdigest()[:8]
+
+
+def log_messages(lines):
+    """Yield (prefix fields, message) with continuation lines joined back on."""
+    fields, message = None, []
+    for line in lines:
+        line = line.rstrip("\n")
+        match = LOG_LINE.match(line)
+        if match:
+            if fields is not None:
+                yield fields, "\n".join(message)
+            fields = match.groupdict()
+            message = [fields.pop("message")]
+        elif fields is not None:
+            message.append(line.lstrip("\t"))
+    if fields is not None:
+        yield fields, "\n".join(message)
+
+
+def slow_statements(lines):
+    """Yield (duration ms, statement, database) of the logged slow statements."""
+    for fields, message in log_messages(lines):
+        if fields["level"] != "LOG":
+            continue
+        match = DURATION.match(message)
+        # auto_explain lines are "duration: ... plan:" and carry no statement
+        if match:
+            yield float(match["duration"]), match["statement"], fields["database"]
+
+
+def percentile(sorted_values, fraction) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def digest(lines, sort="total") -> list:
+    """Per fingerprint stats, slowest first."""
+    groups = {}
+    for duration, statement, database in slow_statements(lines):
+        shape = fingerprint(statement)
+        group = groups.setdefault(
+            shape, {"fingerprint": shape, "durations": [], "databases": set()}
+        )
+        group["durations"].append(duration)
+        group["databases"].add(database)
+
+    summary = []
+    for shape, group in groups.items():
+        durations = sorted(group["durations"])
+        summary.append(
+            {
+                "id": fingerprint_id(shape),
+                "fingerprint": shape,
+                "databases": sorted(group["databases"]),
+                "count": len(durations),
+                "total_ms": sum(durations),
+                "mean_ms": sum(durations) / len(durations),
+                "p99_ms": percentile(durations, 0.99),
+                "max_ms": durations[-1],
+            }
+        )
+    return sorted(summary, key=lambda entry: entry[f"{sort}_ms"], reverse=True)
+
+
+def read_lines(paths):
+    if not paths:
+        yield from sys.stdin
+        return
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", errors="replace") as log_file:
+            yield from log_file
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("logs", nargs="*", help="log files, .gz allowed; stdin if none")
+    parser.add_argument("--sort", choices=["total", "p99"], default="total")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    summary = digest(read_lines(args.logs), sort=args.sort)
+    grand_total = sum(entry["total_ms"] for entry in summary) or 1
+    for rank, entry in enumerate(summary[: args.top], start=1):
+        print(
+            f"#{rank} {entry['id']} {entry['total_ms'] / grand_total:6.1%} "
+            f"count={entry['count']} total={entry['total_ms']:.0f}ms "
+            f"mean={entry['mean_ms']:.1f}ms p99={entry['p99_ms']:.1f}ms "
+            f"max={entry['max_ms']:.1f}ms db={','.join(entry['databases'])}"
+        )
+        print(f"    {entry['fingerprint']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""Deploy a static site directory to its web bucket with minimal invalidations.
+
+Files are hashed locally and compared with the ETags already in the bucket,
+so only changed objects are uploaded. Uploads run in parallel, large files go
+through multipart upload, text assets are gzip pre-compressed and every object
+gets Content-Type/Content-Encoding/Cache-Control metadata. Only objects that
+were overwritten or deleted are invalidated, coalesced into as few paths as
+possible.
+
+The ETags only cover the bytes: after a metadata change with unchanged
+content, e.g. new `hashed_asset_paths`, run with `--force` to upload again.
+Sites with `is_enabled_versioned_releases` serve `releases/<id>/` and are
+published with tools/site_release.py instead.
+
+Usage:
+    python -m tools.site_deployer --site web-app --source assets
+"""
+import argparse
+import fnmatch
+import gzip
+import hashlib
+import mimetypes
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+SITES = ["web-app", "web-admin", "web-identity"]
+
+# the stored encoding is served whatever the client accepts, and every
+# browser accepts gzip
+ENCODINGS = ["gzip", "none"]
+
+HASHED_ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DOCUMENT_CACHE_CONTROL = "public, max-age=0, s-maxage=60, must-revalidate"
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "application/wasm",
+    "image/svg+xml",
+)
+MIN_COMPRESS_SIZE = 1024
+
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+MAX_INVALIDATION_PATHS = 15
+
+
+def is_hashed_asset(key, hashed_asset_paths) -> bool:
+    """Whether an object key matches one of the content-hashed path patterns."""
+    return any(fnmatch.fnmatch(f"/{key}", pattern) for pattern in hashed_asset_paths)
+
+
+def compress(body, encoding):
+    """Compress a body; gzip uses a fixed mtime so the output is reproducible."""
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=9, mtime=0)
+    raise ValueError(f"Unsupported encoding {encoding}")
+
+
+def s3_etag(body, multipart_threshold, multipart_chunksize) -> str:
+    """ETag S3 assigns to a body uploaded with the given multipart settings."""
+    if len(body) <= multipart_threshold:
+        return hashlib.md5(body).hexdigest()
+    part_digests = [
+        hashlib.md5(body[offset : offset + multipart_chunksize]).digest()
+        for offset in range(0, len(body), multipart_chunksize)
+    ]
+    return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+
+def collect_files(
+    source_dir,
+    hashed_asset_paths,
+    encoding="gzip",
+    prefix="",
+    multipart_threshold=MULTIPART_THRESHOLD,
+    multipart_chunksize=MULTIPART_CHUNKSIZE,
+) -> dict:
+    """Read the site directory into upload entries keyed by object key."""
+    files = {}
+    for root, _, names in os.walk(source_dir):
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            relative_key = os.path.relpath(path, source_dir).replace(os.sep, "/")
+            with open(path, "rb") as f:
+                body = f.read()
+
+            content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            metadata = {
+                "ContentType": content_type,
+                "CacheControl": HASHED_ASSET_CACHE_CONTROL
+                if is_hashed_asset(relative_key, hashed_asset_paths)
+                else DOCUMENT_CACHE_CONTROL,
+            }
+            if (
+                encoding != "none"
+                and content_type.startswith(COMPRESSIBLE_TYPES)
+                and len(body) >= MIN_COMPRESS_SIZE
+            ):
+                compressed = compress(body, encoding)
+                if len(compressed) < len(body):
+                    body = compressed
+                    metadata["ContentEncoding"] = encoding
+
+            key = f"{prefix}{relative_key}"
+            files[key] = {
+                "key": key,
+                "body": body,
+                "etag": s3_etag(body, multipart_threshold, multipart_chunksize),
+                "metadata": metadata,
+            }
+    return files
+
+
+def remote_etags(s3, bucket, prefix="") -> dict:
+    """Map every object key under a prefix to its ETag."""
+    etags = {}
+    kwargs = {"Bucket": bucket, "Prefix": prefix}
+    while True:
+        response = s3.list_objects_v2(**kwargs)
+        for item in response.get("Contents", []):
+            etags[item["Key"]] = item["ETag"].strip('"')
+        if not response.get("IsTruncated"):
+            return etags
+        kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+
+def plan_sync(local_files, remote, delete=False, force=False) -> dict:
+    """Split the local files into new/changed uploads and stale deletions.
+
+    With `force` every local file is uploaded, to rewrite its metadata.
+    """
+    uploads = [
+        entry
+        for key, entry in sorted(local_files.items())
+        if force or remote.get(key) != entry["etag"]
+    ]
+    deletions = sorted(set(remote) - set(local_files)) if delete else []
+    return {
+        "uploads": uploads,
+        "deletions": deletions,
+        # new keys were never cached, only replaced or removed ones need invalidating
+        "overwritten": sorted(
+            entry["key"] for entry in uploads if entry["key"] in remote
+        )
+        + deletions,
+    }
+
+
+def upload_file(
+    s3,
+    bucket,
+    entry,
+    multipart_threshold=MULTIPART_THRESHOLD,
+    multipart_chunksize=MULTIPART_CHUNKSIZE,
+):
+    """Upload one entry, switching to multipart upload above the threshold."""
+    body = entry["body"]
+    if len(body) <= multipart_threshold:
+        s3.put_object(Bucket=bucket, Key=entry["key"], Body=body, **entry["metadata"])
+        return
+
+    upload_id = s3.create_multipart_upload(
+        Bucket=bucket, Key=entry["key"], **entry["metadata"]
+    )["UploadId"]
+    try:
+        parts = []
+        for number, offset in enumerate(
+            range(0, len(body), multipart_chunksize), start=1
+        ):
+            response = s3.upload_part(
+                Bucket=bucket,
+                Key=entry["key"],
+                UploadId=upload_id,
+                PartNumber=number,
+                Body=body[offset : offset + multipart_chunksize],
+            )
+            parts.append({"ETag": response["ETag"], "PartNumber": number})
+        s3.complete_multipart_upload(
+            Bucket=bucket,
+            Key=entry["key"],
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+    except Exception:
+        s3.abort_multipart_upload(Bucket=bucket, Key=entry["key"], UploadId=upload_id)
+        raise
+
+
+def delete_objects(s3, bucket, keys):
+    """Delete keys in batches of 1000, the DeleteObjects limit."""
+    for offset in range(0, len(keys), 1000):
+        s3.delete_objects(
+            Bucket=bucket,
+            Delete={
+                "Objects": [{"Key": key} for key in keys[offset : offset + 1000]],
+                "Quiet": True,
+            },
+        )
+
+
+def _parent(path) -> str:
+    """Parent directory of a path or wildcard path, without trailing slash."""
+    if path.endswith("/*"):
+        path = path[:-2]
+    return path.rsplit("/", 1)[0]
+
+
+def coalesce_invalidation_paths(keys, max_paths=MAX_INVALIDATION_PATHS) -> list:
+    """Reduce object keys to at most max_paths CloudFront invalidation paths.
+
+    The deepest, most crowded directory is folded into a wildcard until the
+    list fits, so a release touching many files in one folder costs a single
+    path instead of one per file.
+    """
+    paths = {f"/{key}" for key in keys}
+    if "/index.html" in paths:
+        # the default root object is also cached under "/"
+        paths.add("/")
+
+    while len(paths) > max_paths:
+        groups = defaultdict(set)
+        for path in paths:
+            groups[_parent(path)].add(path)
+        parent = max(
+            groups,
+            key=lambda p: (len(groups[p]) > 1, p.count("/"), len(groups[p]), p),
+        )
+        if parent == "":
+            return ["/*"]
+        wildcard = f"{parent}/*"
+        paths = {p for p in paths if not p.startswith(f"{parent}/")}
+        paths.add(wildcard)
+    return sorted(paths)
+
+
+def create_invalidation(cloudfront, distribution_id, paths):
+    """Create one invalidation for the given paths; returns its id or None."""
+    if not paths:
+        return None
+    response = cloudfront.create_invalidation(
+        DistributionId=distribution_id,
+        InvalidationBatch={
+            "Paths": {"Quantity": len(paths), "Items": paths},
+            "CallerReference": f"site-deployer-{time.time_ns()}",
+        },
+    )
+    return response["Invalidation"]["Id"]
+
+
+def deploy(
+    s3,
+    cloudfront,
+    bucket,
+    distribution_id,
+    source_dir,
+    hashed_asset_paths,
+    encoding="gzip",
+    prefix="",
+    delete=False,
+    force=False,
+    max_workers=16,
+    dry_run=False,
+    multipart_threshold=MULTIPART_THRESHOLD,
+    multipart_chunksize=MULTIPART_CHUNKSIZE,
+) -> dict:
+    """Sync a site directory to the bucket and invalidate what changed."""
+    local_files = collect_files(
+        source_dir,
+        hashed_asset_paths,
+        encoding=encoding,
+        prefix=prefix,
+        multipart_threshold=multipart_threshold,
+        multipart_chunksize=multipart_chunksize,
+    )
+    plan = plan_sync(
+        local_files, remote_etags(s3, bucket, prefix), delete=delete, force=force
+    )
+    invalidation_paths = coalesce_invalidation_paths(
+        [key[len(prefix) :] for key in plan["overwritten"]]
+    )
+    summary = {
+        "uploaded": [entry["key"] for entry in plan["uploads"]],
+        "skipped": len(local_files) - len(plan["uploads"]),
+        "deleted": plan["deletions"],
+        "invalidation_paths": invalidation_paths,
+        "invalidation_id": None,
+    }
+    if dry_run:
+        return summary
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # list() re-raises the first failed upload
+        list(
+            executor.map(
+                lambda entry: upload_file(
+                    s3, bucket, entry, multipart_threshold, multipart_chunksize
+                ),
+                plan["uploads"],
+            )
+        )
+    delete_objects(s3, bucket, plan["deletions"])
+    if distribution_id:
+        summary["invalidation_id"] = create_invalidation(
+            cloudfront, distribution_id, invalidation_paths
+        )
+    return summary
+
+
+def check_unversioned(conf, site):
+    """Raise ValueError for a site serving versioned releases.
+
+    Its origin path points at `releases/<id>/`, so files synced to the
+    bucket root would never be served.
+    """
+    deployment = conf.get("site_deployments")[site.replace("-", "_")]
+    if deployment.get("is_enabled_versioned_releases", False):
+        raise ValueError(
+            f"{site} serves versioned releases, publish with "
+            "`python -m tools.site_release publish`"
+        )
+
+
+def stack_exports(cloudformation) -> dict:
+    """All CloudFormation exports of the account/region by name."""
+    exports = {}
+    kwargs = {}
+    while True:
+        response = cloudformation.list_exports(**kwargs)
+        for export in response["Exports"]:
+            exports[export["Name"]] = export["Value"]
+        if "NextToken" not in response:
+            return exports
+        kwargs["NextToken"] = response["NextToken"]
+
+
+def main(argv=None):
+    import boto3
+    from helper import config
+    from helper import cloudfront as cloudfront_helper
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--site", choices=SITES, required=True)
+    parser.add_argument("--source", default="assets", help="built site directory")
+    parser.add_argument("--environment", default="dev")
+    parser.add_argument("--encoding", choices=ENCODINGS, default="gzip")
+    parser.add_argument("--delete", action="store_true", help="remove stale objects")
+    parser.add_argument(
+        "--force", action="store_true", help="upload unchanged files, e.g. new metadata"
+    )
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument(
+        "--endpoint-url", help="endpoint of every AWS client, e.g. a local stand-in"
+    )
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    conf = config.Config(args.environment)
+    try:
+        check_unversioned(conf, args.site)
+    except ValueError as error:
+        parser.error(str(error))
+    project_name = conf.get("project_name")
+    hashed_asset_paths = cloudfront_helper.site_cache_settings(conf)[
+        "hashed_asset_paths"
+    ]
+    session = boto3.session.Session(region_name=conf.get("region"))
+
+    def client(service):
+        return session.client(service, endpoint_url=args.endpoint_url)
+
+    exports = stack_exports(client("cloudformation"))
+    # the web stacks export the bucket ARN and distribution id per site
+    bucket = exports[f"{project_name}-bucket-{args.site}-arn"].split(":::")[-1]
+    distribution_id = exports[f"{project_name}-cfn-{args.site}-id"]
+
+    summary = deploy(
+        client("s3"),
+        client("cloudfront"),
+        bucket,
+        distribution_id,
+        args.source,
+        hashed_asset_paths,
+        encoding=args.encoding,
+        delete=args.delete,
+        force=args.force,
+        max_workers=args.workers,
+        dry_run=args.dry_run,
+    )
+    print(
+        f"{bucket}: uploaded {len(summary['uploaded'])}, "
+        f"skipped {summary['skipped']}, deleted {len(summary['deleted'])}"
+    )
+    print(f"invalidation paths: {summary['invalidation_paths'] or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
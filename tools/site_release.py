@@ -0,0 +1,255 @@
+"""Publish immutable site releases and switch the distribution between them.
+
+Each release is uploaded once to `releases/<release-id>/` and never changed.
+Going live (or rolling back) only repoints the S3 origin path of the
+distribution, so nothing is re-uploaded and nothing needs invalidating:
+HTML is picked up when its short edge TTL expires and hashed assets live
+under new keys. The active path is also stored in SSM, where the web stack
+reads it, so a later `cdk deploy` keeps the live release.
+
+Usage:
+    python -m tools.site_release publish --site web-app --source build --release 42
+    python -m tools.site_release activate --site web-app --release 42
+    python -m tools.site_release list --site web-app
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tools import site_deployer
+
+RELEASES_PREFIX = "releases/"
+MANIFEST_NAME = ".release.json"
+
+
+def release_prefix(release_id) -> str:
+    return f"{RELEASES_PREFIX}{release_id}/"
+
+
+def release_origin_path(release_id) -> str:
+    return f"/{RELEASES_PREFIX}{release_id}"
+
+
+def release_id_from_origin_path(origin_path):
+    """Release id of an origin path, or None when not serving a release."""
+    if not origin_path.startswith(f"/{RELEASES_PREFIX}"):
+        return None
+    return origin_path[len(RELEASES_PREFIX) + 1 :]
+
+
+def list_releases(s3, bucket) -> list:
+    """Published release ids, oldest first."""
+    releases = []
+    for release_id in _release_ids(s3, bucket):
+        manifest = read_manifest(s3, bucket, release_id)
+        if manifest is not None:
+            releases.append((manifest["published_at"], release_id))
+    return [release_id for _, release_id in sorted(releases)]
+
+
+def _release_ids(s3, bucket) -> list:
+    release_ids = []
+    kwargs = {"Bucket": bucket, "Prefix": RELEASES_PREFIX, "Delimiter": "/"}
+    while True:
+        response = s3.list_objects_v2(**kwargs)
+        for common_prefix in response.get("CommonPrefixes", []):
+            release_ids.append(common_prefix["Prefix"][len(RELEASES_PREFIX) : -1])
+        if not response.get("IsTruncated"):
+            return release_ids
+        kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+
+def read_manifest(s3, bucket, release_id):
+    """The manifest of a release; None if the release is incomplete."""
+    try:
+        response = s3.get_object(
+            Bucket=bucket, Key=f"{release_prefix(release_id)}{MANIFEST_NAME}"
+        )
+    except s3.exceptions.NoSuchKey:
+        return None
+    return json.loads(response["Body"].read())
+
+
+def publish_release(
+    s3,
+    bucket,
+    source_dir,
+    release_id,
+    hashed_asset_paths,
+    previous_release_id=None,
+    encoding="gzip",
+    max_workers=16,
+) -> dict:
+    """Upload a build to its own release prefix.
+
+    Files identical to the previous release are server-side copied instead
+    of uploaded. Hashed assets of the previous build are carried over too,
+    so pages still cached at the edge keep resolving their assets after the
+    switch. The manifest is written last and marks the release complete.
+    """
+    prefix = release_prefix(release_id)
+    if site_deployer.remote_etags(s3, bucket, prefix):
+        raise ValueError(f"Release {release_id} already exists, releases are immutable")
+
+    local_files = site_deployer.collect_files(
+        source_dir, hashed_asset_paths, encoding=encoding, prefix=prefix
+    )
+    copies = {}
+    if previous_release_id is not None:
+        previous_prefix = release_prefix(previous_release_id)
+        previous = site_deployer.remote_etags(s3, bucket, previous_prefix)
+        previous_manifest = read_manifest(s3, bucket, previous_release_id) or {}
+        for key, entry in local_files.items():
+            previous_key = f"{previous_prefix}{key[len(prefix):]}"
+            if previous.get(previous_key) == entry["etag"]:
+                copies[key] = previous_key
+        for relative_key in previous_manifest.get("files", []):
+            key = f"{prefix}{relative_key}"
+            if key not in local_files and site_deployer.is_hashed_asset(
+                relative_key, hashed_asset_paths
+            ):
+                copies[key] = f"{previous_prefix}{relative_key}"
+
+    uploads = [entry for key, entry in sorted(local_files.items()) if key not in copies]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(
+            executor.map(
+                lambda entry: site_deployer.upload_file(s3, bucket, entry), uploads
+            )
+        )
+        list(
+            executor.map(
+                lambda item: s3.copy_object(
+                    Bucket=bucket,
+                    Key=item[0],
+                    CopySource={"Bucket": bucket, "Key": item[1]},
+                ),
+                sorted(copies.items()),
+            )
+        )
+
+    manifest = {
+        "release_id": release_id,
+        "published_at": time.time(),
+        "files": sorted(key[len(prefix) :] for key in local_files),
+    }
+    s3.put_object(
+        Bucket=bucket,
+        Key=f"{prefix}{MANIFEST_NAME}",
+        Body=json.dumps(manifest).encode(),
+        ContentType="application/json",
+        CacheControl="no-store",
+    )
+    return {
+        "release_id": release_id,
+        "uploaded": [entry["key"] for entry in uploads],
+        "copied": sorted(copies),
+    }
+
+
+def active_release(cloudfront, distribution_id):
+    """Release id the distribution currently serves, or None."""
+    config = cloudfront.get_distribution_config(Id=distribution_id)[
+        "DistributionConfig"
+    ]
+    return release_id_from_origin_path(_s3_origin(config)["OriginPath"])
+
+
+def _s3_origin(distribution_config) -> dict:
+    # the web distributions have a single S3 origin
+    return next(
+        origin
+        for origin in distribution_config["Origins"]["Items"]
+        if "S3OriginConfig" in origin
+    )
+
+
+def activate_release(
+    s3, cloudfront, ssm, bucket, distribution_id, release_id, parameter_name
+):
+    """Point the distribution at a published release in one config update."""
+    if read_manifest(s3, bucket, release_id) is None:
+        raise ValueError(f"Release {release_id} is not published in {bucket}")
+
+    response = cloudfront.get_distribution_config(Id=distribution_id)
+    config = response["DistributionConfig"]
+    _s3_origin(config)["OriginPath"] = release_origin_path(release_id)
+    cloudfront.update_distribution(
+        Id=distribution_id, IfMatch=response["ETag"], DistributionConfig=config
+    )
+    ssm.put_parameter(
+        Name=parameter_name,
+        Value=release_origin_path(release_id),
+        Type="String",
+        Overwrite=True,
+    )
+
+
+def main(argv=None):
+    import boto3
+    from helper import config
+    from helper import cloudfront as cloudfront_helper
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["publish", "activate", "list"])
+    parser.add_argument("--site", choices=site_deployer.SITES, required=True)
+    parser.add_argument("--release", help="build id, e.g. the CI build number")
+    parser.add_argument("--source", default="assets", help="built site directory")
+    parser.add_argument("--environment", default="dev")
+    parser.add_argument("--encoding", choices=site_deployer.ENCODINGS, default="gzip")
+    parser.add_argument(
+        "--endpoint-url", help="endpoint of every AWS client, e.g. a local stand-in"
+    )
+    args = parser.parse_args(argv)
+
+    conf = config.Config(args.environment)
+    project_name = conf.get("project_name")
+    session = boto3.session.Session(region_name=conf.get("region"))
+
+    def client(service):
+        return session.client(service, endpoint_url=args.endpoint_url)
+
+    exports = site_deployer.stack_exports(client("cloudformation"))
+    bucket = exports[f"{project_name}-bucket-{args.site}-arn"].split(":::")[-1]
+    distribution_id = exports[f"{project_name}-cfn-{args.site}-id"]
+    s3 = client("s3")
+    cloudfront = client("cloudfront")
+
+    if args.command == "list":
+        live = active_release(cloudfront, distribution_id)
+        for release_id in list_releases(s3, bucket):
+            print(f"{'*' if release_id == live else ' '} {release_id}")
+        return
+    if not args.release:
+        parser.error(f"{args.command} requires --release")
+
+    if args.command == "publish":
+        summary = publish_release(
+            s3,
+            bucket,
+            args.source,
+            args.release,
+            cloudfront_helper.site_cache_settings(conf)["hashed_asset_paths"],
+            previous_release_id=active_release(cloudfront, distribution_id),
+            encoding=args.encoding,
+        )
+        print(
+            f"{bucket}: release {args.release} uploaded {len(summary['uploaded'])}, "
+            f"copied {len(summary['copied'])}"
+        )
+    else:
+        activate_release(
+            s3,
+            cloudfront,
+            client("ssm"),
+            bucket,
+            distribution_id,
+            args.release,
+            f"/{args.site}/{conf.get('stage')}/ACTIVE_RELEASE_PATH",
+        )
+        print(f"{distribution_id} now serves release {args.release}")
+
+
+if __name__ == "__main__":
+    main()
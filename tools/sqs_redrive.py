@@ -0,0 +1,341 @@
+"""Inspect a service's dead-letter queue and redrive its messages.
+
+The DLQ and its source queue are read from the service's SSM parameters,
+`/<service>/<stage>/AWS_SQS_DLQ_URL` and `AWS_SQS_QUEUE_URL` for the
+`event` queue, `AWS_SQS_<KEY>_DLQ_URL` for other keys. Messages are
+grouped by a signature of their failure: the topic they came from, the
+`error_type`/`event_type` attributes and the shape of the JSON body, so a
+bad producer release shows up as one group.
+
+`inspect` samples the DLQ. `redrive` moves messages back to the source
+queue, optionally only one signature, with concurrent workers that send
+and delete in batches of 10 under a shared rate limit. Received messages
+stay invisible for `--visibility-timeout` seconds, so skipped and
+dry-run messages come back after it, and a worker stops when it receives
+nothing.
+
+Usage:
+    python -m tools.sqs_redrive inspect --service email-service
+    python -m tools.sqs_redrive redrive --service email-service --signature 3f2a9c01b7de --dry-run
+    python -m tools.sqs_redrive redrive --service api-service --key event-low --rate 200
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from helper import messaging_topology
+
+# SQS batch limit for receive, send and delete
+BATCH_SIZE = 10
+# message attributes that tell failures apart, when producers set them
+SIGNATURE_ATTRIBUTES = ["error_type", "event_type"]
+# id the message was first sent with; SQS gives the resent copy a new one
+ORIGINAL_MESSAGE_ID_ATTRIBUTE = "original_message_id"
+# message attributes SQS allows per message
+MAX_MESSAGE_ATTRIBUTES = 10
+
+
+def queue_urls(ssm, service_name, stage, key=messaging_topology.DEFAULT_KEY):
+    """(dlq url, source queue url) from the service's SSM parameters."""
+    urls = []
+    for kind in ["dlq", "queue"]:
+        suffix = messaging_topology.parameter_suffix(kind, key)
+        name = f"/{service_name}/{stage}/{suffix}"
+        urls.append(ssm.get_parameter(Name=name)["Parameter"]["Value"])
+    return tuple(urls)
+
+
+def _shape(value):
+    if isinstance(value, dict):
+        return {key: _shape(value[key]) for key in sorted(value)}
+    if isinstance(value, list):
+        return [_shape(value[0])] if value else []
+    return type(value).__name__
+
+
+def _json(text):
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def signature(message):
+    """(id, description) grouping messages that likely failed the same way."""
+    attributes = {
+        name: attribute.get("StringValue")
+        for name, attribute in (message.get("MessageAttributes") or {}).items()
+    }
+    payload = _json(message["Body"])
+    source = "direct"
+    # enveloped SNS notification: the topic, its attributes and the message
+    if isinstance(payload, dict) and payload.get("Type") == "Notification":
+        source = payload.get("TopicArn", "").split(":")[-1]
+        for name, attribute in (payload.get("MessageAttributes") or {}).items():
+            attributes.setdefault(name, attribute.get("Value"))
+        payload = _json(payload.get("Message"))
+    parts = [source]
+    parts += [
+        f"{name}={attributes[name]}"
+        for name in SIGNATURE_ATTRIBUTES
+        if name in attributes
+    ]
+    parts.append(
+        "not-json" if payload is None else json.dumps(_shape(payload), sort_keys=True)
+    )
+    description = " ".join(parts)
+    return hashlib.sha1(description.encode()).hexdigest()[:12], description
+
+
+def _receive(sqs, queue_url, count, visibility_timeout):
+    return sqs.receive_message(
+        QueueUrl=queue_url,
+        MaxNumberOfMessages=min(count, BATCH_SIZE),
+        VisibilityTimeout=visibility_timeout,
+        # long poll briefly, a short poll may miss messages on other hosts
+        WaitTimeSeconds=1,
+        AttributeNames=["All"],
+        MessageAttributeNames=["All"],
+    ).get("Messages", [])
+
+
+def inspect(sqs, dlq_url, sample=100, visibility_timeout=30) -> dict:
+    """Groups of up to `sample` DLQ messages by signature."""
+    groups = {}
+    seen = set()
+    while len(seen) < sample:
+        messages = _receive(sqs, dlq_url, sample - len(seen), visibility_timeout)
+        if not messages:
+            break
+        for message in messages:
+            if message["MessageId"] in seen:
+                continue
+            seen.add(message["MessageId"])
+            signature_id, description = signature(message)
+            attributes = message.get("Attributes") or {}
+            group = groups.setdefault(
+                signature_id,
+                {
+                    "description": description,
+                    "count": 0,
+                    "max_receive_count": 0,
+                    "first_sent": None,
+                    "example": message["MessageId"],
+                },
+            )
+            group["count"] += 1
+            group["max_receive_count"] = max(
+                group["max_receive_count"],
+                int(attributes.get("ApproximateReceiveCount", 0)),
+            )
+            sent = int(attributes.get("SentTimestamp", 0)) or None
+            if sent and (group["first_sent"] is None or sent < group["first_sent"]):
+                group["first_sent"] = sent
+    return groups
+
+
+class RateLimiter:
+    """Lets `rate` messages a second through, shared by all workers."""
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.next_slot = None
+
+    def acquire(self, count):
+        with self.lock:
+            now = self.clock()
+            start = max(now, self.next_slot or now)
+            self.next_slot = start + count / self.rate
+        if start > now:
+            self.sleep(start - now)
+
+
+def _send_entry(index, message, is_fifo) -> dict:
+    entry = {"Id": str(index), "MessageBody": message["Body"]}
+    attributes = dict(message.get("MessageAttributes") or {})
+    # consumers deduplicating by message id still recognize the message
+    if len(attributes) < MAX_MESSAGE_ATTRIBUTES:
+        attributes.setdefault(
+            ORIGINAL_MESSAGE_ID_ATTRIBUTE,
+            {"DataType": "String", "StringValue": message["MessageId"]},
+        )
+    if attributes:
+        entry["MessageAttributes"] = attributes
+    if is_fifo:
+        attributes = message.get("Attributes") or {}
+        entry["MessageGroupId"] = attributes["MessageGroupId"]
+        entry["MessageDeduplicationId"] = attributes.get(
+            "MessageDeduplicationId", message["MessageId"]
+        )
+    return entry
+
+
+def redrive_batch(sqs, dlq_url, queue_url, messages) -> tuple:
+    """Send up to 10 messages to the source queue, delete the sent ones.
+
+    Returns (moved, failed); a message that failed to send stays in the DLQ.
+    """
+    is_fifo = queue_url.endswith(".fifo")
+    response = sqs.send_message_batch(
+        QueueUrl=queue_url,
+        Entries=[
+            _send_entry(index, message, is_fifo)
+            for index, message in enumerate(messages)
+        ],
+    )
+    sent = [int(entry["Id"]) for entry in response.get("Successful", [])]
+    if sent:
+        sqs.delete_message_batch(
+            QueueUrl=dlq_url,
+            Entries=[
+                {"Id": str(index), "ReceiptHandle": messages[index]["ReceiptHandle"]}
+                for index in sent
+            ],
+        )
+    return len(sent), len(messages) - len(sent)
+
+
+def redrive(
+    sqs,
+    dlq_url,
+    queue_url,
+    signature_id=None,
+    workers=4,
+    limiter=None,
+    dry_run=False,
+    max_messages=None,
+    visibility_timeout=60,
+) -> dict:
+    """Move DLQ messages, or those of one signature, back to the source queue."""
+    summary = {"moved": 0, "failed": 0, "skipped": 0, "signatures": Counter()}
+    lock = threading.Lock()
+    remaining = [max_messages]
+
+    def reserve():
+        with lock:
+            if remaining[0] is None:
+                return BATCH_SIZE
+            count = min(remaining[0], BATCH_SIZE)
+            remaining[0] -= count
+            return count
+
+    def work():
+        while True:
+            count = reserve()
+            if not count:
+                return
+            messages = _receive(sqs, dlq_url, count, visibility_timeout)
+            if not messages:
+                return
+            selected = []
+            for message in messages:
+                message_signature = signature(message)[0]
+                if signature_id and message_signature != signature_id:
+                    # stays invisible until the timeout, so the workers move on
+                    with lock:
+                        summary["skipped"] += 1
+                    continue
+                selected.append(message)
+                with lock:
+                    summary["signatures"][message_signature] += 1
+            if not selected:
+                continue
+            if dry_run:
+                moved, failed = len(selected), 0
+            else:
+                if limiter:
+                    limiter.acquire(len(selected))
+                moved, failed = redrive_batch(sqs, dlq_url, queue_url, selected)
+            with lock:
+                summary["moved"] += moved
+                summary["failed"] += failed
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(work) for _ in range(workers)]:
+            future.result()
+    return summary
+
+
+def main(argv=None):
+    import boto3
+    from helper import config
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["inspect", "redrive"])
+    parser.add_argument("--service", required=True, help="e.g. email-service")
+    parser.add_argument(
+        "--key", default=messaging_topology.DEFAULT_KEY, help="queue key, e.g. event"
+    )
+    parser.add_argument("--environment", default="dev")
+    parser.add_argument("--sample", type=int, default=100, help="messages inspected")
+    parser.add_argument("--signature", help="only redrive this signature")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, help="messages per second, no limit")
+    parser.add_argument("--max-messages", type=int, help="messages received at most")
+    parser.add_argument("--visibility-timeout", type=int, default=60)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument(
+        "--endpoint-url", help="endpoint of every AWS client, e.g. a local stand-in"
+    )
+    args = parser.parse_args(argv)
+
+    conf = config.Config(args.environment)
+    session = boto3.session.Session(region_name=conf.get("region"))
+
+    def client(service):
+        return session.client(service, endpoint_url=args.endpoint_url)
+
+    sqs = client("sqs")
+    dlq_url, queue_url = queue_urls(
+        client("ssm"), args.service, conf.get("stage"), args.key
+    )
+
+    if args.command == "inspect":
+        depth = sqs.get_queue_attributes(
+            QueueUrl=dlq_url, AttributeNames=["ApproximateNumberOfMessages"]
+        )["Attributes"]["ApproximateNumberOfMessages"]
+        groups = inspect(sqs, dlq_url, args.sample, args.visibility_timeout)
+        sampled = sum(group["count"] for group in groups.values())
+        print(f"{dlq_url}: about {depth} messages, {sampled} sampled")
+        for signature_id, group in sorted(
+            groups.items(), key=lambda item: -item[1]["count"]
+        ):
+            first_sent = time.strftime(
+                "%Y-%m-%d %H:%M", time.gmtime((group["first_sent"] or 0) / 1000)
+            )
+            print(
+                f"{signature_id} {group['count']:>6} "
+                f"receives<={group['max_receive_count']} since {first_sent} "
+                f"e.g. {group['example']}\n    {group['description']}"
+            )
+        return
+
+    summary = redrive(
+        sqs,
+        dlq_url,
+        queue_url,
+        signature_id=args.signature,
+        workers=args.workers,
+        limiter=RateLimiter(args.rate) if args.rate else None,
+        dry_run=args.dry_run,
+        max_messages=args.max_messages,
+        visibility_timeout=args.visibility_timeout,
+    )
+    verb = "would move" if args.dry_run else "moved"
+    print(
+        f"{dlq_url} -> {queue_url}: {verb} {summary['moved']}, "
+        f"failed {summary['failed']}, skipped {summary['skipped']}"
+    )
+    for signature_id, count in summary["signatures"].most_common():
+        print(f"  {signature_id} {count}")
+
+
+if __name__ == "__main__":
+    main()